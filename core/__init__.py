@@ -19,8 +19,19 @@ def create_default_tags():
 def ready():
     """
     Function called by Django when the application is ready.
-    We use this to initialize our default tags and register models with Watson search.
+    We use this to initialize our default tags and register models with the search index.
     """
+    # Register the checks that the caches below are shared by all processes
+    from . import checks
+    
+    # Serve the lookups configured in settings.QUERY_CACHE from the cache
+    from .query_cache import install
+    install()
+    
+    # Keep the in-process autocomplete indexes up to date
+    from .autocomplete import connect_signals
+    connect_signals()
+    
     try:
         # Register search adapters
         from .search_adapters import register_search_adapters
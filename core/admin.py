@@ -6,24 +6,56 @@ class ProfileAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'bio')
 
 class CommunityAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description', 'created_at')
+    list_display = ('name', 'description', 'created_at', 'member_count', 'post_count')
     search_fields = ('name', 'description')
     list_filter = ('created_at',)
+    # Maintained by core.communities; saving a community never writes them
+    readonly_fields = ('member_count', 'post_count')
 
 class PostAdmin(admin.ModelAdmin):
     list_display = ('title', 'community', 'author', 'created_at', 'post_type')
     list_filter = ('community', 'created_at', 'post_type')
     search_fields = ('title', 'content', 'author__username', 'community__name')
+    # Maintained by the vote engine; saving a post never writes them
+    readonly_fields = ('upvote_count', 'downvote_count')
+
+    def delete_queryset(self, request, queryset):
+        # Delete one by one so Post.delete() takes back the authors' karma
+        for post in queryset:
+            post.delete()
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('author', 'post', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('content', 'author__username')
 
+    def get_readonly_fields(self, request, obj=None):
+        # Moving a comment to another post would leave both comment counts stale
+        if obj is not None:
+            return ('post',)
+        return ()
+
+    def delete_queryset(self, request, queryset):
+        # Delete one by one so Comment.delete() keeps the post's comment count in sync.
+        # Deepest first, so no comment is removed by an ancestor's cascade before its turn.
+        for comment in queryset.order_by('-level'):
+            comment.delete()
+
 class VoteAdmin(admin.ModelAdmin):
     list_display = ('user', 'post', 'comment', 'value')
     list_filter = ('value',)
 
+    def get_readonly_fields(self, request, obj=None):
+        # Moving an existing vote to another target would bypass the counter engine
+        if obj is not None:
+            return ('user', 'post', 'comment')
+        return ()
+
+    def delete_queryset(self, request, queryset):
+        # Delete one by one so Vote.delete() keeps the denormalized counts in sync
+        for vote in queryset:
+            vote.delete()
+
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'donation_type', 'status', 'created_at', 'total')
     list_filter = ('status', 'donation_type', 'created_at')
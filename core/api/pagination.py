@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination that follows the ordering of the view's queryset, so a
+    ranked list (e.g. ?sort=hot) pages on its own sort key. Each page is a
+    constant-cost index scan; there is no OFFSET or COUNT(*).
+    """
+    page_size = 10
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if queryset.query.order_by:
+            return tuple(queryset.query.order_by)
+        return super().get_ordering(request, queryset, view)
@@ -28,18 +28,12 @@ class ProfileSerializer(serializers.ModelSerializer):
 
 class CommunitySerializer(serializers.ModelSerializer):
     """Serializer for the Community model"""
-    member_count = serializers.SerializerMethodField()
-    post_count = serializers.SerializerMethodField()
+    member_count = serializers.IntegerField(read_only=True)
+    post_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Community
         fields = ['id', 'name', 'description', 'created_at', 'member_count', 'post_count']
-    
-    def get_member_count(self, obj):
-        return obj.members.count()
-    
-    def get_post_count(self, obj):
-        return obj.posts.count()
 
 
 class PostListSerializer(TaggitSerializer, serializers.ModelSerializer):
@@ -48,7 +42,7 @@ class PostListSerializer(TaggitSerializer, serializers.ModelSerializer):
     community = CommunitySerializer(read_only=True)
     tags = TagListSerializerField()
     vote_score = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
+    comment_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Post
@@ -56,10 +50,7 @@ class PostListSerializer(TaggitSerializer, serializers.ModelSerializer):
                   'community', 'tags', 'vote_score', 'comment_count']
     
     def get_vote_score(self, obj):
-        return obj.vote_count()
-    
-    def get_comment_count(self, obj):
-        return obj.comment_count()
+        return obj.vote_count
 
 
 class PostDetailSerializer(TaggitSerializer, serializers.ModelSerializer):
@@ -68,7 +59,7 @@ class PostDetailSerializer(TaggitSerializer, serializers.ModelSerializer):
     community = CommunitySerializer(read_only=True)
     tags = TagListSerializerField()
     vote_score = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
+    comment_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Post
@@ -76,10 +67,7 @@ class PostDetailSerializer(TaggitSerializer, serializers.ModelSerializer):
                   'author', 'community', 'tags', 'vote_score', 'comment_count']
     
     def get_vote_score(self, obj):
-        return obj.vote_count()
-    
-    def get_comment_count(self, obj):
-        return obj.comment_count()
+        return obj.vote_count
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -95,7 +83,7 @@ class CommentSerializer(serializers.ModelSerializer):
                   'parent_id', 'vote_score']
     
     def get_vote_score(self, obj):
-        return obj.vote_count()
+        return obj.vote_count
 
 
 class VoteSerializer(serializers.ModelSerializer):
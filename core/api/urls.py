@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .viewsets import (
     UserViewSet, ProfileViewSet, CommunityViewSet, PostViewSet,
-    CommentViewSet, NotificationViewSet, PaymentViewSet
+    CommentViewSet, NotificationViewSet, PaymentViewSet, AutocompleteViewSet
 )
 
 # Create a router and register our viewsets with it
@@ -14,6 +14,7 @@ router.register(r'posts', PostViewSet)
 router.register(r'comments', CommentViewSet)
 router.register(r'notifications', NotificationViewSet, basename='notification')
 router.register(r'payments', PaymentViewSet, basename='payment')
+router.register(r'autocomplete', AutocompleteViewSet, basename='autocomplete')
 
 urlpatterns = [
     # API endpoints (DRF router includes browsable API)
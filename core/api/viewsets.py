@@ -2,14 +2,72 @@ from rest_framework import viewsets, permissions, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
-from core.models import Profile, Community, Post, Comment, Vote, Notification, Payment
+from core.models import Profile, Community, Post, Comment, Notification, Payment
+from core.voting import cast_vote
+from core.ranking import get_sort, ranked_posts
+from core.notifications import mark_all_read
+from core.conditional import make_validators
+from core.autocomplete import DEFAULT_LIMIT, complete
 from .serializers import (
     UserSerializer, ProfileSerializer, CommunitySerializer,
     PostListSerializer, PostDetailSerializer, CommentSerializer,
-    VoteSerializer, NotificationSerializer, PaymentSerializer
+    NotificationSerializer, PaymentSerializer
 )
 from .permissions import IsOwnerOrReadOnly, IsRecipientOrReadOnly, IsAuthorOrReadOnly
+from .pagination import KeysetCursorPagination
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional list and retrieve requests with 304 Not Modified
+    once the rows are fetched, before anything is serialized
+    """
+    
+    def get_validator_timestamps(self, obj):
+        """Timestamps that move whenever obj's serialized form changes"""
+        return [obj.updated_at]
+    
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional_response(
+            request, [instance],
+            lambda: Response(self.get_serializer(instance).data),
+        )
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        objects = list(page if page is not None else queryset)
+        
+        def respond():
+            serializer = self.get_serializer(objects, many=True)
+            if page is not None:
+                return self.get_paginated_response(serializer.data)
+            return Response(serializer.data)
+        
+        return self.conditional_response(request, objects, respond)
+    
+    def conditional_response(self, request, objects, respond):
+        timestamps = [self.get_validator_timestamps(obj) for obj in objects]
+        etag, last_modified = make_validators(
+            (request.get_full_path(), [obj.pk for obj in objects], timestamps),
+            [timestamp for row in timestamps for timestamp in row],
+        )
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+        if response is None:
+            response = respond()
+        response.headers.setdefault('ETag', etag)
+        if last_modified:
+            response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+        return response
 
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
@@ -91,10 +149,11 @@ class CommunityViewSet(viewsets.ModelViewSet):
         return Response({'status': 'left community'})
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for viewing and editing posts"""
     queryset = Post.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
+    pagination_class = KeysetCursorPagination
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['title', 'content', 'author__username', 'community__name']
     filterset_fields = ['post_type', 'community', 'author']
@@ -105,6 +164,15 @@ class PostViewSet(viewsets.ModelViewSet):
             return PostDetailSerializer
         return PostListSerializer
     
+    def get_queryset(self):
+        """Order posts by the ?sort= ranking mode (hot by default)"""
+        queryset = Post.objects.select_related('author', 'community').prefetch_related('tags')
+        return ranked_posts(queryset, get_sort(self.request))
+    
+    def get_validator_timestamps(self, obj):
+        # Posts embed their community and its counts
+        return [obj.updated_at, obj.community.updated_at]
+    
     @action(detail=True, methods=['get'])
     def comments(self, request, pk=None):
         """Get the post's comments"""
@@ -117,34 +185,23 @@ class PostViewSet(viewsets.ModelViewSet):
     def upvote(self, request, pk=None):
         """Upvote the post"""
         post = self.get_object()
-        # Check if user already voted
-        try:
-            vote = Vote.objects.get(user=request.user, post=post)
-            vote.value = 1
-            vote.save()
-        except Vote.DoesNotExist:
-            Vote.objects.create(user=request.user, post=post, value=1)
+        cast_vote(request.user, 1, post=post, toggle=False)
         return Response({'status': 'post upvoted'})
     
     @action(detail=True, methods=['post'])
     def downvote(self, request, pk=None):
         """Downvote the post"""
         post = self.get_object()
-        # Check if user already voted
-        try:
-            vote = Vote.objects.get(user=request.user, post=post)
-            vote.value = -1
-            vote.save()
-        except Vote.DoesNotExist:
-            Vote.objects.create(user=request.user, post=post, value=-1)
+        cast_vote(request.user, -1, post=post, toggle=False)
         return Response({'status': 'post downvoted'})
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for viewing and editing comments"""
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('author').order_by('-created_at', '-id')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
+    pagination_class = KeysetCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['post', 'author', 'parent']
     
@@ -160,26 +217,14 @@ class CommentViewSet(viewsets.ModelViewSet):
     def upvote(self, request, pk=None):
         """Upvote the comment"""
         comment = self.get_object()
-        # Check if user already voted
-        try:
-            vote = Vote.objects.get(user=request.user, comment=comment)
-            vote.value = 1
-            vote.save()
-        except Vote.DoesNotExist:
-            Vote.objects.create(user=request.user, comment=comment, value=1)
+        cast_vote(request.user, 1, comment=comment, toggle=False)
         return Response({'status': 'comment upvoted'})
     
     @action(detail=True, methods=['post'])
     def downvote(self, request, pk=None):
         """Downvote the comment"""
         comment = self.get_object()
-        # Check if user already voted
-        try:
-            vote = Vote.objects.get(user=request.user, comment=comment)
-            vote.value = -1
-            vote.save()
-        except Vote.DoesNotExist:
-            Vote.objects.create(user=request.user, comment=comment, value=-1)
+        cast_vote(request.user, -1, comment=comment, toggle=False)
         return Response({'status': 'comment downvoted'})
 
 
@@ -187,23 +232,25 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing notifications"""
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated, IsRecipientOrReadOnly]
+    pagination_class = KeysetCursorPagination
     
     def get_queryset(self):
         """Return only the current user's notifications"""
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user)\
+            .select_related('recipient', 'sender')\
+            .order_by('-created_at', '-id')
     
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         """Mark notification as read"""
         notification = self.get_object()
-        notification.is_read = True
-        notification.save()
+        notification.mark_as_read()
         return Response({'status': 'notification marked as read'})
     
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
-        Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        mark_all_read(request.user.pk)
         return Response({'status': 'all notifications marked as read'})
 
 
@@ -214,4 +261,35 @@ class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Return only the current user's payments"""
-        return Payment.objects.filter(user=self.request.user)
\ No newline at end of file
+        return Payment.objects.filter(user=self.request.user)
+
+
+class AutocompleteViewSet(viewsets.ViewSet):
+    """
+    Community names, tag names and usernames starting with ?q=, from the
+    in-process prefix indexes of core.autocomplete. ?type= limits the
+    results to communities, tags or users; ?limit= sets how many of each.
+    """
+    permission_classes = [permissions.AllowAny]
+    
+    def list(self, request):
+        kind = request.query_params.get('type')
+        kinds = [kind] if kind in ('communities', 'tags', 'users') else None
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        
+        results = complete(request.query_params.get('q', ''), kinds, limit)
+        serializers = {
+            'communities': lambda pk, name: {
+                'id': pk, 'name': name, 'url': reverse('community_detail', kwargs={'pk': pk}),
+            },
+            'tags': lambda pk, name, slug: {
+                'id': pk, 'name': name, 'slug': slug, 'url': f"{reverse('home')}?tag={slug}",
+            },
+            'users': lambda pk, username: {
+                'id': pk, 'username': username, 'url': reverse('profile', kwargs={'username': username}),
+            },
+        }
+        return Response({kind: [serializers[kind](*row) for row in rows] for kind, rows in results.items()})
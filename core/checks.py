@@ -0,0 +1,47 @@
+"""
+System checks for the caches core relies on.
+
+The query cache (core.query_cache), the search result cache
+(core.search_cache) and the popular tags leaderboard (core.tags) invalidate
+entries by writing stamps to a cache that every process must see: web
+workers, queue workers and management commands. A per-process backend such
+as LocMemCache would leave the other processes serving stale results, so
+those caches stay off unless their cache is shared, and these checks say so.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries only the process that wrote them can see
+PER_PROCESS_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared_cache(cache):
+    """Whether every process using cache sees the same entries"""
+    return not isinstance(cache, PER_PROCESS_BACKENDS)
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    messages = []
+    alias = getattr(settings, 'QUERY_CACHE_ALIAS', 'default')
+    if getattr(settings, 'QUERY_CACHE', None) and not is_shared_cache(caches[alias]):
+        messages.append(Warning(
+            f"The query cache is off: cache '{alias}' is local to each process.",
+            hint='Point QUERY_CACHE_ALIAS at a shared cache such as Redis (set REDIS_URL).',
+            id='core.W001',
+        ))
+    if not is_shared_cache(caches['default']):
+        messages.append(Warning(
+            'Search results are not cached: the default cache is local to each process.',
+            hint='Use a shared default cache such as Redis (set REDIS_URL).',
+            id='core.W002',
+        ))
+        messages.append(Warning(
+            'The popular tags leaderboard is not cached: the default cache is local to each process.',
+            hint='Use a shared default cache such as Redis (set REDIS_URL).',
+            id='core.W003',
+        ))
+    return messages
@@ -0,0 +1,157 @@
+"""
+Comment tree loader.
+
+Fetches a post's comments with one ordered MPTT range query (tree_id, lft)
+and builds the nested structure in Python, instead of walking the tree with
+one query per node. Depth and breadth are capped per level; whatever is cut
+off is represented by an opaque cursor that can be passed back to load the
+next batch of replies.
+
+Each returned comment gets these attributes:
+- child_comments: list of loaded child comments
+- depth: nesting depth relative to the top of the loaded batch
+- more_cursor: cursor for the replies that were not loaded (or None)
+- more_count: number of replies behind more_cursor
+"""
+from collections import namedtuple
+
+from django.core import signing
+from django.http import Http404
+
+from .models import Comment
+
+# Deepest level displayed below the top of a batch (the top is level 0)
+MAX_DEPTH = 5
+# Children displayed per comment (and top-level comments per batch)
+MAX_CHILDREN = 20
+# Hard cap on the rows fetched for a single batch
+MAX_COMMENTS = 500
+
+CURSOR_SALT = 'core.comment_tree'
+
+CommentTree = namedtuple('CommentTree', ['comments', 'nodes', 'more_cursor'])
+
+
+def make_cursor(post_id, parent_id, after, max_level):
+    """Encode the position of the next batch of replies as an opaque string"""
+    return signing.dumps(
+        {'post': post_id, 'parent': parent_id, 'after': after, 'level': max_level},
+        salt=CURSOR_SALT,
+        compress=True,
+    )
+
+
+def read_cursor(cursor):
+    """Decode a cursor made by make_cursor, raising Http404 if it was tampered with"""
+    try:
+        return signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise Http404('Invalid comment cursor')
+
+
+def _tree_queryset():
+    return Comment.objects.select_related('author__profile').order_by('tree_id', 'lft')
+
+
+def load_comment_tree(post, root=None, cursor=None, max_depth=MAX_DEPTH,
+                      max_children=MAX_CHILDREN, max_comments=MAX_COMMENTS):
+    """
+    Load a bounded comment tree for post.
+
+    - With neither root nor cursor, loads the post's top-level comments and
+      their replies.
+    - With root, loads that comment and its replies (for comment threads).
+    - With cursor, loads the batch of replies the cursor points at.
+
+    Returns a CommentTree of (comments, nodes, more_cursor), where comments
+    are the top-level comments of the batch, nodes is every loaded comment in
+    display order, and more_cursor points at further top-level comments.
+    """
+    parent = None
+
+    if cursor is not None:
+        position = read_cursor(cursor)
+        if position['post'] != post.pk:
+            raise Http404('Invalid comment cursor')
+        max_level = position['level']
+        if position['parent'] is None:
+            # More top-level comments; each one is its own MPTT tree
+            queryset = _tree_queryset().filter(post=post, tree_id__gt=position['after'])
+        else:
+            parent = Comment.objects.filter(post=post, pk=position['parent']).first()
+            if parent is None:
+                raise Http404('Comment no longer exists')
+            queryset = _tree_queryset().filter(
+                tree_id=parent.tree_id,
+                lft__gt=position['after'],
+                rght__lt=parent.rght,
+            )
+    elif root is not None:
+        max_level = root.level + max_depth
+        queryset = _tree_queryset().filter(
+            tree_id=root.tree_id,
+            lft__gte=root.lft,
+            rght__lte=root.rght,
+        )
+    else:
+        max_level = max_depth
+        queryset = _tree_queryset().filter(post=post)
+
+    rows = list(queryset.filter(level__lte=max_level)[:max_comments + 1])
+    truncated = len(rows) > max_comments
+    rows = rows[:max_comments]
+
+    comments = []
+    nodes = []
+    stack = []
+    skipped_top_level = False
+    # (tree_id, rght) of a subtree that is being skipped because of the breadth cap
+    skip = None
+
+    for comment in rows:
+        if skip and comment.tree_id == skip[0] and comment.rght < skip[1]:
+            continue
+        skip = None
+
+        # Pop back up to this comment's parent
+        while stack and (stack[-1].tree_id != comment.tree_id or comment.lft > stack[-1].rght):
+            stack.pop()
+
+        siblings = stack[-1].child_comments if stack else comments
+        if len(siblings) >= max_children:
+            skip = (comment.tree_id, comment.rght)
+            if not stack:
+                skipped_top_level = True
+            continue
+
+        # Every comment in the batch belongs to post; avoid a lazy load per node
+        comment.post = post
+        comment.child_comments = []
+        comment.depth = len(stack)
+        comment.more_cursor = None
+        comment.more_count = 0
+        siblings.append(comment)
+        nodes.append(comment)
+        stack.append(comment)
+
+    # Attach a cursor to every comment with replies that were not loaded.
+    # Comments at the depth cap are left alone; they link to their own thread.
+    for comment in nodes:
+        if comment.level >= max_level:
+            continue
+        after = comment.child_comments[-1].rght if comment.child_comments else comment.lft
+        if comment.rght - after > 1:
+            comment.more_count = (comment.rght - after - 1) // 2
+            comment.more_cursor = make_cursor(post.pk, comment.pk, after, max_level)
+
+    more_cursor = None
+    if comments and root is None:
+        if parent is not None:
+            # Remaining siblings of this batch are replies to the cursor's parent
+            after = comments[-1].rght
+            if (skipped_top_level or truncated) and parent.rght - after > 1:
+                more_cursor = make_cursor(post.pk, parent.pk, after, max_level)
+        elif skipped_top_level or truncated:
+            more_cursor = make_cursor(post.pk, None, comments[-1].tree_id, max_level)
+
+    return CommentTree(comments, nodes, more_cursor)
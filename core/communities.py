@@ -0,0 +1,95 @@
+"""
+Community member and post counters.
+
+Community.member_count and Community.post_count are adjusted with atomic
+UPDATEs when users join or leave (the members m2m_changed receiver, from
+either side of the relation, plus a pre_delete receiver for deleted users
+whose memberships disappear without m2m signals) and when posts are created
+or deleted (post_save/post_delete, which also covers cascades). Listing or
+sorting communities by size never joins or COUNTs members or posts.
+recompute_community_counts() repairs drift.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+# Orderings of the community directory, by ?sort= value
+COMMUNITY_SORTS = {
+    'new': ('-created_at', '-id'),
+    'members': ('-member_count', '-id'),
+    'posts': ('-post_count', '-id'),
+}
+COMMUNITY_SORT_CHOICES = (
+    ('new', 'Newest'),
+    ('members', 'Most members'),
+    ('posts', 'Most posts'),
+)
+DEFAULT_COMMUNITY_SORT = 'new'
+
+
+def _adjust(field, community_ids, delta):
+    from .models import Community
+
+    community_ids = [pk for pk in community_ids if pk is not None]
+    if not delta or not community_ids:
+        return 0
+    if delta > 0:
+        expression = F(field) + delta
+    else:
+        expression = Greatest(F(field) + delta, 0)
+    return Community.objects.filter(pk__in=community_ids).update(**{field: expression}, updated_at=timezone.now())
+
+
+def adjust_member_count(community_ids, delta):
+    """Atomically add delta to the member count of each community, never below zero"""
+    return _adjust('member_count', community_ids, delta)
+
+
+def adjust_post_count(community_ids, delta):
+    """Atomically add delta to the post count of each community, never below zero"""
+    return _adjust('post_count', community_ids, delta)
+
+
+def get_community_sort(request):
+    """The directory ordering named by ?sort=, falling back to newest first"""
+    sort = request.GET.get('sort')
+    return sort if sort in COMMUNITY_SORTS else DEFAULT_COMMUNITY_SORT
+
+
+def member_count_expression():
+    """Expression counting each community's members, for Community querysets"""
+    from .models import Community
+
+    members = Community.members.through.objects.filter(community=OuterRef('pk'))\
+        .order_by()\
+        .values('community')\
+        .annotate(total=Count('pk'))\
+        .values('total')
+    return Coalesce(Subquery(members, output_field=IntegerField()), 0)
+
+
+def post_count_expression():
+    """Expression counting each community's posts, for Community querysets"""
+    from .models import Post
+
+    posts = Post.objects.filter(community=OuterRef('pk'))\
+        .order_by()\
+        .values('community')\
+        .annotate(total=Count('pk'))\
+        .values('total')
+    return Coalesce(Subquery(posts, output_field=IntegerField()), 0)
+
+
+def recompute_community_counts(communities=None):
+    """
+    Rebuild the stored member and post counts of communities (all of them
+    by default) with a single UPDATE. Returns the number of communities updated.
+    """
+    from .models import Community
+
+    if communities is None:
+        communities = Community.objects.all()
+    return communities.update(
+        member_count=member_count_expression(),
+        post_count=post_count_expression(),
+    )
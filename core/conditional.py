@@ -0,0 +1,92 @@
+"""
+Conditional GET support (ETag and Last-Modified).
+
+Community, Post and Comment have an updated_at timestamp that moves with
+every change to what they show: saves (auto_now) and the counter UPDATEs in
+core.voting, core.fragments and core.communities. Validators are built from
+those timestamps, with one small query for a page (post_page_validators,
+community_page_validators) or from the rows already fetched for an API
+response (ConditionalGetMixin in core.api.viewsets), so an unchanged
+resource is answered with 304 Not Modified before any template is rendered
+or serializer run.
+
+HTML pages are only conditional for anonymous readers, like the page cache:
+logged-in pages also show per-user state (notification count, own votes)
+that these timestamps don't track.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import OuterRef, Subquery
+from django.views.decorators.http import condition
+
+from .page_cache import is_cacheable_request
+
+
+def make_validators(parts, timestamps):
+    """
+    Return (etag, last_modified) for a resource identified by parts (which
+    must change whenever it does) and last changed at the latest of timestamps
+    """
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'"{digest}"', max(timestamps, default=None)
+
+
+def conditional_page(get_validators):
+    """
+    Answer conditional GETs from anonymous readers with 304 Not Modified.
+    get_validators(request, *args, **kwargs) returns (etag, last_modified)
+    from the view's arguments, or (None, None) to leave the request to the
+    view (e.g. for a 404).
+    """
+    def decorator(view):
+        def validators(request, *args, **kwargs):
+            # condition() asks for the ETag and Last-Modified separately
+            if not hasattr(request, '_validators'):
+                request._validators = get_validators(request, *args, **kwargs)
+            return request._validators
+
+        conditional_view = condition(
+            etag_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0],
+            last_modified_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1],
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable_request(request):
+                return view(request, *args, **kwargs)
+            return conditional_view(request, *args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def _latest(queryset):
+    return Subquery(queryset.order_by('-updated_at').values('updated_at')[:1])
+
+
+def post_page_validators(request, pk, *args, **kwargs):
+    """Validators of a post page: the post and its latest changed comment"""
+    from .models import Comment, Post
+
+    row = Post.objects.filter(pk=pk)\
+        .annotate(comments_updated_at=_latest(Comment.objects.filter(post=OuterRef('pk'))))\
+        .values_list('updated_at', 'comments_updated_at')\
+        .first()
+    if row is None:
+        return None, None
+    return make_validators(('post', pk, row, request.GET.urlencode()), row)
+
+
+def community_page_validators(request, pk, *args, **kwargs):
+    """Validators of a community page: the community and its latest changed post"""
+    from .models import Community, Post
+
+    row = Community.objects.filter(pk=pk)\
+        .annotate(posts_updated_at=_latest(Post.objects.filter(community=OuterRef('pk'))))\
+        .values_list('updated_at', 'posts_updated_at')\
+        .first()
+    if row is None:
+        return None, None
+    return make_validators(('community', pk, row, request.GET.urlencode()), row)
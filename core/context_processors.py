@@ -1,39 +1,46 @@
-from taggit.models import Tag
-from django.db.models import Count
-from .models import Profile
+"""
+Context processors run on every render(), including AJAX fragments and error
+pages that never show the navbar or sidebar. Their values are lazy objects
+that only load when a template reads them, and are kept on the request so
+several renders in one request share a single load.
+"""
+from django.utils.functional import SimpleLazyObject
+from .tags import get_popular_tags
+from .user_cache import get_unread_notification_count, get_user_profile
+
+
+def _request_lazy(request, name, func):
+    """Return the lazy value stored on request under name, creating it on first use"""
+    attr = f'_lazy_{name}'
+    value = getattr(request, attr, None)
+    if value is None:
+        value = SimpleLazyObject(func)
+        setattr(request, attr, value)
+    return value
+
 
 def notification_count(request):
     """
     Context processor that provides the count of unread notifications for the current user.
     """
-    unread_count = 0
-    
-    if request.user.is_authenticated:
-        try:
-            # If the user is logged in, query their unread notifications
-            unread_count = request.user.notifications.filter(is_read=False).count()
-        except Exception as e:
-            # If there's any error, default to 0
-            unread_count = 0
+    if not request.user.is_authenticated:
+        return {'unread_notification_count': 0}
     
+    user_id = request.user.pk
     return {
-        'unread_notification_count': unread_count,
+        'unread_notification_count': _request_lazy(
+            request, 'unread_notification_count', lambda: get_unread_notification_count(user_id)
+        ),
     }
 
 
-def popular_tags(request):
-    """
-    Add popular tags to the template context for all views
-    """
-    # Get top tags with usage count
-    tags = Tag.objects.annotate(num_times=Count('taggit_taggeditem_items')).order_by('-num_times')[:15]
+def _popular_tags_with_defaults(default_tag_names):
+    # Get top post tags from the cached leaderboard
+    tags = get_popular_tags(15)
     
     # If no tags exist or less than 3 tags, add default popular ones
     default_tags = []
-    existing_tag_names = [tag.name for tag in tags]
-    
-    # Default popular tags
-    default_tag_names = ['news', 'tech', 'politics']
+    existing_tag_names = [tag['name'] for tag in tags]
     
     # Check if any default tags are missing and should be added to the display
     for tag_name in default_tag_names:
@@ -47,15 +54,21 @@ def popular_tags(request):
     
     # If we have default tags to add and actual tags are less than 15
     if default_tags and len(tags) < 15:
-        # Convert queryset to list if needed
-        if not isinstance(tags, list):
-            tags = list(tags)
-        # Add default tags
-        for default_tag in default_tags:
-            tags.append(default_tag)
+        # Copy so the cached leaderboard isn't modified
+        tags = tags + default_tags
+    
+    return tags
+
+
+def popular_tags(request):
+    """
+    Add popular tags to the template context for all views
+    """
+    # Default popular tags
+    default_tag_names = ['news', 'tech', 'politics']
     
     return {
-        'all_tags': tags,
+        'all_tags': _request_lazy(request, 'all_tags', lambda: _popular_tags_with_defaults(default_tag_names)),
         'default_tag_names': default_tag_names,
     }
 
@@ -64,16 +77,10 @@ def user_profile(request):
     """
     Add user profile to the template context for all views
     """
-    user_profile = None
-    
-    if request.user.is_authenticated:
-        try:
-            # Get or create the user's profile
-            user_profile, created = Profile.objects.get_or_create(user=request.user)
-        except Exception as e:
-            # If there's any error, default to None
-            user_profile = None
+    if not request.user.is_authenticated:
+        return {'user_profile': None}
     
+    user_id = request.user.pk
     return {
-        'user_profile': user_profile,
-    }
\ No newline at end of file
+        'user_profile': _request_lazy(request, 'user_profile', lambda: get_user_profile(user_id)),
+    }
@@ -1,11 +1,12 @@
 import django_filters
 from django import forms
-from django.db.models import Q, Count
+from django.db.models import Q, F
 from django.utils import timezone
 from datetime import timedelta
 from taggit.models import Tag
 
 from .models import Post, Community
+from .ranking import SORT_HOT, SORT_TOP, SORT_CONTROVERSIAL, ranked_posts
 
 class PostFilter(django_filters.FilterSet):
     """
@@ -21,7 +22,9 @@ class PostFilter(django_filters.FilterSet):
     
     SORT_CHOICES = (
         ('recent', 'Most Recent'),
+        ('hot', 'Hot'),
         ('popular', 'Most Popular'),
+        ('controversial', 'Controversial'),
         ('comments', 'Most Comments'),
         ('oldest', 'Oldest'),
     )
@@ -132,19 +135,23 @@ class PostFilter(django_filters.FilterSet):
         if value is None:
             return queryset
         
-        # Annotate with vote count and filter
+        # Use the denormalized vote counts instead of joining the votes table
         return queryset.annotate(
-            total_votes=Count('votes__value')
+            total_votes=F('upvote_count') + F('downvote_count')
         ).filter(total_votes__gte=value)
     
     def filter_sort(self, queryset, name, value):
         """Custom filter to sort posts by different criteria"""
         if value == 'recent':
             return queryset.order_by('-created_at')
+        elif value == 'hot':
+            return ranked_posts(queryset, SORT_HOT)
         elif value == 'popular':
-            return queryset.annotate(vote_sum=Count('votes__value')).order_by('-vote_sum')
+            return ranked_posts(queryset, SORT_TOP)
+        elif value == 'controversial':
+            return ranked_posts(queryset, SORT_CONTROVERSIAL)
         elif value == 'comments':
-            return queryset.annotate(comment_count=Count('comments')).order_by('-comment_count')
+            return queryset.order_by('-comment_count')
         elif value == 'oldest':
             return queryset.order_by('created_at')
         
@@ -0,0 +1,50 @@
+"""
+Fragment cache for rendered post cards.
+
+The part of a post card that looks the same to every viewer (header,
+content, comment link, share menu and tags) is cached with Django's
+{% cache %} tag under the post id and Post.cache_version, plus the few
+values it shows from related rows (the author's username, reputation level
+and country, the community name). cache_version is bumped in the same UPDATE
+as every change that shows up in the card: edits, comments and tag changes.
+
+Votes don't bump it. The score and the viewer's vote state are rendered
+with the vote buttons, outside the cached fragment, as is the author-only
+delete button, so one cached copy serves anonymous and logged-in viewers
+alike. The card does show the post's age ("3 hours, 12 minutes ago"), so
+the copies of young posts expire sooner.
+"""
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+POST_CARD_FRAGMENT = 'post_card'
+
+
+def next_version():
+    """Expression for the following cache_version, for use in Post UPDATEs"""
+    return F('cache_version') + 1
+
+
+def bump_post_version(post_ids):
+    """Invalidate the cached cards of the given posts"""
+    from .models import Post
+
+    post_ids = list(post_ids)
+    if not post_ids:
+        return 0
+    return Post.objects.filter(pk__in=post_ids).update(cache_version=next_version(), updated_at=timezone.now())
+
+
+def post_card_timeout(created_at, now=None):
+    """
+    Seconds a card may be cached for, so its "posted ... ago" is never off by
+    more than the smallest unit timesince shows for a post of that age
+    """
+    age = (now or timezone.now()) - created_at
+    if age < timedelta(days=1):
+        return 60
+    if age < timedelta(days=30):
+        return 60 * 60
+    return 24 * 60 * 60
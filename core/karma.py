@@ -0,0 +1,110 @@
+"""
+Karma engine.
+
+A user's karma is the net score of the votes on their posts and comments,
+plus a bonus for every post and comment they have written. It is stored on
+Profile.karma as a running total and adjusted with atomic
+``UPDATE ... SET karma = karma + x`` statements whenever a vote, post or
+comment is created or deleted. recompute_karma() rebuilds it from scratch.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+# Karma awarded for writing a post or a comment
+POST_KARMA = 2
+COMMENT_KARMA = 1
+
+
+def adjust_karma(user_id, delta):
+    """Atomically add delta to the karma of the user with user_id"""
+    from .models import Profile
+
+    if not delta or user_id is None:
+        return 0
+    return Profile.objects.filter(user_id=user_id).update(karma=F('karma') + delta)
+
+
+def adjust_author_karma(target, delta, model=None, pk=None):
+    """
+    Add delta to the karma of the author of a post or comment.
+
+    target may be the loaded post/comment instance; otherwise pass its model
+    and pk and the author is resolved inside the UPDATE itself.
+    """
+    from .models import Post, Profile
+
+    if not delta:
+        return 0
+    if target is not None:
+        return adjust_karma(target.author_id, delta)
+
+    related = 'user__posts' if model is Post else 'user__comments'
+    return Profile.objects.filter(**{related: pk}).update(karma=F('karma') + delta)
+
+
+def comment_karma_by_author(comments):
+    """
+    Return a Counter of {author_id: karma} earned by the comments in the
+    queryset, from their creation bonus and stored vote counts.
+    """
+    rows = comments.order_by().values('author_id').annotate(
+        total=Sum(F('upvote_count') - F('downvote_count') + COMMENT_KARMA)
+    ).values_list('author_id', 'total')
+    return Counter(dict(rows))
+
+
+def remove_karma(karma_by_author):
+    """Take back the karma in a {user_id: karma} mapping, one UPDATE per user"""
+    for user_id, karma in karma_by_author.items():
+        adjust_karma(user_id, -karma)
+
+
+def _sum_subquery(queryset, expression):
+    """Correlated subquery summing expression over queryset rows of each user"""
+    totals = queryset.filter(author=OuterRef('user_id'))\
+        .order_by()\
+        .values('author')\
+        .annotate(total=expression)\
+        .values('total')
+    return Coalesce(Subquery(totals, output_field=IntegerField()), 0)
+
+
+def karma_expression():
+    """
+    Expression computing each profile's karma from the vote, post and comment
+    tables, for use in Profile querysets.
+    """
+    from .models import Post, Comment, Vote
+
+    post_votes = Vote.objects.filter(post__isnull=False)
+    comment_votes = Vote.objects.filter(comment__isnull=False)
+
+    post_vote_karma = Coalesce(Subquery(
+        post_votes.filter(post__author=OuterRef('user_id'))
+        .order_by().values('post__author').annotate(total=Sum('value')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+    comment_vote_karma = Coalesce(Subquery(
+        comment_votes.filter(comment__author=OuterRef('user_id'))
+        .order_by().values('comment__author').annotate(total=Sum('value')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+    post_karma = _sum_subquery(Post.objects.all(), Count('pk') * POST_KARMA)
+    comment_karma = _sum_subquery(Comment.objects.all(), Count('pk') * COMMENT_KARMA)
+
+    return post_vote_karma + comment_vote_karma + post_karma + comment_karma
+
+
+def recompute_karma(profiles=None):
+    """
+    Rebuild the stored karma of profiles (all profiles by default) with a
+    single set-based UPDATE. Returns the number of profiles that changed.
+    """
+    from .models import Profile
+
+    if profiles is None:
+        profiles = Profile.objects.all()
+    actual = karma_expression()
+    return profiles.exclude(karma=actual).update(karma=actual)
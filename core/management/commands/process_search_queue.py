@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from core.search import QUEUE_BATCH_SIZE, process_index_queue, queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Write queued changes to the search index in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=QUEUE_BATCH_SIZE,
+            help='Queued objects indexed per batch',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep waiting for new changes instead of exiting once the queue is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to sleep between polls of an empty queue (with --loop)',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Only report the queue length and lag',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = queue_stats()
+            self.stdout.write(f"{stats['pending']} objects queued, oldest waiting {stats['lag']:.1f}s")
+            return
+
+        total = 0
+        while True:
+            processed, lag = process_index_queue(options['batch_size'])
+            if processed:
+                total += processed
+                self.stdout.write(f'Indexed {processed} objects (lag {lag:.1f}s)')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Search index is up to date ({total} objects indexed)'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from core.query_cache import enabled, reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = 'Report the hit rate of the ORM query cache per model'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Start counting again after reporting',
+        )
+
+    def handle(self, *args, **options):
+        if not enabled():
+            self.stderr.write(self.style.WARNING(
+                'The query cache is off: QUERY_CACHE is empty or its cache is local to each process (see check core.W001)'
+            ))
+            return
+        counts = stats()
+        hits = misses = 0
+        for label, model_counts in sorted(counts.items()):
+            total = model_counts['hits'] + model_counts['misses']
+            self.stdout.write(
+                f"{label}: {model_counts['hits']} hits, {model_counts['misses']} misses, "
+                f"hit rate {model_counts['hits'] / total if total else 0:.1%}"
+            )
+            hits += model_counts['hits']
+            misses += model_counts['misses']
+        total = hits + misses
+        self.stdout.write(f'{hits} hits, {misses} misses, hit rate {hits / total if total else 0:.1%}')
+        if options['reset']:
+            reset_stats()
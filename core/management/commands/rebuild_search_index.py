@@ -1,18 +1,121 @@
-from django.core.management.base import BaseCommand, CommandError
-from django.core.management import call_command
-from watson import search as watson
-from core.search_adapters import register_search_adapters
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from core import search
+from core.models import SearchDocument, SearchIndexBuild
+from core.search_cache import invalidate_results
+
+CHUNK_SIZE = 2000
+BATCH_SIZE = 500
+
+
+def _init_worker():
+    # Needed where workers are spawned rather than forked
+    django.setup()
+
 
 class Command(BaseCommand):
-    help = 'Rebuilds the Watson search index with proper adapters'
+    help = (
+        'Rebuilds the full-text search index from the registered search adapters '
+        'into a new generation, swapped in when complete. An interrupted rebuild '
+        'resumes from its last completed chunk.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of indexing processes (1 indexes in this process)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Primary keys per chunk of work (ignored when resuming)',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Discard an interrupted rebuild instead of resuming it',
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write('Rebuilding search index...')
-        
-        # First, register our custom search adapters
-        register_search_adapters()
-        
-        # Then rebuild the index using Watson's built-in command
-        call_command('buildwatson')
+        build = self.get_build(options['chunk_size'], options['restart'])
+        chunks = self.pending_chunks(build)
+        self.stdout.write(f'Rebuilding search index generation {build.generation}: {len(chunks)} chunks to index')
+
+        if options['workers'] > 1 and len(chunks) > 1:
+            # Forked workers must not share the parent's connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+                results = pool.map(search.chunk_documents, *zip(*chunks))
+                self.write_chunks(build, chunks, results)
+        else:
+            self.write_chunks(build, chunks, (search.chunk_documents(*chunk) for chunk in chunks))
+
+        # Searches switch to the new generation at once, then the old ones go
+        with transaction.atomic():
+            build.finished_at = timezone.now()
+            build.save(update_fields=['finished_at'])
+        invalidate_results(search.registered_models())
+        SearchDocument.objects.exclude(generation=build.generation).delete()
         
         self.stdout.write(self.style.SUCCESS('Search index rebuilt successfully'))
+
+    def get_build(self, chunk_size, restart):
+        """The interrupted build to resume, or a new one"""
+        active = search.index_generations()[0]
+        unfinished = SearchIndexBuild.objects.filter(finished_at__isnull=True, generation__gt=active)
+        if restart:
+            SearchDocument.objects.filter(generation__gt=active).delete()
+            unfinished.delete()
+        build = unfinished.order_by('-generation').first()
+        if build is not None:
+            self.stdout.write(f'Resuming the rebuild started at {build.started_at:%Y-%m-%d %H:%M}')
+            return build
+        latest = SearchIndexBuild.objects.aggregate(latest=Max('generation'))['latest'] or 0
+        return SearchIndexBuild.objects.create(generation=max(latest, active) + 1, chunk_size=chunk_size)
+
+    def pending_chunks(self, build):
+        """(model label, first pk, end pk) of every chunk not yet written"""
+        chunks = []
+        for model in search.registered_models():
+            label = model._meta.label_lower
+            bounds = search.get_adapter(model).get_queryset().aggregate(first=Min('pk'), last=Max('pk'))
+            if bounds['first'] is None:
+                continue
+            done = set(build.completed_chunks.get(label, []))
+            # Aligned to multiples of the chunk size, so a resumed build finds the same chunks
+            first = bounds['first'] - bounds['first'] % build.chunk_size
+            for start in range(first, bounds['last'] + 1, build.chunk_size):
+                if start not in done:
+                    chunks.append((label, start, start + build.chunk_size))
+        return chunks
+
+    def write_chunks(self, build, chunks, results):
+        counts = {}
+        for (label, start, end), documents in zip(chunks, results):
+            content_type = ContentType.objects.get_by_natural_key(*label.split('.'))
+            with transaction.atomic():
+                # Rows the queue worker already wrote for this generation are newer
+                SearchDocument.objects.bulk_create(
+                    [
+                        SearchDocument(content_type=content_type, object_id=pk, generation=build.generation, **values)
+                        for pk, values in documents
+                    ],
+                    batch_size=BATCH_SIZE,
+                    ignore_conflicts=True,
+                )
+                # Checkpoint the chunk with its documents
+                build.completed_chunks.setdefault(label, []).append(start)
+                build.save(update_fields=['completed_chunks'])
+            counts[label] = counts.get(label, 0) + len(documents)
+        for label, count in counts.items():
+            self.stdout.write(f'Indexed {count} {label} objects')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.tags import rebuild_tag_usage
+
+
+class Command(BaseCommand):
+    help = 'Recount how many posts use each tag and refresh the popular tags leaderboard'
+
+    def handle(self, *args, **options):
+        count = rebuild_tag_usage()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt usage counts for {count} tags'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from core.communities import member_count_expression, post_count_expression, recompute_community_counts
+from core.models import Community
+
+
+class Command(BaseCommand):
+    help = 'Recalculate every community\'s member and post counts from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted communities without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            rows = Community.objects.annotate(
+                    actual_members=member_count_expression(),
+                    actual_posts=post_count_expression(),
+                )\
+                .filter(~Q(member_count=F('actual_members')) | ~Q(post_count=F('actual_posts')))\
+                .values_list('name', 'member_count', 'actual_members', 'post_count', 'actual_posts')
+            count = 0
+            for name, members, actual_members, posts, actual_posts in rows.iterator():
+                count += 1
+                self.stdout.write(
+                    f'{name}: stored {members} members/{posts} posts, '
+                    f'actual {actual_members} members/{actual_posts} posts'
+                )
+            self.stdout.write(f'{count} communities have drifted counts')
+            self.stdout.write(self.style.WARNING('Dry run: no changes were written'))
+            return
+
+        updated = recompute_community_counts()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed member and post counts on {updated} communities'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from core.karma import karma_expression, recompute_karma
+from core.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Recalculate every user\'s karma from their posts, comments and votes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted profiles without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            actual = karma_expression()
+            rows = Profile.objects.annotate(actual=actual)\
+                .exclude(karma=F('actual'))\
+                .values_list('user__username', 'karma', 'actual')
+            count = 0
+            for username, stored, expected in rows.iterator():
+                count += 1
+                self.stdout.write(f'{username}: stored {stored}, actual {expected}')
+            self.stdout.write(f'{count} profiles have drifted karma')
+            self.stdout.write(self.style.WARNING('Dry run: no changes were written'))
+            return
+
+        with transaction.atomic():
+            fixed = recompute_karma()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed karma on {fixed} profiles'))
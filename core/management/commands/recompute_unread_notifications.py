@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from core.models import Profile
+from core.notifications import recompute_unread_counts, unread_count_expression
+
+
+class Command(BaseCommand):
+    help = 'Recalculate every user\'s unread notification count from their notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted profiles without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            rows = Profile.objects.annotate(actual=unread_count_expression())\
+                .exclude(unread_notification_count=F('actual'))\
+                .values_list('user__username', 'unread_notification_count', 'actual')
+            count = 0
+            for username, stored, expected in rows.iterator():
+                count += 1
+                self.stdout.write(f'{username}: stored {stored}, actual {expected}')
+            self.stdout.write(f'{count} profiles have drifted unread counts')
+            self.stdout.write(self.style.WARNING('Dry run: no changes were written'))
+            return
+
+        with transaction.atomic():
+            fixed = recompute_unread_counts()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed unread notification counts on {fixed} profiles'))
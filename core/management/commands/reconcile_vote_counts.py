@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from core.fragments import bump_post_version
+from core.models import Post, Comment, Vote
+from core.page_cache import HOME_KEY, community_key, post_key, purge_surrogate_keys
+from core.ranking import update_post_ranking
+
+
+def vote_count_subquery(target_field, value):
+    """Correlated subquery counting votes with the given value on each target row"""
+    votes = Vote.objects.filter(**{target_field: OuterRef('pk'), 'value': value})\
+        .order_by()\
+        .values(target_field)\
+        .annotate(total=Count('pk'))\
+        .values('total')
+    return Coalesce(Subquery(votes, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = 'Repair drift in the denormalized post and comment vote counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted rows without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        for model, target_field in ((Post, 'post'), (Comment, 'comment')):
+            upvotes = vote_count_subquery(target_field, 1)
+            downvotes = vote_count_subquery(target_field, -1)
+
+            # Rows whose stored counts disagree with the vote table
+            drifted = model.objects.exclude(Q(upvote_count=upvotes) & Q(downvote_count=downvotes))
+            label = model._meta.verbose_name_plural
+
+            if dry_run:
+                rows = drifted.annotate(actual_up=upvotes, actual_down=downvotes)\
+                    .values_list('pk', 'upvote_count', 'downvote_count', 'actual_up', 'actual_down')
+                count = 0
+                for pk, stored_up, stored_down, actual_up, actual_down in rows.iterator():
+                    count += 1
+                    self.stdout.write(
+                        f'{model.__name__} {pk}: stored +{stored_up}/-{stored_down}, '
+                        f'actual +{actual_up}/-{actual_down}'
+                    )
+                self.stdout.write(f'{count} {label} have drifted vote counts')
+                continue
+
+            with transaction.atomic():
+                # Locked so votes wait for the repaired counts
+                fixed_ids = list(drifted.select_for_update().values_list('pk', flat=True))
+                fixed = model.objects.filter(pk__in=fixed_ids).update(
+                    upvote_count=upvotes, downvote_count=downvotes, updated_at=timezone.now(),
+                )
+                self.refresh_fixed(model, fixed_ids)
+            self.stdout.write(self.style.SUCCESS(f'Reconciled vote counts on {fixed} {label}'))
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Dry run: no changes were written'))
+
+    def refresh_fixed(self, model, pks):
+        """
+        Recompute what was derived from the drifted counts: the rankings and
+        cached cards of repaired posts, and the pages showing the rows
+        """
+        if not pks:
+            return
+        if model is Post:
+            for pk in pks:
+                update_post_ranking(pk)
+            bump_post_version(pks)
+            posts = Post.objects.filter(pk__in=pks)
+            # Their places in the lists may have changed too
+            community_ids = set(posts.values_list('community_id', flat=True))
+            keys = [HOME_KEY, *map(community_key, community_ids)]
+        else:
+            posts = Post.objects.filter(comments__pk__in=pks).distinct()
+            keys = []
+        keys += map(post_key, posts.values_list('pk', flat=True))
+        purge_surrogate_keys(*keys)
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from core.models import Post
+from core.ranking import RISING_WINDOW, ranking_fields
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Decay the time-dependent ranking scores of recent posts (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=int(RISING_WINDOW.total_seconds() // 3600),
+            help='Only re-score posts created in the last N hours',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute every ranking field on every post',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        posts = Post.objects.only('pk', 'upvote_count', 'downvote_count', 'created_at').order_by('pk')
+
+        if options['all']:
+            fields = ['score', 'hot_score', 'controversy_score', 'rising_score']
+        else:
+            # Hot, top and controversial don't change with time; only rising decays
+            fields = ['rising_score']
+            posts = posts.filter(created_at__gte=now - timezone.timedelta(hours=options['hours']))
+
+        updated = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                # Votes on the batch wait until its scores are written, so
+                # none are overwritten with scores from the counts read here
+                batch = list(posts.filter(pk__gt=last_pk).select_for_update()[:BATCH_SIZE])
+                if not batch:
+                    break
+                for post in batch:
+                    scores = ranking_fields(post.upvote_count, post.downvote_count, post.created_at, now)
+                    for field in fields:
+                        setattr(post, field, scores[field])
+                    # A re-sorted list is a change for conditional GETs
+                    post.updated_at = now
+                updated += Post.objects.bulk_update(batch, fields + ['updated_at'])
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f'Refreshed rankings on {updated} posts'))
@@ -0,0 +1,60 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from core.fragments import bump_post_version
+from core.models import Post, Comment
+from core.rendering import render_fields
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Re-render the stored HTML and excerpts of post and comment bodies'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of rendering processes',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Rows rendered and written per batch',
+        )
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for model in (Post, Comment):
+                updated = self.render_model(model, pool, options['batch_size'])
+                self.stdout.write(f'Rendered {updated} {model._meta.verbose_name_plural}')
+        self.stdout.write(self.style.SUCCESS('Rendered content is up to date'))
+
+    def render_model(self, model, pool, batch_size):
+        fields = list(model.RENDERED_FIELDS)
+        # The base manager always reads the database, never the query cache
+        objects = model._base_manager.only('pk', 'content', *fields).order_by('pk')
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(objects.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return updated
+            last_pk = batch[-1].pk
+
+            # Render in the pool, then only write the rows whose output changed
+            rendered = pool.map(render_fields, [obj.content for obj in batch], chunksize=max(1, batch_size // 32))
+            changed = []
+            for obj, values in zip(batch, rendered):
+                if any(getattr(obj, field) != values[field] for field in fields):
+                    for field in fields:
+                        setattr(obj, field, values[field])
+                    changed.append(obj)
+            if changed:
+                model.objects.bulk_update(changed, fields)
+                if model is Post:
+                    bump_post_version(obj.pk for obj in changed)
+                updated += len(changed)
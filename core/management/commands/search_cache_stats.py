@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from core.search_cache import enabled, reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = 'Report the hit rate of the search result cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Start counting again after reporting',
+        )
+
+    def handle(self, *args, **options):
+        # Each process would only see its own counts
+        if not enabled():
+            self.stderr.write(self.style.WARNING(
+                'Search results are not cached: the default cache is local to each process (see check core.W002)'
+            ))
+            return
+        counts = stats()
+        self.stdout.write(
+            f"{counts['hits']} hits, {counts['misses']} misses, hit rate {counts['hit_rate']:.1%}"
+        )
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,35 @@
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_karma(apps, schema_editor):
+    """
+    Karma is now a running total adjusted on every vote, post and comment, so
+    it has to start from the correct value. Mirrors core.karma.karma_expression().
+    """
+    Profile = apps.get_model('core', 'Profile')
+    Post = apps.get_model('core', 'Post')
+    Comment = apps.get_model('core', 'Comment')
+    Vote = apps.get_model('core', 'Vote')
+
+    def total(queryset, group_by, expression):
+        rows = queryset.order_by().values(group_by).annotate(total=expression).values('total')
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    Profile.objects.update(karma=(
+        total(Vote.objects.filter(post__author=OuterRef('user_id')), 'post__author', Sum('value'))
+        + total(Vote.objects.filter(comment__author=OuterRef('user_id')), 'comment__author', Sum('value'))
+        + total(Post.objects.filter(author=OuterRef('user_id')), 'author', Count('pk') * 2)
+        + total(Comment.objects.filter(author=OuterRef('user_id')), 'author', Count('pk'))
+    ))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0012_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_karma, migrations.RunPython.noop),
+    ]
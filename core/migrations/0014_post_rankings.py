@@ -0,0 +1,113 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# The ranking formulas of core.ranking as of this migration, copied so that
+# later changes there don't change what it does
+HOT_EPOCH = datetime(2005, 12, 8, 7, 46, 43, tzinfo=dt_timezone.utc)
+HOT_DECAY_SECONDS = 45000
+RISING_GRAVITY = 1.5
+
+
+def ranking_fields(upvotes, downvotes, created_at, now):
+    score = upvotes - downvotes
+    order = math.log10(max(abs(score), 1))
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    controversy = 0.0
+    if upvotes > 0 and downvotes > 0:
+        balance = downvotes / upvotes if upvotes > downvotes else upvotes / downvotes
+        controversy = (upvotes + downvotes) ** balance
+    age_hours = max((now - created_at).total_seconds(), 0) / 3600
+    return {
+        'score': score,
+        'hot_score': round(sign * order + (created_at - HOT_EPOCH).total_seconds() / HOT_DECAY_SECONDS, 7),
+        'controversy_score': controversy,
+        'rising_score': score / (age_hours + 2) ** RISING_GRAVITY,
+    }
+
+
+def backfill_rankings(apps, schema_editor):
+    Post = apps.get_model('core', 'Post')
+    now = timezone.now()
+    batch = []
+    for post in Post.objects.only('pk', 'upvote_count', 'downvote_count', 'created_at').iterator(chunk_size=1000):
+        for field, value in ranking_fields(post.upvote_count, post.downvote_count, post.created_at, now).items():
+            setattr(post, field, value)
+        batch.append(post)
+        if len(batch) >= 1000:
+            Post.objects.bulk_update(batch, ['score', 'hot_score', 'controversy_score', 'rising_score'])
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, ['score', 'hot_score', 'controversy_score', 'rising_score'])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0013_backfill_profile_karma'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='score',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='controversy_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rising_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rankings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot_score', '-id'], name='core_post_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-hot_score', '-id'], name='core_post_comm_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='core_post_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-created_at', '-id'], name='core_post_comm_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-score', '-id'], name='core_post_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-score', '-id'], name='core_post_comm_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-rising_score', '-id'], name='core_post_rising_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-rising_score', '-id'], name='core_post_comm_rising_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-controversy_score', '-id'], name='core_post_controversy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-controversy_score', '-id'], name='core_post_comm_controversy_idx'),
+        ),
+    ]
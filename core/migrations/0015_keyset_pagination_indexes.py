@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0014_post_rankings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='core_post_author_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-created_at', '-id'], name='core_comment_new_idx'),
+        ),
+        # Tree index django-mptt declares once Comment.Meta has its own indexes
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['tree_id', 'lft'], name='core_comment_tree_id_lft_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='core_comment_author_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-created_at', '-id'], name='core_notif_recipient_new_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tag_usage(apps, schema_editor):
+    TagUsage = apps.get_model('core', 'TagUsage')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    post_type = ContentType.objects.filter(app_label='core', model='post').first()
+    if post_type is None:
+        return
+    counts = TaggedItem.objects.filter(content_type=post_type)\
+        .order_by()\
+        .values('tag_id')\
+        .annotate(total=Count('pk'))\
+        .values_list('tag_id', 'total')
+    TagUsage.objects.bulk_create([TagUsage(tag_id=tag_id, post_count=total) for tag_id, total in counts])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        ('core', '0015_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagUsage',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='taggit.tag')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-post_count'], name='core_tagusage_post_count_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_tag_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counts(apps, schema_editor):
+    """Mirrors core.notifications.unread_count_expression()"""
+    Profile = apps.get_model('core', 'Profile')
+    Notification = apps.get_model('core', 'Notification')
+
+    unread = Notification.objects.filter(recipient=OuterRef('user_id'), is_read=False)\
+        .order_by()\
+        .values('recipient')\
+        .annotate(total=Count('pk'))\
+        .values('total')
+    Profile.objects.update(
+        unread_notification_count=Coalesce(Subquery(unread, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0016_tagusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notification_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations, models
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+# What core.rendering stored as of this migration, copied so that later
+# changes there don't change what it does
+EXCERPT_WORDS = 50
+
+
+def render_fields(text):
+    text = text or ''
+    excerpt_html = ''
+    if len(text.split()) > EXCERPT_WORDS:
+        excerpt_html = linebreaks(Truncator(text).words(EXCERPT_WORDS, html=True), autoescape=True)
+    return {
+        'content_html': linebreaks(text, autoescape=True),
+        'excerpt': Truncator(text).words(EXCERPT_WORDS),
+        'excerpt_html': excerpt_html,
+    }
+
+
+def backfill_rendered_content(apps, schema_editor):
+    for model_name, fields in (
+        ('Post', ['content_html', 'excerpt', 'excerpt_html']),
+        ('Comment', ['content_html', 'excerpt']),
+    ):
+        model = apps.get_model('core', model_name)
+        batch = []
+        for obj in model.objects.only('pk', 'content').iterator(chunk_size=1000):
+            values = render_fields(obj.content)
+            for field in fields:
+                setattr(obj, field, values[field])
+            batch.append(obj)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0018_post_cache_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='content_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='excerpt',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_rendered_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_community_counts(apps, schema_editor):
+    """Mirrors core.communities.recompute_community_counts()"""
+    Community = apps.get_model('core', 'Community')
+    Post = apps.get_model('core', 'Post')
+
+    members = Community.members.through.objects.filter(community=OuterRef('pk'))\
+        .order_by()\
+        .values('community')\
+        .annotate(total=Count('pk'))\
+        .values('total')
+    posts = Post.objects.filter(community=OuterRef('pk'))\
+        .order_by()\
+        .values('community')\
+        .annotate(total=Count('pk'))\
+        .values('total')
+    Community.objects.update(
+        member_count=Coalesce(Subquery(members, output_field=IntegerField()), 0),
+        post_count=Coalesce(Subquery(posts, output_field=IntegerField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0019_rendered_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='community',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='community',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='community',
+            index=models.Index(fields=['-member_count', '-id'], name='core_community_members_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='community',
+            index=models.Index(fields=['-post_count', '-id'], name='core_community_posts_idx'),
+        ),
+        migrations.RunPython(backfill_community_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    for model_name in ('Community', 'Post', 'Comment'):
+        apps.get_model('core', model_name).objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0020_community_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='community',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-updated_at'], name='core_post_comm_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-updated_at'], name='core_comment_post_updated_idx'),
+        ),
+    ]
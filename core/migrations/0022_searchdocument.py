@@ -0,0 +1,93 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE core_searchdocument_fts USING fts5(
+        title, meta, description,
+        content='core_searchdocument', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER core_searchdocument_fts_insert AFTER INSERT ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts (rowid, title, meta, description)
+        VALUES (new.id, new.title, new.meta, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_searchdocument_fts_delete AFTER DELETE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts (core_searchdocument_fts, rowid, title, meta, description)
+        VALUES ('delete', old.id, old.title, old.meta, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_searchdocument_fts_update AFTER UPDATE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts (core_searchdocument_fts, rowid, title, meta, description)
+        VALUES ('delete', old.id, old.title, old.meta, old.description);
+        INSERT INTO core_searchdocument_fts (rowid, title, meta, description)
+        VALUES (new.id, new.title, new.meta, new.description);
+    END
+    """,
+]
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS core_searchdocument_fts_update',
+    'DROP TRIGGER IF EXISTS core_searchdocument_fts_delete',
+    'DROP TRIGGER IF EXISTS core_searchdocument_fts_insert',
+    'DROP TABLE IF EXISTS core_searchdocument_fts',
+]
+
+# Mirrors the weights of core.search: title A, meta B, description C
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE core_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(meta, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX core_searchdocument_vector_idx ON core_searchdocument USING gin (search_vector)',
+]
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS core_searchdocument_vector_idx',
+    'ALTER TABLE core_searchdocument DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD})
+
+
+def drop_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE})
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0021_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.TextField(blank=True, default='')),
+                ('meta', models.TextField(blank=True, default='')),
+                ('description', models.TextField(blank=True, default='')),
+                ('url', models.CharField(blank=True, default='', max_length=500)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='core_searchdocument_object_unique')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
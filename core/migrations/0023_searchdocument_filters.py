@@ -0,0 +1,54 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# (app label, model, community column, creation time column) of indexed models
+DOCUMENT_SOURCES = [
+    ('core', 'post', 'community_id', 'created_at'),
+    ('core', 'comment', 'post__community_id', 'created_at'),
+    ('core', 'community', 'pk', 'created_at'),
+    ('core', 'profile', None, 'user__date_joined'),
+    ('auth', 'user', None, 'date_joined'),
+]
+
+
+def copy_filter_columns(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    SearchDocument = apps.get_model('core', 'SearchDocument')
+    for app_label, model_name, community, created_at in DOCUMENT_SOURCES:
+        content_type = ContentType.objects.filter(app_label=app_label, model=model_name).first()
+        if content_type is None:
+            continue
+        objects = apps.get_model(app_label, model_name).objects.filter(pk=OuterRef('object_id'))
+        values = {'created_at': Subquery(objects.values(created_at)[:1])}
+        if community:
+            values['community_id'] = Subquery(objects.values(community)[:1])
+        SearchDocument.objects.filter(content_type=content_type).update(**values)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0022_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchdocument',
+            name='community',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.community'),
+        ),
+        migrations.AddField(
+            model_name='searchdocument',
+            name='created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_filter_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=models.Index(fields=['content_type', 'community', 'created_at'], name='core_searchdoc_comm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=models.Index(fields=['content_type', 'created_at'], name='core_searchdoc_created_idx'),
+        ),
+    ]
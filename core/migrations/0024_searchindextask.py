@@ -0,0 +1,27 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0023_searchdocument_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.BigIntegerField()),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['queued_at', 'id'], name='core_searchtask_queued_idx')],
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='core_searchindextask_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+# SQLite rebuilds the table to change its constraint, dropping its triggers,
+# so the triggers that keep the FTS5 table in step are created again after
+searchdocument = import_module('core.migrations.0022_searchdocument')
+FTS_TRIGGERS = searchdocument.SQLITE_FORWARD[1:]
+DROP_FTS_TRIGGERS = searchdocument.SQLITE_REVERSE[:3]
+
+
+def _run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0024_searchindextask'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run_on_sqlite(DROP_FTS_TRIGGERS), _run_on_sqlite(FTS_TRIGGERS)),
+        migrations.CreateModel(
+            name='SearchIndexBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.PositiveIntegerField(unique=True)),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('completed_chunks', models.JSONField(default=dict)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        # Existing documents are generation 0, which stays active until a build finishes
+        migrations.AddField(
+            model_name='searchdocument',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RemoveConstraint(
+            model_name='searchdocument',
+            name='core_searchdocument_object_unique',
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id', 'generation'), name='core_searchdocument_object_unique'),
+        ),
+        migrations.RunPython(_run_on_sqlite(FTS_TRIGGERS), _run_on_sqlite(DROP_FTS_TRIGGERS)),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0025_searchindexbuild'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchindextask',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
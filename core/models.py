@@ -1,14 +1,42 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
 from django_countries.fields import CountryField
 from taggit.managers import TaggableManager
+from taggit.models import Tag
 from mptt.models import MPTTModel, TreeForeignKey
 from payments.models import BasePayment
 import re
+from collections import Counter
+from .voting import record_vote_change, update_comment_count
+from .ranking import set_ranking
+from .tags import adjust_tag_usage
+from .fragments import bump_post_version
+from .communities import adjust_member_count, adjust_post_count
+from .rendering import prepare_rendered_fields, track_rendered_source
+from .page_cache import community_key, purge_post_pages, purge_surrogate_keys
+from .user_cache import invalidate_user_profile
+from .notifications import adjust_unread_count, mark_read, remove_unread, unread_by_recipient
+from .karma import POST_KARMA, COMMENT_KARMA, adjust_karma, comment_karma_by_author, recompute_karma, remove_karma
+
+def exclude_counter_fields(instance, save_kwargs):
+    """
+    Limit an ordinary save() of a loaded instance to its non-counter fields,
+    so counters that other requests moved since it was read aren't reset
+    """
+    if save_kwargs.get('update_fields') is not None or save_kwargs.get('force_insert'):
+        return
+    deferred = instance.get_deferred_fields()
+    save_kwargs['update_fields'] = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key
+        and field.attname not in deferred
+        and field.name not in instance.COUNTER_FIELDS
+    ]
 
 class Profile(models.Model):
     REPUTATION_LEVELS = [
@@ -28,6 +56,8 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(max_length=500, blank=True)
     karma = models.IntegerField(default=0)
+    # Denormalized count of the user's unread notifications
+    unread_notification_count = models.PositiveIntegerField(default=0, editable=False)
     country = CountryField(blank=True, null=True)
     website = models.URLField(blank=True, null=True)
     avatar = models.ImageField(upload_to=avatar_upload_path, blank=True, null=True)
@@ -39,39 +69,26 @@ class Profile(models.Model):
     
     def __str__(self):
         return f'{self.user.username} Profile'
+    
+    # Running totals that are only ever changed with atomic UPDATEs
+    COUNTER_FIELDS = ('karma', 'unread_notification_count')
+    
+    def save(self, *args, **kwargs):
+        """
+        Saving a loaded profile must not write back counters that may have
+        moved since it was read, so they are left out of ordinary updates
+        """
+        if not self._state.adding:
+            exclude_counter_fields(self, kwargs)
+        super().save(*args, **kwargs)
         
     def update_karma(self):
-        """Calculate and update karma based on post and comment votes"""
-        # Get points from posts (1 point per upvote, -1 per downvote)
-        post_upvotes = sum([
-            post.votes.filter(value=1).count() for post in self.user.posts.all()
-        ])
-        post_downvotes = sum([
-            post.votes.filter(value=-1).count() for post in self.user.posts.all()
-        ])
-        
-        # Get points from comments (1 point per upvote, -1 per downvote)
-        comment_upvotes = sum([
-            comment.votes.filter(value=1).count() for comment in self.user.comments.all()
-        ])
-        comment_downvotes = sum([
-            comment.votes.filter(value=-1).count() for comment in self.user.comments.all()
-        ])
-        
-        # Post creation bonus (2 points per post)
-        post_creation_karma = self.user.posts.count() * 2
-        
-        # Comment creation bonus (1 point per comment)
-        comment_creation_karma = self.user.comments.count() * 1
-        
-        # Calculate total karma
-        self.karma = (post_upvotes - post_downvotes) + (comment_upvotes - comment_downvotes) + post_creation_karma + comment_creation_karma
-        
-        # Ensure karma is never negative for new users
-        if self.karma < 0 and self.user.date_joined.date() > (timezone.now().date() - timezone.timedelta(days=30)):
-            self.karma = 0
-            
-        self.save()
+        """
+        Recalculate karma from scratch. Karma is normally kept up to date
+        incrementally; this repairs a single profile that has drifted.
+        """
+        recompute_karma(Profile.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=['karma'])
         
     def get_reputation_level(self):
         """Return the user's reputation level based on karma"""
@@ -114,14 +131,31 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    # Logins only save last_login, which changes nothing on the profile
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
     instance.profile.save()
 
+# Drop the navbar's cached copy of a profile when it changes
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    invalidate_user_profile(instance.user_id)
+
 class Community(models.Model):
     name = models.CharField(max_length=50, unique=True)
     description = models.TextField(max_length=500)
     members = models.ManyToManyField(User, related_name='communities')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Moved by saves and counter updates; used for conditional GETs (core.conditional)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counts, maintained by core.communities
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    # Running totals that are only ever changed with atomic UPDATEs
+    COUNTER_FIELDS = ('member_count', 'post_count')
     
     def __str__(self):
         return self.name
@@ -129,8 +163,68 @@ class Community(models.Model):
     def get_absolute_url(self):
         return reverse('community_detail', kwargs={'pk': self.pk})
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            exclude_counter_fields(self, kwargs)
+        super().save(*args, **kwargs)
+        purge_surrogate_keys(community_key(self.pk))
+    
     class Meta:
         verbose_name_plural = "Communities"
+        indexes = [
+            # Community directory sorted by size
+            models.Index(fields=['-member_count', '-id'], name='core_community_members_idx'),
+            models.Index(fields=['-post_count', '-id'], name='core_community_posts_idx'),
+        ]
+
+@receiver(m2m_changed, sender=Community.members.through)
+def update_member_count(sender, instance, action, pk_set, **kwargs):
+    """
+    Keep Community.member_count in step as users join and leave, and purge
+    the community pages, which show the count
+    """
+    memberships = Community.members.through.objects
+    if isinstance(instance, Community):
+        community_ids = [instance.pk]
+        lookup = {'community': instance}
+        related = 'user_id'
+    else:
+        # Changed from the user's side; pk_set holds the communities
+        community_ids = list(pk_set or ())
+        lookup = {'user': instance}
+        related = 'community_id'
+    
+    if action in ('pre_remove', 'pre_clear'):
+        # remove() is given ids that may not be members, and clear() doesn't
+        # say who it removes, so remember the memberships that really go
+        removed = memberships.filter(**lookup)
+        if action == 'pre_remove':
+            removed = removed.filter(**{f'{related}__in': pk_set})
+        instance._removed_memberships = list(removed.values_list('community_id', flat=True))
+        return
+    
+    if action == 'post_add':
+        if isinstance(instance, Community):
+            adjust_member_count(community_ids, len(pk_set))
+        else:
+            adjust_member_count(community_ids, 1)
+    elif action in ('post_remove', 'post_clear'):
+        removed = Counter(getattr(instance, '_removed_memberships', []))
+        instance._removed_memberships = []
+        community_ids = list(removed)
+        for community_id, count in removed.items():
+            adjust_member_count([community_id], -count)
+    else:
+        return
+    
+    purge_surrogate_keys(*[community_key(pk) for pk in community_ids])
+
+@receiver(pre_delete, sender=User)
+def remove_deleted_member(sender, instance, **kwargs):
+    """A deleted user's memberships are cascaded away without m2m signals"""
+    community_ids = list(instance.communities.values_list('pk', flat=True))
+    adjust_member_count(community_ids, -1)
+    purge_surrogate_keys(*[community_key(pk) for pk in community_ids])
 
 class Post(models.Model):
     POST_TYPE_CHOICES = [
@@ -140,19 +234,47 @@ class Post(models.Model):
     
     title = models.CharField(max_length=200)
     content = models.TextField(blank=True, null=True)
+    # Rendered from content on save (see core.rendering)
+    content_html = models.TextField(blank=True, default='', editable=False)
+    excerpt = models.TextField(blank=True, default='', editable=False)
+    excerpt_html = models.TextField(blank=True, default='', editable=False)
     url = models.URLField(blank=True, null=True)
     post_type = models.CharField(max_length=4, choices=POST_TYPE_CHOICES, default='text')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Moved by saves and counter updates; used for conditional GETs (core.conditional)
+    updated_at = models.DateTimeField(auto_now=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     community = models.ForeignKey(Community, on_delete=models.CASCADE, related_name='posts')
     tags = TaggableManager(blank=True, help_text="A comma-separated list of tags.")
     # Denormalized vote counts (Reddit-style)
     upvote_count = models.PositiveIntegerField(default=0)
     downvote_count = models.PositiveIntegerField(default=0)
+    # Denormalized comment count, maintained by Comment.save()/Comment.delete()
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Precomputed sort keys, maintained by the ranking engine (core.ranking)
+    score = models.IntegerField(default=0, editable=False)
+    hot_score = models.FloatField(default=0, editable=False)
+    controversy_score = models.FloatField(default=0, editable=False)
+    rising_score = models.FloatField(default=0, editable=False)
+    # Bumped whenever the cached post card goes stale (see core.fragments)
+    cache_version = models.PositiveIntegerField(default=1, editable=False)
+    
+    # Running totals that are only ever changed with atomic UPDATEs
+    COUNTER_FIELDS = (
+        'upvote_count', 'downvote_count', 'comment_count',
+        'score', 'hot_score', 'controversy_score', 'rising_score', 'cache_version',
+    )
+    RENDERED_FIELDS = ('content_html', 'excerpt', 'excerpt_html')
     
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        track_rendered_source(instance)
+        return instance
+    
     def get_absolute_url(self):
         return reverse('post_detail', kwargs={'pk': self.pk})
     
@@ -162,27 +284,145 @@ class Post(models.Model):
         Reddit-style vote count using denormalized fields
         """
         return self.upvote_count - self.downvote_count
-        
-    @property
-    def comment_count(self):
-        return self.comments.count()
+    
+    def save(self, *args, **kwargs):
+        """
+        When a new post is saved, give it its initial ranking and award its
+        author the post karma bonus. Saving an existing post leaves its
+        counters alone and invalidates its cached card. The body is
+        rendered again whenever it changes.
+        """
+        with transaction.atomic():
+            adding = self._state.adding
+            if adding:
+                set_ranking(self)
+            else:
+                exclude_counter_fields(self, kwargs)
+            prepare_rendered_fields(self, kwargs)
+            super().save(*args, **kwargs)
+            if adding:
+                adjust_karma(self.author_id, POST_KARMA)
+            else:
+                bump_post_version([self.pk])
+                self.cache_version += 1
+            purge_post_pages(self.pk, self.community_id, listed=adding)
+    
+    def delete(self, *args, **kwargs):
+        """
+        Take back the karma earned by the post and by every comment on it,
+        which are removed along with it, release the post's tags and
+        uncount the unread notifications about them
+        """
+        with transaction.atomic():
+            karma = comment_karma_by_author(self.comments.all())
+            unread = unread_by_recipient(
+                Notification.objects.filter(models.Q(post=self) | models.Q(comment__post=self))
+            )
+            score = Post.objects.filter(pk=self.pk).values_list('upvote_count', 'downvote_count').first()
+            tag_ids = list(self.tags.values_list('id', flat=True))
+            result = super().delete(*args, **kwargs)
+            if score is not None:
+                karma[self.author_id] += score[0] - score[1] + POST_KARMA
+                remove_karma(karma)
+                remove_unread(unread)
+                adjust_tag_usage(tag_ids, -1)
+                purge_post_pages(self.pk, self.community_id, listed=True)
+        return result
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-comment_count'], name='core_post_comment_count_idx'),
+            # One index per sort mode, site-wide and per community
+            models.Index(fields=['-hot_score', '-id'], name='core_post_hot_idx'),
+            models.Index(fields=['community', '-hot_score', '-id'], name='core_post_comm_hot_idx'),
+            models.Index(fields=['-created_at', '-id'], name='core_post_new_idx'),
+            models.Index(fields=['community', '-created_at', '-id'], name='core_post_comm_new_idx'),
+            models.Index(fields=['-score', '-id'], name='core_post_top_idx'),
+            models.Index(fields=['community', '-score', '-id'], name='core_post_comm_top_idx'),
+            models.Index(fields=['-rising_score', '-id'], name='core_post_rising_idx'),
+            models.Index(fields=['community', '-rising_score', '-id'], name='core_post_comm_rising_idx'),
+            models.Index(fields=['-controversy_score', '-id'], name='core_post_controversy_idx'),
+            models.Index(fields=['community', '-controversy_score', '-id'], name='core_post_comm_controversy_idx'),
+            # Profile post list
+            models.Index(fields=['author', '-created_at', '-id'], name='core_post_author_new_idx'),
+            # Latest change in a community, for its page's validators
+            models.Index(fields=['community', '-updated_at'], name='core_post_comm_updated_idx'),
+        ]
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def update_tag_usage(sender, instance, action, pk_set, **kwargs):
+    """Keep TagUsage in step as tags are added to and removed from posts"""
+    # Profile interests share the same through table; only posts count
+    if not isinstance(instance, Post):
+        return
+    
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_post_version([instance.pk])
+        purge_post_pages(instance.pk)
+    
+    if action == 'post_add':
+        adjust_tag_usage(pk_set, 1)
+    elif action == 'post_remove':
+        adjust_tag_usage(pk_set, -1)
+    elif action == 'pre_clear':
+        # clear() doesn't say which tags it removes, so remember them first
+        instance._cleared_tag_ids = list(instance.tags.values_list('id', flat=True))
+    elif action == 'post_clear':
+        adjust_tag_usage(getattr(instance, '_cleared_tag_ids', []), -1)
+        instance._cleared_tag_ids = []
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        adjust_post_count([instance.community_id], 1)
+
+@receiver(post_delete, sender=Post)
+def uncount_deleted_post(sender, instance, **kwargs):
+    # Also sent for posts removed by cascades, e.g. when their author is deleted
+    adjust_post_count([instance.community_id], -1)
+
+class TagUsage(models.Model):
+    """Number of posts using each tag, maintained by core.tags"""
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='usage')
+    post_count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f'{self.tag.name}: {self.post_count} posts'
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-post_count'], name='core_tagusage_post_count_idx'),
+        ]
 
 class Comment(MPTTModel):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
+    # Rendered from content on save (see core.rendering)
+    content_html = models.TextField(blank=True, default='', editable=False)
+    excerpt = models.TextField(blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Moved by saves and counter updates; used for conditional GETs (core.conditional)
+    updated_at = models.DateTimeField(auto_now=True)
     parent = TreeForeignKey('self', null=True, blank=True, related_name='children', on_delete=models.CASCADE)
     # Denormalized vote counts (Reddit-style)
     upvote_count = models.PositiveIntegerField(default=0)
     downvote_count = models.PositiveIntegerField(default=0)
     
+    # Running totals that are only ever changed with atomic UPDATEs
+    COUNTER_FIELDS = ('upvote_count', 'downvote_count')
+    RENDERED_FIELDS = ('content_html', 'excerpt')
+    
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        track_rendered_source(instance)
+        return instance
+    
     @property
     def vote_count(self):
         """
@@ -190,11 +430,73 @@ class Comment(MPTTModel):
         """
         return self.upvote_count - self.downvote_count
     
+    def save(self, *args, **kwargs):
+        """
+        When a new comment is saved, atomically increment the post's comment
+        count. Saving an existing comment leaves its counters alone, and its
+        tree fields too unless it moves. The body is rendered again whenever
+        it changes.
+        """
+        with transaction.atomic():
+            adding = self._state.adding
+            if not adding and kwargs.get('update_fields') is None:
+                exclude_counter_fields(self, kwargs)
+                opts = self._mptt_meta
+                moves = any(
+                    value != opts.get_raw_field_value(self, name)
+                    for name, value in self._mptt_cached_fields.items()
+                )
+                if kwargs.get('update_fields') is not None and not moves:
+                    # As MPTTModel.save() does for a node that stays put: replies
+                    # added since this instance was read have moved its edges
+                    tree_fields = (opts.left_attr, opts.right_attr, opts.tree_id_attr, opts.level_attr)
+                    kwargs['update_fields'] = [name for name in kwargs['update_fields'] if name not in tree_fields]
+            prepare_rendered_fields(self, kwargs)
+            super().save(*args, **kwargs)
+            if adding:
+                update_comment_count(self, 1)
+                adjust_karma(self.author_id, COMMENT_KARMA)
+            purge_post_pages(self.post_id)
+    
+    def delete(self, *args, **kwargs):
+        """
+        Deleting a comment also deletes its whole MPTT subtree, so decrement the
+        post's comment count by the number of comments actually removed, take
+        back the karma their authors earned from them and uncount the unread
+        notifications about them
+        """
+        with transaction.atomic():
+            # Read the subtree bounds from the database; they may have moved
+            # since this instance was loaded
+            bounds = Comment.objects.filter(pk=self.pk).values_list('tree_id', 'lft', 'rght').first()
+            karma = Counter()
+            unread = Counter()
+            if bounds is not None:
+                tree_id, lft, rght = bounds
+                subtree = Comment.objects.filter(tree_id=tree_id, lft__gte=lft, rght__lte=rght)
+                karma = comment_karma_by_author(subtree)
+                unread = unread_by_recipient(Notification.objects.filter(comment__in=subtree))
+            deleted, rows = super().delete(*args, **kwargs)
+            removed = rows.get(Comment._meta.label, 0)
+            if removed:
+                update_comment_count(self, -removed)
+                remove_karma(karma)
+                remove_unread(unread)
+                purge_post_pages(self.post_id)
+        return deleted, rows
+    
     class MPTTMeta:
         order_insertion_by = ['created_at']
     
     class Meta:
         ordering = ['tree_id', 'lft']
+        indexes = [
+            # Keyset pagination of the comment API and profile comment list
+            models.Index(fields=['-created_at', '-id'], name='core_comment_new_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='core_comment_author_new_idx'),
+            # Latest change to a post's comments, for its page's validators
+            models.Index(fields=['post', '-updated_at'], name='core_comment_post_updated_idx'),
+        ]
 
 class Vote(models.Model):
     VOTE_CHOICES = [
@@ -215,92 +517,34 @@ class Vote(models.Model):
     def save(self, *args, **kwargs):
         """
         Reddit-style vote processing:
-        When a vote is saved or updated, immediately update the denormalized count
-        on the target object (post or comment)
+        When a vote is saved or updated, atomically apply the change to the
+        denormalized counts on the target object (post or comment)
         """
-        # Check if this is a new vote being created
-        is_new = self.pk is None
-        
-        # If updating an existing vote, store the old value
-        old_value = None
-        if not is_new:
-            try:
-                old_vote = Vote.objects.get(pk=self.pk)
-                old_value = old_vote.value
-            except Vote.DoesNotExist:
-                pass
-                
-        # Call the parent save method to save the vote itself
-        super().save(*args, **kwargs)
-        
-        # Update denormalized counts on the target
-        if self.post:
-            if is_new:
-                # New vote
-                if self.value == 1:
-                    self.post.upvote_count += 1
-                else:
-                    self.post.downvote_count += 1
-            elif old_value != self.value:
-                # Changed vote (e.g., upvote -> downvote)
-                if old_value == 1 and self.value == -1:
-                    # Ensure positive integer fields don't go negative
-                    self.post.upvote_count = max(0, self.post.upvote_count - 1)
-                    self.post.downvote_count += 1
-                elif old_value == -1 and self.value == 1:
-                    # Ensure positive integer fields don't go negative
-                    self.post.downvote_count = max(0, self.post.downvote_count - 1)
-                    self.post.upvote_count += 1
-            
-            self.post.save(update_fields=['upvote_count', 'downvote_count'])
-            
-        elif self.comment:
-            if is_new:
-                # New vote
-                if self.value == 1:
-                    self.comment.upvote_count += 1
-                else:
-                    self.comment.downvote_count += 1
-            elif old_value != self.value:
-                # Changed vote (e.g., upvote -> downvote)
-                if old_value == 1 and self.value == -1:
-                    # Ensure positive integer fields don't go negative
-                    self.comment.upvote_count = max(0, self.comment.upvote_count - 1)
-                    self.comment.downvote_count += 1
-                elif old_value == -1 and self.value == 1:
-                    # Ensure positive integer fields don't go negative
-                    self.comment.downvote_count = max(0, self.comment.downvote_count - 1)
-                    self.comment.upvote_count += 1
-            
-            self.comment.save(update_fields=['upvote_count', 'downvote_count'])
-    
+        with transaction.atomic():
+            if self._state.adding:
+                super().save(*args, **kwargs)
+                record_vote_change(self, None, self.value)
+                return
+
+            # Votes are either 1 or -1, so if the stored value differs from ours
+            # the vote is being flipped. The conditional UPDATE tells us that
+            # without reading the old row first.
+            changed = Vote.objects.filter(pk=self.pk).exclude(value=self.value).update(value=self.value)
+            super().save(*args, **kwargs)
+            if changed:
+                record_vote_change(self, -self.value, self.value)
+
     def delete(self, *args, **kwargs):
         """
-        When a vote is deleted, update the denormalized counts on the target
+        When a vote is deleted, atomically update the denormalized counts on the target
         """
-        # Store references before deletion
-        post = self.post
-        comment = self.comment
-        value = self.value
-        
-        # Call the parent delete method
-        super().delete(*args, **kwargs)
-        
-        # Update denormalized counts
-        if post:
-            if value == 1:
-                post.upvote_count = max(0, post.upvote_count - 1)  # Ensure non-negative
-            else:
-                post.downvote_count = max(0, post.downvote_count - 1)
-            post.save(update_fields=['upvote_count', 'downvote_count'])
-            
-        elif comment:
-            if value == 1:
-                comment.upvote_count = max(0, comment.upvote_count - 1)
-            else:
-                comment.downvote_count = max(0, comment.downvote_count - 1)
-            comment.save(update_fields=['upvote_count', 'downvote_count'])
-    
+        with transaction.atomic():
+            deleted, rows = super().delete(*args, **kwargs)
+            # Only decrement if this call actually removed the row
+            if deleted:
+                record_vote_change(self, self.value, None)
+        return deleted, rows
+
     class Meta:
         # Ensure a user can only vote once on a post or comment
         constraints = [
@@ -327,13 +571,32 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='core_notif_recipient_new_idx'),
+        ]
         
     def __str__(self):
         return f'Notification for {self.recipient.username}: {self.text}'
     
+    def save(self, *args, **kwargs):
+        """Count a new unread notification against its recipient"""
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding and not self.is_read:
+                adjust_unread_count(self.recipient_id, 1)
+    
+    def delete(self, *args, **kwargs):
+        """Uncount the notification if it was still unread"""
+        with transaction.atomic():
+            unread = Notification.objects.filter(pk=self.pk, is_read=False).exists()
+            result = super().delete(*args, **kwargs)
+            if unread:
+                adjust_unread_count(self.recipient_id, -1)
+        return result
+    
     def mark_as_read(self):
-        self.is_read = True
-        self.save()
+        mark_read(self)
         
     @classmethod
     def create_reply_notification(cls, comment):
@@ -439,6 +702,81 @@ class Notification(models.Model):
             
         return None
 
+class SearchDocument(models.Model):
+    """
+    The searchable text of one indexed object, written by core.search. The
+    database's full-text index over these rows (an FTS5 table on SQLite, a
+    tsvector column on PostgreSQL) is created in the migration.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.BigIntegerField()
+    # The SearchIndexBuild that wrote the document; only the active one is searched
+    generation = models.PositiveIntegerField(default=0)
+    # Weighted from highest to lowest
+    title = models.TextField(blank=True, default='')
+    meta = models.TextField(blank=True, default='')
+    description = models.TextField(blank=True, default='')
+    url = models.CharField(max_length=500, blank=True, default='')
+    # Filter columns of advanced search, copied from the indexed object
+    community = models.ForeignKey(Community, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return self.title
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id', 'generation'], name='core_searchdocument_object_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['content_type', 'community', 'created_at'], name='core_searchdoc_comm_idx'),
+            models.Index(fields=['content_type', 'created_at'], name='core_searchdoc_created_idx'),
+        ]
+
+class SearchIndexBuild(models.Model):
+    """
+    A full rebuild of the search index (rebuild_search_index). It writes a
+    new generation of documents while searches keep reading the generation
+    of the latest finished build, and is swapped in by being finished.
+    """
+    generation = models.PositiveIntegerField(unique=True)
+    # Objects are indexed in primary-key ranges of this size
+    chunk_size = models.PositiveIntegerField()
+    # First pk of every range written so far, by model label; what a resumed build skips
+    completed_chunks = models.JSONField(default=dict)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f'Search index generation {self.generation}'
+
+class SearchIndexTask(models.Model):
+    """
+    An object waiting to be indexed again (or removed from the index, if it
+    no longer exists) by the process_search_queue worker; see core.search.
+    There is one row per object, however often it changes while waiting.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.BigIntegerField()
+    # When the object first changed after it was last indexed; the queue's lag
+    queued_at = models.DateTimeField(default=timezone.now)
+    # When it last changed
+    updated_at = models.DateTimeField(default=timezone.now)
+    # Bumped by every change; tasks changed while the worker runs stay queued
+    version = models.PositiveIntegerField(default=1)
+    
+    def __str__(self):
+        return f'{self.content_type} {self.object_id}'
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='core_searchindextask_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['queued_at', 'id'], name='core_searchtask_queued_idx'),
+        ]
+
 class Payment(BasePayment):
     DONATION_LEVELS = [
         (5, 'Small ($5)'),
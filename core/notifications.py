@@ -0,0 +1,100 @@
+"""
+Unread notification counter.
+
+Each user's number of unread notifications is stored on
+Profile.unread_notification_count and adjusted with atomic UPDATEs when a
+notification is created, read or deleted, so the navbar badge never COUNTs
+the notifications table. Notifications are marked read with a conditional
+``UPDATE ... WHERE is_read = false`` and the counter is decremented by the
+number of rows that actually changed, so concurrent reads of the same
+notification only decrement once. recompute_unread_counts() repairs drift.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .user_cache import invalidate_unread_notification_count
+
+
+def adjust_unread_count(user_id, delta):
+    """Atomically add delta to the unread notification count of a user, never below zero"""
+    from .models import Profile
+
+    if not delta or user_id is None:
+        return 0
+    if delta > 0:
+        expression = F('unread_notification_count') + delta
+    else:
+        expression = Greatest(F('unread_notification_count') + delta, 0)
+    updated = Profile.objects.filter(user_id=user_id).update(unread_notification_count=expression)
+    invalidate_unread_notification_count(user_id)
+    return updated
+
+
+def mark_read(notification):
+    """Mark one notification as read. Returns True if it was unread."""
+    from .models import Notification
+
+    with transaction.atomic():
+        changed = Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True)
+        if changed:
+            adjust_unread_count(notification.recipient_id, -1)
+    notification.is_read = True
+    return bool(changed)
+
+
+def mark_all_read(user_id):
+    """Mark every notification of a user as read. Returns how many were unread."""
+    from .models import Notification
+
+    with transaction.atomic():
+        changed = Notification.objects.filter(recipient_id=user_id, is_read=False).update(is_read=True)
+        adjust_unread_count(user_id, -changed)
+    return changed
+
+
+def unread_by_recipient(notifications):
+    """Return a Counter of {recipient_id: unread notifications} in the queryset"""
+    rows = notifications.filter(is_read=False)\
+        .order_by()\
+        .values('recipient_id')\
+        .annotate(total=Count('pk'))\
+        .values_list('recipient_id', 'total')
+    return Counter(dict(rows))
+
+
+def remove_unread(unread):
+    """Take back the counts in a {user_id: unread} mapping, one UPDATE per user"""
+    for user_id, count in unread.items():
+        adjust_unread_count(user_id, -count)
+
+
+def unread_count_expression():
+    """Expression counting each profile's unread notifications, for Profile querysets"""
+    from .models import Notification
+
+    unread = Notification.objects.filter(recipient=OuterRef('user_id'), is_read=False)\
+        .order_by()\
+        .values('recipient')\
+        .annotate(total=Count('pk'))\
+        .values('total')
+    return Coalesce(Subquery(unread, output_field=IntegerField()), 0)
+
+
+def recompute_unread_counts(profiles=None):
+    """
+    Rebuild the stored unread counts of profiles (all profiles by default)
+    with a single UPDATE. Returns the number of profiles that changed.
+    """
+    from .models import Profile
+
+    if profiles is None:
+        profiles = Profile.objects.all()
+    actual = unread_count_expression()
+    changed = list(profiles.exclude(unread_notification_count=actual).values_list('user_id', flat=True))
+    profiles.filter(user_id__in=changed).update(unread_notification_count=actual)
+    for user_id in changed:
+        invalidate_unread_notification_count(user_id)
+    return len(changed)
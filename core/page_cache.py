@@ -0,0 +1,191 @@
+"""
+Full-page cache for anonymous readers.
+
+Views decorated with cache_anonymous_page store their whole response in the
+shared cache for logged-out GET requests. While rendering, a view tags the
+page with surrogate keys naming what it shows (add_surrogate_keys): "home",
+"community:<id>", "post:<id>". Writes purge the keys they affect
+(purge_surrogate_keys), which stamps each key with the time of the purge;
+a cached page is only current if it was rendered after the last purge of
+every one of its keys.
+
+Pages are fresh for PAGE_CACHE_TIMEOUT seconds and kept for another
+PAGE_CACHE_STALE seconds after that. Once a page is expired or purged, the
+first request to take the regeneration lock re-renders it, while concurrent
+requests keep getting the stale copy instead of all hitting the database
+(stale-while-revalidate with single-flight regeneration).
+
+Every page carries a CSRF token, which is only valid with the visitor's own
+CSRF cookie. Stored pages hold a placeholder instead, and each visitor gets
+a token of their own filled in when the page is served. Responses that set
+a cookie of their own (a session, say) are not stored.
+
+Responses are tagged with a Surrogate-Key header so a CDN in front of the
+site can use the same keys, and with X-Page-Cache (HIT, STALE or MISS).
+"""
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.http import HttpResponse
+
+PAGE_CACHE_TIMEOUT = 60
+PAGE_CACHE_STALE = 5 * 60
+LOCK_TIMEOUT = 30
+
+HOME_KEY = 'home'
+
+# Headers that belong to one visitor and must not be replayed to others
+PRIVATE_HEADERS = {'set-cookie', 'vary'}
+
+# CSRF tokens rendered by {% csrf_token %} and the csrf-token meta tag
+CSRF_TOKEN_RE = re.compile(rb'(name="csrfmiddlewaretoken" value="|name="csrf-token" content=")[A-Za-z0-9]+(")')
+CSRF_PLACEHOLDER = b'__csrf_token__'
+
+
+def post_key(post_id):
+    return f'post:{post_id}'
+
+
+def community_key(community_id):
+    return f'community:{community_id}'
+
+
+def _purge_time_key(surrogate_key):
+    return f'core:surrogate:{surrogate_key}'
+
+
+def page_cache_key(request):
+    """Cache key of the page for request's absolute URL"""
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'core:page:{url}'
+
+
+def add_surrogate_keys(request, *keys):
+    """Tag the page being rendered for request with surrogate keys"""
+    if not hasattr(request, '_surrogate_keys'):
+        request._surrogate_keys = set()
+    request._surrogate_keys.update(keys)
+
+
+def purge_surrogate_keys(*keys):
+    """Mark every cached page tagged with one of keys as stale, once the transaction commits"""
+    keys = [key for key in keys if key]
+    if not keys:
+        return
+
+    def purge():
+        now = time.time_ns()
+        cache.set_many({_purge_time_key(key): now for key in keys}, timeout=None)
+
+    transaction.on_commit(purge)
+
+
+def purge_post_pages(post_id, community_id=None, listed=False):
+    """
+    Purge the pages showing a post. listed means the post was added to or
+    removed from the lists, so the home and community pages are purged too.
+    """
+    keys = [post_key(post_id)]
+    if listed:
+        keys += [HOME_KEY, community_key(community_id)]
+    purge_surrogate_keys(*keys)
+
+
+def _is_current(entry, now):
+    if entry['expires'] < now:
+        return False
+    purged = cache.get_many([_purge_time_key(key) for key in entry['keys']])
+    # A key with no purge time was evicted, so its last purge is unknown
+    return all(
+        purged.get(_purge_time_key(key), entry['rendered_at']) < entry['rendered_at']
+        for key in entry['keys']
+    )
+
+
+def _store(page_key, response, keys, rendered_at):
+    # Keys with no purge time count as purged just before this render, so a
+    # page rendered before a purge time was lost to eviction is never current
+    for key in keys:
+        cache.add(_purge_time_key(key), rendered_at - 1, timeout=None)
+
+    entry = {
+        'content': CSRF_TOKEN_RE.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content),
+        'status': response.status_code,
+        'headers': [(name, value) for name, value in response.items() if name.lower() not in PRIVATE_HEADERS],
+        'keys': sorted(keys),
+        'rendered_at': rendered_at,
+        'expires': time.time() + PAGE_CACHE_TIMEOUT,
+    }
+    cache.set(page_key, entry, PAGE_CACHE_TIMEOUT + PAGE_CACHE_STALE)
+
+
+def _cached_response(request, entry, status):
+    # get_token() also has CsrfViewMiddleware set the cookie the token needs
+    content = entry['content'].replace(CSRF_PLACEHOLDER, get_token(request).encode())
+    response = HttpResponse(content, status=entry['status'])
+    for name, value in entry['headers']:
+        response[name] = value
+    response['X-Page-Cache'] = status
+    return response
+
+
+def is_cacheable_request(request):
+    """Whether request is an anonymous read that may get a shared copy of the page"""
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+def _is_cacheable_response(request, response):
+    return (
+        request.method == 'GET'
+        and response.status_code == 200
+        and not response.streaming
+        and not response.has_header('Cache-Control')
+        and not response.cookies
+        and not len(get_messages(request))
+        and getattr(request, '_surrogate_keys', None)
+    )
+
+
+def cache_anonymous_page(view):
+    """Serve anonymous GET requests for view from the full-page cache"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            return view(request, *args, **kwargs)
+
+        page_key = page_cache_key(request)
+        lock_key = f'{page_key}:lock'
+        entry = cache.get(page_key)
+        locked = False
+        if entry is not None:
+            if _is_current(entry, time.time()):
+                return _cached_response(request, entry, 'HIT')
+            # Only one request regenerates an expired page; the rest get the stale copy
+            locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+            if not locked:
+                return _cached_response(request, entry, 'STALE')
+
+        try:
+            rendered_at = time.time_ns()
+            response = view(request, *args, **kwargs)
+            if _is_cacheable_response(request, response):
+                keys = request._surrogate_keys
+                response['Surrogate-Key'] = ' '.join(sorted(keys))
+                _store(page_key, response, keys, rendered_at)
+                response['X-Page-Cache'] = 'MISS'
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        return response
+
+    return wrapper
@@ -0,0 +1,135 @@
+"""
+Keyset (cursor) pagination shared by the list views.
+
+Instead of OFFSET and a COUNT(*) of the whole list, each page remembers the
+sort key of its last row and the next page is fetched with
+``WHERE (key, id) < (last_key, last_id) ... LIMIT n``, which is an index scan
+of constant cost however deep the reader scrolls.
+"""
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+from el_pagination.settings import PER_PAGE
+
+CURSOR_SALT = 'core.pagination'
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated list.
+
+    object_list holds the rows of the page; next_cursor, if set, is the
+    opaque cursor to pass back to fetch the following page.
+    """
+
+    def __init__(self, object_list, next_cursor=None, cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+
+def _ordering(queryset):
+    """
+    Return the queryset's ordering as (field_name, descending) pairs. The last
+    field must be the primary key so every row has a distinct position.
+    """
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    fields = []
+    for name in ordering:
+        if not isinstance(name, str) or name.startswith('?'):
+            raise ValueError('Keyset pagination needs a plain field ordering')
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        fields.append(('pk' if name == queryset.model._meta.pk.name else name, descending))
+
+    if not fields or fields[-1][0] != 'pk':
+        descending = fields[-1][1] if fields else True
+        fields.append(('pk', descending))
+    return fields
+
+
+def _field_value(model, name, value):
+    """Convert a JSON-decoded cursor value back to the field's Python type"""
+    field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+    return field.to_python(value)
+
+
+def _after(ordering, values):
+    """Build the filter for rows that sort strictly after the given values"""
+    condition = Q()
+    for i, (name, descending) in enumerate(ordering):
+        lookup = f'{name}__lt' if descending else f'{name}__gt'
+        equal = {prior: values[j] for j, (prior, _) in enumerate(ordering[:i])}
+        condition |= Q(**equal, **{lookup: values[i]})
+
+    # Redundant inclusive bound on the leading key so the database can start
+    # an index range scan there instead of evaluating the OR for every row
+    name, descending = ordering[0]
+    return Q(**{f'{name}__lte' if descending else f'{name}__gte': values[0]}) & condition
+
+
+def make_cursor(ordering, obj):
+    """Encode the sort key of obj as an opaque cursor"""
+    values = []
+    for name, _ in ordering:
+        value = getattr(obj, name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    return signing.dumps(values, salt=CURSOR_SALT)
+
+
+def read_cursor(cursor):
+    """Decode a cursor made by make_cursor, raising Http404 if it was tampered with"""
+    try:
+        return signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise Http404('Invalid page cursor')
+
+
+def keyset_paginate(queryset, cursor=None, per_page=PER_PAGE):
+    """
+    Return the KeysetPage of an ordered queryset that starts after cursor
+    (or the first page when cursor is None).
+    """
+    ordering = _ordering(queryset)
+    queryset = queryset.order_by(*[('-' if desc else '') + name for name, desc in ordering])
+
+    if cursor:
+        values = read_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise Http404('Invalid page cursor')
+        try:
+            values = [_field_value(queryset.model, name, value) for (name, _), value in zip(ordering, values)]
+        except (ValidationError, TypeError):
+            raise Http404('Invalid page cursor')
+        queryset = queryset.filter(_after(ordering, values))
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = make_cursor(ordering, rows[-1])
+
+    return KeysetPage(rows, next_cursor=next_cursor, cursor=cursor)
+
+
+def paginate_request(request, queryset, per_page=PER_PAGE, cursor_param='cursor'):
+    """Paginate queryset from the cursor in request's cursor_param query parameter"""
+    return keyset_paginate(queryset, cursor=request.GET.get(cursor_param), per_page=per_page)
@@ -0,0 +1,299 @@
+"""
+ORM query cache.
+
+Querysets of the models named in settings.QUERY_CACHE can have their results
+cached in a Django cache backend (settings.QUERY_CACHE_ALIAS). The backend
+must be shared by every process (Redis, memcached, files, a database
+table): invalidations are written to it, so with a per-process backend such
+as locmem, other processes would keep serving stale rows. install() does
+nothing then, and the core.W001 check says why.
+
+- ops 'get': every single-object get() on the model's managers, which also
+  covers get_object_or_404()
+- ops 'fetch': every evaluated queryset
+- ``queryset.cache()`` / ``queryset.nocache()`` opt a queryset in or out
+
+Only the managers declared on the model use caching querysets: the base
+manager, behind foreign key access and refresh_from_db(), and related
+managers always read the database.
+
+Invalidation is by table. Each table has a generation stamp in the cache and
+the key of a cached result includes the stamps of every table its SQL reads.
+A database execute wrapper watches all INSERT/UPDATE/DELETE statements, so
+save(), delete(), queryset update()/delete(), bulk operations, cascades and
+raw SQL all bump the stamps of the tables they write. Stamps are bumped when
+the statement runs, so the writer never reads its own stale results, and
+again on commit, so nothing another process cached in between survives.
+Results read inside a transaction are not stored, since they may include
+writes that are later rolled back.
+
+stats() reports hits and misses per model, counted in the cache by every
+process; manage.py query_cache_stats shows them.
+"""
+import hashlib
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+
+from .checks import is_shared_cache
+
+KEY_PREFIX = 'core:qc'
+DEFAULT_TIMEOUT = 60 * 60
+
+# Tables read by a SELECT, including its joins and subqueries
+READ_TABLES = re.compile(r'\b(?:FROM|JOIN)\s+["`\[]?(\w+)', re.IGNORECASE)
+# Table written by an INSERT, UPDATE, DELETE or REPLACE
+WRITE_TABLE = re.compile(
+    r'^\s*(?:UPDATE|DELETE\s+FROM|REPLACE\s+INTO|INSERT\s+(?:OR\s+\w+\s+)?INTO)\s+["`\[]?(\w+)',
+    re.IGNORECASE,
+)
+TRUNCATE = re.compile(r'^\s*TRUNCATE\b', re.IGNORECASE)
+QUOTED_NAME = re.compile(r'["`\[](\w+)')
+STATS = ('hits', 'misses')
+
+
+def get_cache():
+    return caches[getattr(settings, 'QUERY_CACHE_ALIAS', 'default')]
+
+
+def enabled():
+    """Whether the query cache runs: QUERY_CACHE is set and its cache is shared"""
+    return bool(getattr(settings, 'QUERY_CACHE', None)) and is_shared_cache(get_cache())
+
+
+def model_config(model):
+    """Return the QUERY_CACHE entry for model, most specific match first"""
+    config = getattr(settings, 'QUERY_CACHE', {})
+    label = model._meta.label_lower
+    for pattern in (label, f'{model._meta.app_label}.*', '*.*'):
+        if pattern in config:
+            return config[pattern]
+    return None
+
+
+def _ops(model):
+    config = model_config(model) or {}
+    ops = config.get('ops', ())
+    if ops == 'all':
+        return {'get', 'fetch'}
+    return {ops} if isinstance(ops, str) else set(ops)
+
+
+def _table_key(table):
+    return f'{KEY_PREFIX}:table:{table}'
+
+
+def bump_tables(tables):
+    """Invalidate every cached result that reads any of the tables"""
+    now = time.time_ns()
+    get_cache().set_many({_table_key(table): now for table in tables}, timeout=None)
+
+
+def written_tables(sql):
+    """Names of the tables a write statement changes, or an empty list for reads"""
+    match = WRITE_TABLE.match(sql)
+    if match:
+        return [match.group(1)]
+    if TRUNCATE.match(sql):
+        return QUOTED_NAME.findall(sql)
+    return []
+
+
+def invalidate_on_write(execute, sql, params, many, context):
+    """Database execute wrapper that bumps the tables written by each statement"""
+    result = execute(sql, params, many, context)
+    tables = written_tables(sql)
+    if tables:
+        bump_tables(tables)
+        connection = context['connection']
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: bump_tables(tables), using=connection.alias)
+    return result
+
+
+def _in_transaction(using):
+    return connections[using].in_atomic_block
+
+
+def _table_stamps(tables):
+    cache = get_cache()
+    keys = [_table_key(table) for table in tables]
+    stamps = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in stamps}
+    if missing:
+        for key, stamp in missing.items():
+            cache.add(key, stamp, timeout=None)
+        stamps.update(cache.get_many(list(missing)))
+    return [stamps.get(key) for key in keys]
+
+
+class CachingQuerySetMixin:
+    """QuerySet mixin that serves results from the query cache"""
+
+    _cache_on = None
+    _cache_timeout = None
+
+    def cache(self, timeout=None):
+        """Cache this queryset's results, whatever QUERY_CACHE says"""
+        clone = self._chain()
+        clone._cache_on = True
+        clone._cache_timeout = timeout
+        return clone
+
+    def nocache(self):
+        """Never serve this queryset from the cache"""
+        clone = self._chain()
+        clone._cache_on = False
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_on = self._cache_on
+        clone._cache_timeout = self._cache_timeout
+        return clone
+
+    def get(self, *args, **kwargs):
+        if self._cache_on is None and 'get' in _ops(self.model):
+            return super(CachingQuerySetMixin, self.cache()).get(*args, **kwargs)
+        return super().get(*args, **kwargs)
+
+    def _should_cache(self):
+        if self.query.select_for_update:
+            return False
+        if self._cache_on is None:
+            return 'fetch' in _ops(self.model)
+        return self._cache_on
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._should_cache():
+            self._result_cache = self._cached_results()
+        super()._fetch_all()
+
+    def _cached_results(self):
+        try:
+            sql, params = self.query.clone().get_compiler(using=self.db).as_sql()
+        except EmptyResultSet:
+            return list(self._iterable_class(self))
+
+        tables = sorted(set(READ_TABLES.findall(sql)))
+        raw_key = repr((
+            self.db, sql, params, self._iterable_class.__name__, self._fields, _table_stamps(tables),
+        ))
+        key = f'{KEY_PREFIX}:query:{hashlib.md5(raw_key.encode()).hexdigest()}'
+
+        cache = get_cache()
+        label = self.model._meta.label_lower
+        results = cache.get(key)
+        if results is not None:
+            _count(label, 'hits')
+            return results
+
+        _count(label, 'misses')
+        results = list(self._iterable_class(self))
+        if not _in_transaction(self.db):
+            timeout = self._cache_timeout or (model_config(self.model) or {}).get('timeout', DEFAULT_TIMEOUT)
+            cache.set(key, results, timeout)
+        return results
+
+
+_caching_classes = {}
+
+
+def caching_queryset_class(queryset_class):
+    """Return the caching subclass of a QuerySet class"""
+    if issubclass(queryset_class, CachingQuerySetMixin):
+        return queryset_class
+    if queryset_class not in _caching_classes:
+        _caching_classes[queryset_class] = type(
+            f'Caching{queryset_class.__name__}', (CachingQuerySetMixin, queryset_class),
+            {'__module__': queryset_class.__module__},
+        )
+    return _caching_classes[queryset_class]
+
+
+def _add_execute_wrapper(connection, **kwargs):
+    if invalidate_on_write not in connection.execute_wrappers:
+        connection.execute_wrappers.append(invalidate_on_write)
+
+
+def _cached_managers():
+    from django.apps import apps
+
+    for model in apps.get_models():
+        if _ops(model):
+            # _meta.managers holds copies of the declared managers, made again
+            # whenever the app registry's caches are cleared
+            yield from {*model._meta.local_managers, *model._meta.managers}
+
+
+def install():
+    """
+    Watch every database connection for writes and have the managers of the
+    models in QUERY_CACHE return caching querysets, if the cache is shared.
+    Called from core.ready().
+    """
+    if not enabled():
+        return False
+
+    connection_created.connect(_add_execute_wrapper, dispatch_uid='core.query_cache')
+    for connection in connections.all(initialized_only=True):
+        _add_execute_wrapper(connection)
+
+    # Set on the manager instances: their classes, which migrations record,
+    # stay as declared
+    for manager in _cached_managers():
+        manager._queryset_class = caching_queryset_class(manager._queryset_class)
+    return True
+
+
+def uninstall():
+    """Undo install()"""
+    connection_created.disconnect(dispatch_uid='core.query_cache')
+    for connection in connections.all(initialized_only=True):
+        if invalidate_on_write in connection.execute_wrappers:
+            connection.execute_wrappers.remove(invalidate_on_write)
+    for manager in _cached_managers():
+        manager.__dict__.pop('_queryset_class', None)
+
+
+def _stats_key(label, outcome):
+    return f'{KEY_PREFIX}:stats:{label}:{outcome}'
+
+
+def _count(label, outcome):
+    cache = get_cache()
+    key = _stats_key(label, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def _stats_keys():
+    from django.apps import apps
+
+    return {
+        (model._meta.label_lower, outcome): _stats_key(model._meta.label_lower, outcome)
+        for model in apps.get_models() for outcome in STATS
+    }
+
+
+def stats():
+    """Return {model label: {'hits': n, 'misses': n}} of the models served from the cache"""
+    keys = _stats_keys()
+    counts = get_cache().get_many(list(keys.values()))
+    result = {}
+    for (label, outcome), key in keys.items():
+        if key in counts:
+            result.setdefault(label, dict.fromkeys(STATS, 0))[outcome] = counts[key]
+    return result
+
+
+def reset_stats():
+    get_cache().delete_many(list(_stats_keys().values()))
@@ -0,0 +1,128 @@
+"""
+Post ranking engine.
+
+Every sort mode reads a score stored on Post, so a feed is an index scan with
+LIMIT rather than an aggregate over the votes table:
+
+- hot: Reddit's log-score plus submission time. The time term is absolute, so
+  a post's hot score only changes when it is voted on.
+- top: net score (upvotes minus downvotes).
+- controversial: many votes, evenly split.
+- rising: net score divided by a power of the post's age. Unlike the others it
+  decays over time, so refresh_rankings re-scores recent posts periodically.
+
+Scores are recomputed on every post vote by update_post_ranking().
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+# Reddit's epoch and decay constants: ten upvotes are worth 12.5 hours
+HOT_EPOCH = datetime(2005, 12, 8, 7, 46, 43, tzinfo=dt_timezone.utc)
+HOT_DECAY_SECONDS = 45000
+
+# Rising only considers posts this young; refresh_rankings re-scores them
+RISING_WINDOW = timedelta(hours=48)
+RISING_GRAVITY = 1.5
+
+SORT_HOT = 'hot'
+SORT_NEW = 'new'
+SORT_TOP = 'top'
+SORT_RISING = 'rising'
+SORT_CONTROVERSIAL = 'controversial'
+
+SORT_CHOICES = (
+    (SORT_HOT, 'Hot'),
+    (SORT_NEW, 'New'),
+    (SORT_TOP, 'Top'),
+    (SORT_RISING, 'Rising'),
+    (SORT_CONTROVERSIAL, 'Controversial'),
+)
+
+DEFAULT_SORT = SORT_HOT
+
+# Ordering for each sort mode; each one matches a composite index on Post
+SORT_ORDERING = {
+    SORT_HOT: ('-hot_score', '-id'),
+    SORT_NEW: ('-created_at', '-id'),
+    SORT_TOP: ('-score', '-id'),
+    SORT_RISING: ('-rising_score', '-id'),
+    SORT_CONTROVERSIAL: ('-controversy_score', '-id'),
+}
+
+
+def hot_score(upvotes, downvotes, created_at):
+    """Reddit-style hot score: order of magnitude of the net score plus age"""
+    score = upvotes - downvotes
+    order = math.log10(max(abs(score), 1))
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    seconds = (created_at - HOT_EPOCH).total_seconds()
+    return round(sign * order + seconds / HOT_DECAY_SECONDS, 7)
+
+
+def controversy_score(upvotes, downvotes):
+    """High when a post has many votes that are evenly split"""
+    if upvotes <= 0 or downvotes <= 0:
+        return 0.0
+    magnitude = upvotes + downvotes
+    balance = downvotes / upvotes if upvotes > downvotes else upvotes / downvotes
+    return magnitude ** balance
+
+
+def rising_score(upvotes, downvotes, created_at, now=None):
+    """Net score per unit of age, so young posts gaining votes quickly stand out"""
+    now = now or timezone.now()
+    age_hours = max((now - created_at).total_seconds(), 0) / 3600
+    return (upvotes - downvotes) / (age_hours + 2) ** RISING_GRAVITY
+
+
+def ranking_fields(upvotes, downvotes, created_at, now=None):
+    """Return every stored ranking field for a post with these counts"""
+    return {
+        'score': upvotes - downvotes,
+        'hot_score': hot_score(upvotes, downvotes, created_at),
+        'controversy_score': controversy_score(upvotes, downvotes),
+        'rising_score': rising_score(upvotes, downvotes, created_at, now),
+    }
+
+
+def set_ranking(post, now=None):
+    """Fill in the ranking fields of a post instance from its own counts"""
+    created_at = post.created_at or timezone.now()
+    for field, value in ranking_fields(post.upvote_count, post.downvote_count, created_at, now).items():
+        setattr(post, field, value)
+
+
+def update_post_ranking(post_id, post=None):
+    """
+    Recompute the stored ranking of a post after its vote counts changed.
+
+    Must run in the transaction that updated the counts: the counter UPDATE
+    holds the row lock, so the counts read here are the latest ones. The
+    in-memory post, if given, is kept in step.
+    """
+    from .models import Post
+
+    row = Post.objects.filter(pk=post_id).values_list('upvote_count', 'downvote_count', 'created_at').first()
+    if row is None:
+        return
+    fields = ranking_fields(*row)
+    Post.objects.filter(pk=post_id).update(**fields)
+
+    if post is not None:
+        for field, value in fields.items():
+            setattr(post, field, value)
+
+
+def get_sort(request):
+    """Read the sort mode from the request, falling back to the default"""
+    sort = request.GET.get('sort', DEFAULT_SORT)
+    return sort if sort in SORT_ORDERING else DEFAULT_SORT
+
+
+def ranked_posts(queryset, sort):
+    """Order a Post queryset by the given sort mode"""
+    if sort == SORT_RISING:
+        queryset = queryset.filter(created_at__gte=timezone.now() - RISING_WINDOW)
+    return queryset.order_by(*SORT_ORDERING.get(sort, SORT_ORDERING[DEFAULT_SORT]))
@@ -0,0 +1,69 @@
+"""
+Pre-rendered post and comment bodies.
+
+Bodies are plain text, shown escaped with their line breaks turned into
+paragraphs. Rather than running linebreaks and truncatewords_html over the
+full body on every page, the HTML and a plain-text excerpt are stored next
+to the content (plus, for posts, the HTML of the truncated version shown on
+list pages) and rendered again only when save() finds the content changed.
+Rows written without save() (bulk_create, queryset update()) are rendered
+by the render_content management command.
+"""
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+# Words shown of a post body on list pages before "Read more"
+EXCERPT_WORDS = 50
+
+_unset = object()
+
+
+def render_html(text):
+    """Safe HTML for a plain-text body"""
+    return linebreaks(text or '', autoescape=True)
+
+
+def render_fields(text):
+    """Return the value of every rendered field for a body"""
+    text = text or ''
+    excerpt_html = ''
+    # Only bodies that get cut short have a separate list version
+    if len(text.split()) > EXCERPT_WORDS:
+        excerpt_html = render_html(Truncator(text).words(EXCERPT_WORDS, html=True))
+    return {
+        'content_html': render_html(text),
+        'excerpt': Truncator(text).words(EXCERPT_WORDS),
+        'excerpt_html': excerpt_html,
+    }
+
+
+def render_content(instance):
+    """Fill in the rendered fields of a post or comment from its content"""
+    values = render_fields(instance.content)
+    for field in instance.RENDERED_FIELDS:
+        setattr(instance, field, values[field])
+    instance._rendered_source = instance.content
+
+
+def track_rendered_source(instance):
+    """Remember the content an instance was loaded with; call from from_db()"""
+    if 'content' in instance.__dict__:
+        instance._rendered_source = instance.content
+
+
+def prepare_rendered_fields(instance, save_kwargs):
+    """
+    Render an instance about to be saved if its content is new or changed,
+    adding the rendered fields to update_fields when it is limited
+    """
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'content' not in update_fields:
+        return
+    # Deferred content that was never loaded can't have changed
+    if 'content' not in instance.__dict__:
+        return
+    if getattr(instance, '_rendered_source', _unset) == instance.content:
+        return
+    render_content(instance)
+    if update_fields is not None:
+        save_kwargs['update_fields'] = {*update_fields, *instance.RENDERED_FIELDS}
@@ -0,0 +1,418 @@
+"""
+Native full-text search.
+
+Each searchable object has a SearchDocument row holding the text its
+adapter extracts, in three weighted fields like Watson's: title (highest),
+meta (tags, community, author) and description (body, lowest). The database
+keeps its own index of those rows:
+
+- SQLite: an FTS5 table (core_searchdocument_fts) kept in step by triggers,
+  ranked with bm25()
+- PostgreSQL: a generated, weighted tsvector column with a GIN index,
+  ranked with ts_rank()
+
+Documents also carry the community and creation time of their object, so
+search results can be filtered by them in the same query that matches the
+index (filter_documents), and ordered by a column of the indexed objects
+without loading them (order_by_object).
+
+Other databases fall back to unranked icontains matching. Adapters are
+registered per model (see core.search_adapters). When a registered object
+is saved, retagged or deleted, it is added to a queue table
+(SearchIndexTask, one row per object) in the same transaction, and the
+process_search_queue worker rewrites or removes the documents of queued
+objects in batches, with a few queries per model per batch, off the request
+path. queue_stats() reports how far the index lags behind. With
+settings.SEARCH_INDEX_QUEUE = False the documents are written during the
+request instead.
+
+The rebuild_search_index command writes a complete new generation of
+documents (SearchIndexBuild) alongside the one being searched, and swaps it
+in when it finishes. Changes made meanwhile are written to both.
+
+Every document write invalidates the cached searches over its model (see
+core.search_cache).
+"""
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import F, FloatField, IntegerField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+
+FTS_TABLE = 'core_searchdocument_fts'
+# bm25() column weights for title, meta and description
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+PG_CONFIG = 'english'
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+# Queued objects indexed per batch by the worker
+QUEUE_BATCH_SIZE = 500
+# SearchDocument fields written from the adapters
+DOCUMENT_FIELDS = ('title', 'meta', 'description', 'url', 'community', 'created_at')
+
+_adapters = {}
+
+
+class SearchAdapter:
+    """Extracts the searchable text of one model's objects"""
+
+    # Fields whose change requires reindexing; None means any field
+    fields = None
+
+    def __init__(self, model):
+        self.model = model
+
+    def get_title(self, obj):
+        return str(obj)
+
+    def get_description(self, obj):
+        return ''
+
+    def get_meta(self, obj):
+        return ''
+
+    def get_url(self, obj):
+        return obj.get_absolute_url() if hasattr(obj, 'get_absolute_url') else ''
+
+    def get_community_id(self, obj):
+        """The community the object belongs to, for community filters"""
+        return None
+
+    def get_created_at(self, obj):
+        """When the object was created, for time filters and date sorts"""
+        return None
+
+    def get_queryset(self):
+        """Objects to index and to show in results, with what the adapter reads"""
+        return self.model._default_manager.all()
+
+
+def register(model, adapter_class=SearchAdapter):
+    """Index model's objects with adapter_class and keep them up to date"""
+    _adapters[model] = adapter_class(model)
+    uid = f'core.search:{model._meta.label_lower}'
+    post_save.connect(_index_saved, sender=model, dispatch_uid=uid)
+    post_delete.connect(_remove_deleted, sender=model, dispatch_uid=uid)
+
+
+def unregister(model):
+    _adapters.pop(model, None)
+    uid = f'core.search:{model._meta.label_lower}'
+    post_save.disconnect(sender=model, dispatch_uid=uid)
+    post_delete.disconnect(sender=model, dispatch_uid=uid)
+
+
+def get_adapter(model):
+    return _adapters[model]
+
+
+def registered_models():
+    return list(_adapters)
+
+
+def build_document(obj, adapter=None):
+    """Return the SearchDocument field values for obj"""
+    adapter = adapter or get_adapter(type(obj))
+    return {
+        'title': adapter.get_title(obj) or '',
+        'meta': adapter.get_meta(obj) or '',
+        'description': adapter.get_description(obj) or '',
+        'url': adapter.get_url(obj) or '',
+        'community_id': adapter.get_community_id(obj),
+        'created_at': adapter.get_created_at(obj),
+    }
+
+
+def index_object(obj):
+    """Write the search document of a registered object"""
+    sync_documents(type(obj), [obj.pk])
+
+
+def remove_object(model, pk):
+    from .models import SearchDocument
+    from .search_cache import invalidate_results
+
+    SearchDocument.objects.filter(content_type=ContentType.objects.get_for_model(model), object_id=pk).delete()
+    invalidate_results([model])
+
+
+def queue_enabled():
+    return getattr(settings, 'SEARCH_INDEX_QUEUE', True)
+
+
+def enqueue(model, pks):
+    """
+    Queue objects of model to be indexed again, or removed from the index if
+    they no longer exist. Objects already waiting keep their place.
+    """
+    from .models import SearchIndexTask
+
+    content_type = ContentType.objects.get_for_model(model)
+    now = timezone.now()
+    SearchIndexTask.objects.bulk_create(
+        [SearchIndexTask(content_type=content_type, object_id=pk, queued_at=now, updated_at=now) for pk in pks],
+        ignore_conflicts=True,
+    )
+    # Always bumped, new task or not: the row stays locked until this
+    # transaction commits, and the worker only deletes tasks whose version
+    # it saw, so a change it indexed too early is indexed again
+    SearchIndexTask.objects.filter(content_type=content_type, object_id__in=pks).update(
+        version=F('version') + 1, updated_at=now,
+    )
+
+
+def _changed(model, instance, deleted=False):
+    if queue_enabled():
+        enqueue(model, [instance.pk])
+    elif deleted:
+        remove_object(model, instance.pk)
+    else:
+        index_object(instance)
+
+
+def _index_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    adapter = _adapters.get(sender)
+    # e.g. logins only save last_login, which no adapter shows
+    if adapter is None or (update_fields is not None and adapter.fields is not None
+                           and not set(update_fields) & set(adapter.fields)):
+        return
+    _changed(sender, instance)
+
+
+def _remove_deleted(sender, instance, **kwargs):
+    if sender in _adapters:
+        _changed(sender, instance, deleted=True)
+
+
+def _index_retagged(sender, instance, action, **kwargs):
+    # Tags are part of the meta of posts and profiles
+    if action in ('post_add', 'post_remove', 'post_clear') and type(instance) in _adapters:
+        _changed(type(instance), instance)
+
+
+def connect_tag_signals(*managers):
+    """Reindex objects when tags are added to or removed from them"""
+    for manager in managers:
+        m2m_changed.connect(
+            _index_retagged, sender=manager.through,
+            dispatch_uid=f'core.search:tags:{manager.through._meta.label_lower}',
+        )
+
+
+def index_generations():
+    """
+    The generations documents are written to: the active one, which is
+    searched, and the one a rebuild in progress is writing, if any
+    """
+    from .models import SearchIndexBuild
+
+    generations = SearchIndexBuild.objects.aggregate(
+        active=Max('generation', filter=Q(finished_at__isnull=False)),
+        building=Max('generation', filter=Q(finished_at__isnull=True)),
+    )
+    active = generations['active'] or 0
+    if generations['building'] is not None and generations['building'] > active:
+        return [active, generations['building']]
+    return [active]
+
+
+def active_generation():
+    """Expression for the searched generation, the latest finished build's"""
+    from .models import SearchIndexBuild
+
+    latest = SearchIndexBuild.objects.filter(finished_at__isnull=False).order_by('-generation').values('generation')[:1]
+    return Coalesce(Subquery(latest), Value(0), output_field=IntegerField())
+
+
+def sync_documents(model, pks):
+    """
+    Rewrite the documents of model's objects pks from their current state
+    in bulk, removing the documents of objects that no longer exist
+    """
+    from .models import SearchDocument
+    from .search_cache import invalidate_results
+
+    content_type = ContentType.objects.get_for_model(model)
+    adapter = _adapters.get(model)
+    objects = list(adapter.get_queryset().filter(pk__in=pks)) if adapter else []
+    generations = index_generations()
+
+    # Upserts, so a rebuild writing the same rows meanwhile can't make them fail
+    SearchDocument.objects.bulk_create(
+        [
+            SearchDocument(content_type=content_type, object_id=obj.pk, generation=generation, **values)
+            for obj, values in ((obj, build_document(obj, adapter)) for obj in objects)
+            for generation in generations
+        ],
+        update_conflicts=True,
+        unique_fields=['content_type', 'object_id', 'generation'],
+        update_fields=[*DOCUMENT_FIELDS, 'updated_at'],
+    )
+    # What is left belongs to deleted objects
+    missing = set(pks) - {obj.pk for obj in objects}
+    if missing:
+        SearchDocument.objects.filter(content_type=content_type, object_id__in=missing).delete()
+    invalidate_results([model])
+    return len(objects)
+
+
+def chunk_documents(label, start, end):
+    """
+    (pk, document values) of the objects of a registered model (by label)
+    with start <= pk < end, for a rebuild; run in worker processes
+    """
+    adapter = get_adapter(apps.get_model(label))
+    return [(obj.pk, build_document(obj, adapter)) for obj in adapter.get_queryset().filter(pk__gte=start, pk__lt=end)]
+
+
+def process_index_queue(batch_size=QUEUE_BATCH_SIZE):
+    """
+    Index one batch of queued objects, longest waiting first. Returns the
+    number of tasks processed and the lag of the batch: how long, in
+    seconds, its oldest change took to reach the index.
+    """
+    from .models import SearchIndexTask
+
+    tasks = list(SearchIndexTask.objects.order_by('queued_at', 'id')[:batch_size])
+    if not tasks:
+        return 0, 0.0
+
+    by_type = {}
+    for task in tasks:
+        by_type.setdefault(task.content_type_id, []).append(task.object_id)
+    for content_type_id, pks in by_type.items():
+        sync_documents(ContentType.objects.get_for_id(content_type_id).model_class(), pks)
+
+    # Objects that changed again since their task was read are indexed next time
+    by_version = {}
+    for task in tasks:
+        by_version.setdefault(task.version, []).append(task.pk)
+    done = Q()
+    for version, task_pks in by_version.items():
+        done |= Q(version=version, pk__in=task_pks)
+    SearchIndexTask.objects.filter(done).delete()
+    return len(tasks), (timezone.now() - tasks[0].queued_at).total_seconds()
+
+
+def queue_stats():
+    """The number of queued objects and how long the oldest has waited, in seconds"""
+    from .models import SearchIndexTask
+
+    tasks = SearchIndexTask.objects.order_by('queued_at')
+    oldest = tasks.values_list('queued_at', flat=True).first()
+    return {
+        'pending': tasks.count(),
+        'lag': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
+
+
+def search_backend():
+    """'sqlite', 'postgresql' or 'basic' for the default database"""
+    return connection.vendor if connection.vendor in ('sqlite', 'postgresql') else 'basic'
+
+
+def query_terms(text):
+    """The words of a search query, lower-cased"""
+    return [word.lower() for word in WORD.findall(text or '')]
+
+
+def fts5_query(terms):
+    """An FTS5 MATCH expression requiring every term, safe from FTS5 syntax"""
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def search(text, models=None):
+    """
+    SearchDocuments matching every word of text, best match first, as a
+    queryset (so it can be filtered further, counted and sliced into pages).
+    Each document has a rank; load_objects() attaches the indexed objects.
+    """
+    from .models import SearchDocument
+
+    documents = SearchDocument.objects.filter(generation=active_generation())
+    if models:
+        documents = documents.filter(content_type__in=ContentType.objects.get_for_models(*models).values())
+
+    terms = query_terms(text)
+    if not terms:
+        return documents.none()
+
+    backend = search_backend()
+    if backend == 'sqlite':
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        # bm25() is lower for better matches
+        return documents.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = core_searchdocument.id', f'{FTS_TABLE} MATCH %s'],
+            params=[fts5_query(terms)],
+            select={'rank': f'-bm25({FTS_TABLE}, {weights})'},
+        ).order_by('-rank', '-id')
+
+    if backend == 'postgresql':
+        tsquery = f"plainto_tsquery('{PG_CONFIG}', %s)"
+        query = ' '.join(terms)
+        return documents.annotate(
+            rank=RawSQL(f'ts_rank(search_vector, {tsquery})', [query], output_field=FloatField()),
+        ).extra(where=[f'search_vector @@ {tsquery}'], params=[query]).order_by('-rank', '-id')
+
+    match = Q()
+    for term in terms:
+        match &= Q(title__icontains=term) | Q(meta__icontains=term) | Q(description__icontains=term)
+    return documents.filter(match).annotate(rank=Value(0.0, output_field=FloatField())).order_by('-id')
+
+
+def filter_documents(documents, community_id=None, since=None):
+    """
+    Narrow search() results to one community and/or to objects created since
+    a time; the conditions are part of the index query
+    """
+    if community_id is not None:
+        documents = documents.filter(community_id=community_id)
+    if since is not None:
+        documents = documents.filter(created_at__gte=since)
+    return documents
+
+
+def order_by_object(documents, model, expression):
+    """
+    Order search() results of model by expression (a column or expression
+    of model, e.g. a stored counter), highest first, in the same query
+    """
+    value = model._default_manager.filter(pk=OuterRef('object_id'))\
+        .annotate(sort_value=expression)\
+        .values('sort_value')[:1]
+    return documents.annotate(sort_value=Subquery(value)).order_by('-sort_value', '-id')
+
+
+def load_objects(documents):
+    """
+    Attach the indexed object to each of documents (a page of results) with
+    one query per model, dropping documents whose object no longer exists
+    """
+    documents = list(documents)
+    by_type = {}
+    for document in documents:
+        by_type.setdefault(document.content_type_id, set()).add(document.object_id)
+
+    objects = {}
+    for content_type_id, ids in by_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        queryset = _adapters[model].get_queryset() if model in _adapters else model._default_manager.all()
+        for obj in queryset.filter(pk__in=ids):
+            objects[content_type_id, obj.pk] = obj
+
+    loaded = []
+    for document in documents:
+        document.object = objects.get((document.content_type_id, document.object_id))
+        if document.object is not None:
+            loaded.append(document)
+    return loaded
@@ -1,12 +1,14 @@
 from django.contrib.auth.models import User
-from django.utils.html import mark_safe
 from django.urls import reverse
-from watson import search as watson
 
+from . import search
 from .models import Post, Community, Comment, Profile
 
 
-class PostSearchAdapter(watson.SearchAdapter):
+class PostSearchAdapter(search.SearchAdapter):
+    def get_queryset(self):
+        return Post.objects.select_related('community', 'author').prefetch_related('tags')
+    
     def get_title(self, obj):
         return obj.title
     
@@ -26,9 +28,17 @@ class PostSearchAdapter(watson.SearchAdapter):
     
     def get_url(self, obj):
         return reverse('post_detail', kwargs={'pk': obj.pk})
+    
+    def get_community_id(self, obj):
+        return obj.community_id
+    
+    def get_created_at(self, obj):
+        return obj.created_at
 
 
-class CommunitySearchAdapter(watson.SearchAdapter):
+class CommunitySearchAdapter(search.SearchAdapter):
+    fields = ('name', 'description')
+    
     def get_title(self, obj):
         return f"Community: {obj.name}"
     
@@ -37,9 +47,18 @@ class CommunitySearchAdapter(watson.SearchAdapter):
     
     def get_url(self, obj):
         return reverse('community_detail', kwargs={'pk': obj.pk})
+    
+    def get_community_id(self, obj):
+        return obj.pk
+    
+    def get_created_at(self, obj):
+        return obj.created_at
 
 
-class CommentSearchAdapter(watson.SearchAdapter):
+class CommentSearchAdapter(search.SearchAdapter):
+    def get_queryset(self):
+        return Comment.objects.select_related('post', 'author')
+    
     def get_title(self, obj):
         return f"Comment on: {obj.post.title}"
     
@@ -52,9 +71,18 @@ class CommentSearchAdapter(watson.SearchAdapter):
     
     def get_url(self, obj):
         return reverse('post_detail', kwargs={'pk': obj.post.pk})
+    
+    def get_community_id(self, obj):
+        return obj.post.community_id
+    
+    def get_created_at(self, obj):
+        return obj.created_at
 
 
-class UserSearchAdapter(watson.SearchAdapter):
+class UserSearchAdapter(search.SearchAdapter):
+    # Logins save last_login only and don't need reindexing
+    fields = ('username', 'date_joined')
+    
     def get_title(self, obj):
         return f"User: {obj.username}"
     
@@ -63,9 +91,15 @@ class UserSearchAdapter(watson.SearchAdapter):
     
     def get_url(self, obj):
         return reverse('profile', kwargs={'username': obj.username})
+    
+    def get_created_at(self, obj):
+        return obj.date_joined
 
 
-class ProfileSearchAdapter(watson.SearchAdapter):
+class ProfileSearchAdapter(search.SearchAdapter):
+    def get_queryset(self):
+        return Profile.objects.select_related('user').prefetch_related('interests')
+    
     def get_title(self, obj):
         return f"Profile: {obj.user.username}"
     
@@ -81,41 +115,18 @@ class ProfileSearchAdapter(watson.SearchAdapter):
     
     def get_url(self, obj):
         return reverse('profile', kwargs={'username': obj.user.username})
+    
+    def get_created_at(self, obj):
+        return obj.user.date_joined
 
 
 def register_search_adapters():
     """
-    Register all search adapters with watson
+    Register all search adapters with core.search
     """
-    # Unregister first to avoid errors if already registered
-    try:
-        watson.unregister(Post)
-    except:
-        pass
-    
-    try:
-        watson.unregister(Community)
-    except:
-        pass
-    
-    try:
-        watson.unregister(Comment)
-    except:
-        pass
-    
-    try:
-        watson.unregister(User)
-    except:
-        pass
-    
-    try:
-        watson.unregister(Profile)
-    except:
-        pass
-    
-    # Now register with our adapters
-    watson.register(Post, PostSearchAdapter)
-    watson.register(Community, CommunitySearchAdapter)
-    watson.register(Comment, CommentSearchAdapter)
-    watson.register(User, UserSearchAdapter)
-    watson.register(Profile, ProfileSearchAdapter)
+    search.register(Post, PostSearchAdapter)
+    search.register(Community, CommunitySearchAdapter)
+    search.register(Comment, CommentSearchAdapter)
+    search.register(User, UserSearchAdapter)
+    search.register(Profile, ProfileSearchAdapter)
+    search.connect_tag_signals(Post.tags, Profile.interests)
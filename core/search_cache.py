@@ -0,0 +1,153 @@
+"""
+Search result cache.
+
+Searches are cached by their normalized text (the distinct lower-cased
+words, sorted, which is all the index matches on) together with the models
+searched and the filters and ordering applied. Entries hold the ranked
+(content type id, object id) pairs of the results rather than documents or
+rendered objects, so a hit costs one cache read and the objects of the page
+shown are loaded as usual.
+
+Every indexed model has a generation stamp in the cache, bumped by
+core.search whenever it writes that model's documents, and keys include the
+stamps of the models searched: an index write only invalidates the searches
+that could see it. Within SEARCH_CACHE_TIMEOUT seconds, orderings by live
+counters (votes, members, karma) and time ranges may lag behind.
+
+Stamps and hit counts must be seen by every process: web workers, the
+process_search_queue worker and management commands. So results are only
+cached when the default cache is shared (Redis rather than the local memory
+cache; see core.checks). Otherwise every search runs on the index.
+
+stats() reports the hit rate, shared by every process using the cache, to
+tune the timeout against.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+
+from .checks import is_shared_cache
+
+KEY_PREFIX = 'core:search'
+DEFAULT_TIMEOUT = 5 * 60
+# Results kept of one search
+MAX_RESULTS = 1000
+STATS = ('hits', 'misses')
+
+
+class SearchResult:
+    """A cached search result; load_objects() attaches its object"""
+
+    __slots__ = ('content_type_id', 'object_id', 'object')
+
+    def __init__(self, content_type_id, object_id):
+        self.content_type_id = content_type_id
+        self.object_id = object_id
+
+
+class SearchResults(list):
+    """The SearchResults kept of a search; capped if more matched"""
+
+    def __init__(self, results, capped=False):
+        super().__init__(results)
+        self.capped = capped
+
+
+def enabled():
+    """Whether search results are cached, which needs a shared cache"""
+    return is_shared_cache(caches[DEFAULT_CACHE_ALIAS])
+
+
+def normalize_query(text):
+    """The form of a search query that identifies its results"""
+    from .search import query_terms
+
+    return ' '.join(sorted(set(query_terms(text))))
+
+
+def _generation_key(label):
+    return f'{KEY_PREFIX}:generation:{label}'
+
+
+def invalidate_results(models):
+    """Invalidate every cached search over any of models"""
+    if not enabled():
+        return
+    now = time.time_ns()
+    cache.set_many({_generation_key(model._meta.label_lower): now for model in models}, timeout=None)
+
+
+def _generations(labels):
+    keys = [_generation_key(label) for label in labels]
+    stamps = cache.get_many(keys)
+    missing = [key for key in keys if key not in stamps]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=None)
+        stamps.update(cache.get_many(missing))
+    return [stamps.get(key) for key in keys]
+
+
+def result_key(text, models, filters, namespace='results'):
+    labels = sorted(model._meta.label_lower for model in models)
+    parts = (normalize_query(text), labels, sorted(filters.items()), _generations(labels))
+    return f'{KEY_PREFIX}:{namespace}:{hashlib.md5(repr(parts).encode()).hexdigest()}'
+
+
+def _count(outcome):
+    key = f'{KEY_PREFIX}:stats:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cached(namespace, text, models, filters, compute):
+    """
+    A value derived from searching text over models with filters (which
+    must name everything else it depends on), from the cache or compute()
+    """
+    if not enabled():
+        return compute()
+    key = result_key(text, models, filters, namespace)
+    value = cache.get(key)
+    if value is None:
+        _count('misses')
+        value = compute()
+        cache.set(key, value, getattr(settings, 'SEARCH_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+    else:
+        _count('hits')
+    return value
+
+
+def cached_results(text, models, documents, **filters):
+    """
+    The ranked SearchResults of documents, a search() queryset for text
+    over models, from the cache if possible. filters must name everything
+    else that shapes documents (filters, ordering); it is only evaluated,
+    up to MAX_RESULTS, on a miss. One more row is fetched to tell whether
+    the results were capped.
+    """
+    results = cached(
+        'results', text, models, filters,
+        lambda: list(documents.values_list('content_type_id', 'object_id')[:MAX_RESULTS + 1]),
+    )
+    return SearchResults(
+        [SearchResult(content_type_id, object_id) for content_type_id, object_id in results[:MAX_RESULTS]],
+        capped=len(results) > MAX_RESULTS,
+    )
+
+
+def stats():
+    """Return hits, misses and hit_rate of the search cache"""
+    counts = cache.get_many([f'{KEY_PREFIX}:stats:{outcome}' for outcome in STATS])
+    hits, misses = (counts.get(f'{KEY_PREFIX}:stats:{outcome}', 0) for outcome in STATS)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+
+
+def reset_stats():
+    cache.delete_many([f'{KEY_PREFIX}:stats:{outcome}' for outcome in STATS])
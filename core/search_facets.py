@@ -0,0 +1,168 @@
+"""
+Facet counts of a search.
+
+Next to the results, advanced search shows how many matches each value of
+its filters leads to: result types, communities, post types, tags and time
+ranges. Each facet is counted with every active filter applied except its
+own, so a count is the number of results its link shows. Types,
+communities, post types and time buckets are counted by one grouped query
+over the documents matching the query (one pass over the full-text index),
+and the filters are applied to the groups. Tags are many-to-many and are
+counted by one more grouped query over the matching posts' tags. Facets are
+cached like results (see core.search_cache), by normalized query and
+filters, until the index changes.
+"""
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Case, CharField, Count, Exists, OuterRef, Subquery, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from taggit.models import TaggedItem
+
+from .search import filter_documents, search
+from .search_cache import cached
+
+# Time ranges counted, from the narrowest; each also counts the ones before it
+TIME_BUCKETS = (
+    ('day', timedelta(days=1)),
+    ('week', timedelta(weeks=1)),
+    ('month', timedelta(days=30)),
+    ('year', timedelta(days=365)),
+)
+# Values shown of the community and tag facets, most matches first
+FACET_LIMIT = 10
+# Filters of advanced search that the counts depend on
+FILTERS = ('type', 'community', 'time', 'tag', 'post_type')
+
+
+def filter_posts(documents, post_model, tag='', post_type=''):
+    """Narrow post documents to posts with a tag (by slug) and/or of a type"""
+    if tag:
+        tagged = TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(post_model), tag__slug=tag,
+        ).values('object_id')
+        documents = documents.filter(object_id__in=tagged)
+    if post_type:
+        documents = documents.filter(object_id__in=post_model.objects.filter(post_type=post_type).values('pk'))
+    return documents
+
+
+def _time_bucket(now):
+    return Case(
+        *[When(created_at__gte=now - span, then=Value(name)) for name, span in TIME_BUCKETS],
+        default=Value('older'),
+        output_field=CharField(),
+    )
+
+
+def compute_facets(text, types, filtered, post_model, active):
+    """
+    Facet counts of the documents matching text. types maps result type
+    names to models; community and time filters and counts cover the
+    filtered types only, post type and tag ones the documents of post_model.
+    active holds the filters applied: type, community (id), time (a
+    TIME_BUCKETS name), tag (slug) and post_type, each None or empty if unset.
+    """
+    documents = search(text, models=list(types.values())).order_by()
+    content_types = ContentType.objects.get_for_models(*types.values())
+    post_type_id = content_types[post_model].pk
+    filtered_ids = {content_types[types[name]].pk for name in filtered}
+    bucket_names = [name for name, span in TIME_BUCKETS]
+    now = timezone.now()
+
+    post_type = Case(
+        When(content_type=post_type_id, then=Subquery(
+            post_model.objects.filter(pk=OuterRef('object_id')).values('post_type')[:1]
+        )),
+        default=Value(''),
+        output_field=CharField(),
+    )
+    tagged = Value(False)
+    if active['tag']:
+        tagged = Exists(TaggedItem.objects.filter(
+            content_type=post_type_id, object_id=OuterRef('object_id'), tag__slug=active['tag'],
+        ))
+    groups = documents\
+        .annotate(bucket=_time_bucket(now), post_type=post_type, tagged=tagged)\
+        .values('content_type_id', 'community_id', 'community__name', 'post_type', 'bucket', 'tagged')\
+        .annotate(count=Count('id'))
+
+    # Whether a group passes each active filter
+    def passes(group):
+        is_filtered = group['content_type_id'] in filtered_ids
+        is_post = group['content_type_id'] == post_type_id
+        return {
+            'type': active['type'] in (None, 'all') or group['content_type_id'] == content_types[types[active['type']]].pk,
+            'community': active['community'] is None or not is_filtered or group['community_id'] == active['community'],
+            'time': active['time'] not in bucket_names or not is_filtered or (
+                group['bucket'] in bucket_names
+                and bucket_names.index(group['bucket']) <= bucket_names.index(active['time'])
+            ),
+            'tag': not active['tag'] or not is_post or group['tagged'],
+            'post_type': not active['post_type'] or not is_post or group['post_type'] == active['post_type'],
+        }
+
+    by_type = {content_types[model].pk: name for name, model in types.items()}
+    type_counts = dict.fromkeys(types, 0)
+    communities, post_types, buckets = {}, {}, {}
+    for group in groups:
+        count = group['count']
+        checks = passes(group)
+
+        def counted(facet):
+            # Every filter but the facet's own
+            return all(passed for name, passed in checks.items() if name != facet)
+
+        if counted('type'):
+            type_counts[by_type[group['content_type_id']]] += count
+        if group['content_type_id'] in filtered_ids:
+            if group['community_id'] is not None and counted('community'):
+                key = (group['community_id'], group['community__name'])
+                communities[key] = communities.get(key, 0) + count
+            if counted('time'):
+                buckets[group['bucket']] = buckets.get(group['bucket'], 0) + count
+        if group['post_type'] and counted('post_type'):
+            post_types[group['post_type']] = post_types.get(group['post_type'], 0) + count
+
+    tags = []
+    if active['type'] in (None, 'all') or types.get(active['type']) is post_model:
+        posts = documents.filter(content_type=post_type_id)
+        if post_model in [types[name] for name in filtered]:
+            since = now - dict(TIME_BUCKETS)[active['time']] if active['time'] in bucket_names else None
+            posts = filter_documents(posts, community_id=active['community'], since=since)
+        posts = filter_posts(posts, post_model, post_type=active['post_type'])
+        # Compiled on its own: as a subquery the table would be renamed under
+        # the full-text join condition of search()
+        matching_posts = posts.values('object_id').query.sql_with_params()
+        tags = TaggedItem.objects\
+            .filter(content_type=post_type_id, object_id__in=RawSQL(*matching_posts))\
+            .values('tag__name', 'tag__slug')\
+            .annotate(count=Count('id'))\
+            .order_by('-count', 'tag__name')[:FACET_LIMIT]
+
+    # A time range counts everything newer than its end
+    time_counts, total = {}, 0
+    for name, span in TIME_BUCKETS:
+        total += buckets.get(name, 0)
+        time_counts[name] = total
+
+    return {
+        'types': type_counts,
+        'communities': [
+            {'id': pk, 'name': name, 'count': count}
+            for (pk, name), count in sorted(communities.items(), key=lambda item: (-item[1], item[0][1]))[:FACET_LIMIT]
+        ],
+        'post_types': post_types,
+        'tags': [{'name': tag['tag__name'], 'slug': tag['tag__slug'], 'count': tag['count']} for tag in tags],
+        'time': time_counts,
+    }
+
+
+def search_facets(text, types, filtered, post_model, **active):
+    """compute_facets(), cached with the query and the active filters"""
+    active = {name: active.get(name) for name in FILTERS}
+    return cached(
+        'facets', text, list(types.values()), {'filtered': tuple(filtered), **active},
+        lambda: compute_facets(text, types, filtered, post_model, active),
+    )
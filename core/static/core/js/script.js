@@ -50,6 +50,15 @@ document.addEventListener('DOMContentLoaded', function() {
         initRedditComments();
     }
     
+    // Load further comment batches in place
+    setupLoadMoreComments();
+    
+    // Set up "load more" for cursor-paginated lists
+    setupLoadMorePages();
+    
+    // Suggest communities, tags and users while typing in the search box
+    setupSearchAutocomplete();
+    
     // Auto-hide alerts after 5 seconds
     setTimeout(function() {
         const alerts = document.querySelectorAll('.alert-dismissible');
@@ -198,6 +207,170 @@ function initRedditComments() {
     loadCollapsedThreads();
 }
 
+/**
+ * Replace "load more" links with the next batch of comments fetched via AJAX
+ */
+function setupLoadMoreComments() {
+    document.addEventListener('click', function(e) {
+        const link = e.target.closest('.load-more-comments-link');
+        if (!link) {
+            return;
+        }
+        e.preventDefault();
+        
+        const container = link.closest('.load-more-comments');
+        link.setAttribute('aria-busy', 'true');
+        
+        fetch(link.href, {
+            headers: {'X-Requested-With': 'XMLHttpRequest'},
+            credentials: 'include'
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Failed to load comments');
+            }
+            return response.text();
+        })
+        .then(html => {
+            container.insertAdjacentHTML('beforebegin', html);
+            container.remove();
+        })
+        .catch(error => {
+            console.error(error);
+            // Fall back to a full page load
+            window.location.href = link.href;
+        });
+    });
+}
+
+/**
+ * Suggest matching communities, tags and users under the search box as the
+ * user types, from the autocomplete API. Suggestions are links; pressing
+ * Enter still submits the full search.
+ */
+function setupSearchAutocomplete() {
+    const input = document.querySelector('[data-autocomplete-url]');
+    const box = input && document.getElementById(input.getAttribute('aria-controls'));
+    if (!input || !box) {
+        return;
+    }
+    
+    const labels = {communities: name => `d/${name}`, tags: name => `#${name}`, users: name => `u/${name}`};
+    let timer = null;
+    let latest = '';
+    
+    function hide() {
+        box.hidden = true;
+        box.replaceChildren();
+    }
+    
+    function show(results) {
+        const links = [];
+        for (const [kind, items] of Object.entries(results)) {
+            for (const item of items) {
+                const link = document.createElement('a');
+                link.className = 'list-group-item list-group-item-action';
+                link.setAttribute('role', 'option');
+                link.href = item.url;
+                link.textContent = labels[kind](item.name || item.username);
+                links.push(link);
+            }
+        }
+        box.replaceChildren(...links);
+        box.hidden = links.length === 0;
+    }
+    
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        latest = query;
+        if (!query) {
+            hide();
+            return;
+        }
+        timer = setTimeout(function() {
+            const url = `${input.dataset.autocompleteUrl}?limit=5&q=${encodeURIComponent(query)}`;
+            fetch(url, {headers: {'Accept': 'application/json'}})
+            .then(response => response.ok ? response.json() : null)
+            .then(results => {
+                // Ignore answers to queries the user has already typed past
+                if (results && query === latest) {
+                    show(results);
+                }
+            })
+            .catch(hide);
+        }, 120);
+    });
+    
+    input.addEventListener('keydown', function(e) {
+        if (e.key === 'Escape') {
+            hide();
+        }
+    });
+    document.addEventListener('click', function(e) {
+        if (!box.contains(e.target) && e.target !== input) {
+            hide();
+        }
+    });
+}
+
+/**
+ * Append the next page of a cursor-paginated list in place. The next page is
+ * fetched as a normal page; its list items and pagination controls replace
+ * the current controls, so no special server-side fragment is needed.
+ */
+function setupLoadMorePages() {
+    document.addEventListener('click', function(e) {
+        const link = e.target.closest('.load-more-link[data-target]');
+        if (!link) {
+            return;
+        }
+        const list = document.querySelector(link.dataset.target);
+        if (!list) {
+            return;
+        }
+        e.preventDefault();
+        
+        const nav = link.closest('.load-more-nav');
+        link.setAttribute('aria-busy', 'true');
+        
+        fetch(link.href, {credentials: 'include'})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Failed to load the next page');
+            }
+            return response.text();
+        })
+        .then(html => {
+            const doc = new DOMParser().parseFromString(html, 'text/html');
+            const nextList = doc.querySelector(link.dataset.target);
+            if (nextList) {
+                const items = Array.from(nextList.children)
+                    .filter(el => !el.classList.contains('load-more-nav'));
+                // The controls may live inside the list; keep them last
+                if (list.contains(nav)) {
+                    nav.before(...items);
+                } else {
+                    list.append(...items);
+                }
+            }
+            // The fetched page's controls point at the page after it
+            const nextLink = doc.querySelector(`.load-more-link[data-target="${link.dataset.target}"]`);
+            if (nextLink) {
+                link.href = nextLink.href;
+                link.removeAttribute('aria-busy');
+            } else {
+                nav.remove();
+            }
+        })
+        .catch(error => {
+            console.error(error);
+            // Fall back to a full page load
+            window.location.href = link.href;
+        });
+    });
+}
+
 /**
  * Set up the collapsible thread functionality
  */
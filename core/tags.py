@@ -0,0 +1,147 @@
+"""
+Post tag usage counters and the popular tags leaderboard.
+
+TagUsage holds how many posts use each tag. It is kept up to date from
+taggit's m2m_changed signals (see core.models), so the leaderboard is a
+LIMIT query on an indexed column instead of a GROUP BY over every tagged item.
+
+The leaderboard itself is cached twice: in the shared cache under a version
+number, and in process memory alongside the version it was built for. Any
+change to the counters bumps the version, so in the steady state reading the
+leaderboard costs one cache lookup and no queries. Every process must see
+the version bumps, so the leaderboard is only cached when the default cache
+is shared (see core.checks); otherwise it is read from the counters.
+"""
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from taggit.models import TaggedItem
+
+from .checks import is_shared_cache
+
+LEADERBOARD_SIZE = 15
+LEADERBOARD_TIMEOUT = 60 * 60
+VERSION_KEY = 'core:tag_leaderboard:version'
+
+# (version, tags) of the last leaderboard built by this process
+_local_leaderboard = (None, None)
+
+
+def _leaderboard_key(version):
+    return f'core:tag_leaderboard:{version}'
+
+
+def _initial_version():
+    # Start from the clock rather than 1 so a flushed cache never hands out a
+    # version that a process still holds in memory
+    return time.time_ns()
+
+
+def enabled():
+    """Whether the leaderboard is cached, which needs a shared cache"""
+    return is_shared_cache(caches[DEFAULT_CACHE_ALIAS])
+
+
+def get_leaderboard_version():
+    """Return the current leaderboard version, starting one if there is none"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_leaderboard():
+    """Bump the leaderboard version so every process rebuilds it"""
+    if not enabled():
+        return
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _initial_version(), timeout=None)
+
+
+def adjust_tag_usage(tag_ids, delta):
+    """Atomically add delta to the post count of each tag in tag_ids"""
+    from .models import TagUsage
+
+    tag_ids = list(tag_ids)
+    if not tag_ids or not delta:
+        return
+
+    if delta > 0:
+        # Make sure every tag has a counter row before incrementing it
+        TagUsage.objects.bulk_create(
+            [TagUsage(tag_id=tag_id) for tag_id in tag_ids],
+            ignore_conflicts=True,
+        )
+        expression = F('post_count') + delta
+    else:
+        expression = Greatest(F('post_count') + delta, 0)
+
+    TagUsage.objects.filter(tag_id__in=tag_ids).update(post_count=expression)
+    transaction.on_commit(invalidate_leaderboard)
+
+
+def post_tag_counts():
+    """Queryset of (tag_id, post count) computed from the tagged items table"""
+    from .models import Post
+
+    return TaggedItem.objects.filter(content_type=ContentType.objects.get_for_model(Post))\
+        .order_by()\
+        .values('tag_id')\
+        .annotate(total=Count('pk'))\
+        .values_list('tag_id', 'total')
+
+
+def rebuild_tag_usage():
+    """Recompute every counter from the tagged items table. Returns the number of tags."""
+    from .models import TagUsage
+
+    with transaction.atomic():
+        TagUsage.objects.all().delete()
+        rows = TagUsage.objects.bulk_create(
+            [TagUsage(tag_id=tag_id, post_count=total) for tag_id, total in post_tag_counts()]
+        )
+        transaction.on_commit(invalidate_leaderboard)
+    return len(rows)
+
+
+def _build_leaderboard(limit):
+    from .models import TagUsage
+
+    usages = TagUsage.objects.filter(post_count__gt=0)\
+        .select_related('tag')\
+        .order_by('-post_count', 'tag__name')[:limit]
+    return [
+        {'name': usage.tag.name, 'slug': usage.tag.slug, 'num_times': usage.post_count}
+        for usage in usages
+    ]
+
+
+def get_popular_tags(limit=LEADERBOARD_SIZE):
+    """
+    Return the most used post tags as a list of dicts with name, slug and
+    num_times, from process memory or the shared cache when they are current.
+    """
+    global _local_leaderboard
+
+    if not enabled():
+        return _build_leaderboard(limit)
+    version = get_leaderboard_version()
+    local_version, tags = _local_leaderboard
+    if version is not None and local_version == version:
+        return tags[:limit]
+
+    key = _leaderboard_key(version)
+    tags = cache.get(key)
+    if tags is None:
+        tags = _build_leaderboard(LEADERBOARD_SIZE)
+        cache.set(key, tags, LEADERBOARD_TIMEOUT)
+
+    _local_leaderboard = (version, tags)
+    return tags[:limit]
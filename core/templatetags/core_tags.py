@@ -4,6 +4,7 @@ from django.utils.safestring import mark_safe
 from django.forms import widgets
 from django.template.defaultfilters import truncatewords_html as django_truncatewords_html
 from core.models import Profile
+from core.fragments import post_card_timeout as _post_card_timeout
 import os
 
 register = template.Library()
@@ -21,7 +22,7 @@ def get_item(dictionary, key):
     Usage:
     {{ dictionary|get_item:key_variable }}
     """
-    if dictionary is None:
+    if not dictionary:
         return None
     return dictionary.get(key)
 
@@ -44,7 +45,7 @@ def get_dict_item(dictionary, key):
     Usage:
     {% get_dict_item dictionary key_variable as value %}
     """
-    if dictionary is None:
+    if not dictionary:
         return None
     return dictionary.get(key)
 
@@ -253,4 +254,26 @@ def truncatewords_html(value, arg):
     Usage:
     {{ html_content|truncatewords_html:50 }}
     """
-    return django_truncatewords_html(value, arg)
\ No newline at end of file
+    return django_truncatewords_html(value, arg)
+
+
+@register.filter
+def post_card_timeout(created_at):
+    """
+    Seconds a rendered post card may be cached for, given the post's creation time.
+    
+    Usage:
+    {% cache post.created_at|post_card_timeout post_card post.id post.cache_version %}
+    """
+    return _post_card_timeout(created_at)
+
+
+@register.filter
+def absolute_uri(location, request):
+    """
+    Build an absolute URL for a path on this site.
+    
+    Usage:
+    {{ post.get_absolute_url|absolute_uri:request }}
+    """
+    return request.build_absolute_uri(location)
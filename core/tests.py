@@ -1,10 +1,48 @@
-from django.test import TestCase
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.template import engines
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, modify_settings, override_settings
 from django.urls import reverse
-from django.contrib.auth.models import User
-from .models import Community, Post, Comment, Vote
+from django.utils import timezone
+from django.contrib.auth.models import User, UserManager, AnonymousUser
+from django.db import connection, transaction, OperationalError
+from django.db.models import QuerySet
+from django.test.utils import CaptureQueriesContext
+from silk.collector import DataCollector
+from taggit.models import Tag
+from .models import Profile, Community, Post, Comment, Vote, Notification, TagUsage, SearchDocument, SearchIndexBuild, SearchIndexTask
+from .voting import cast_vote, get_user_votes
+from .karma import recompute_karma
+from .ranking import hot_score, ranked_posts
+from .pagination import keyset_paginate
+from .tags import get_popular_tags
+from .page_cache import page_cache_key
+from .checks import check_shared_caches
+from .query_cache import install, reset_stats, stats, uninstall
+from .comment_tree import load_comment_tree
+from .filters import PostFilter
+from . import autocomplete, search as search_module
+from .search import load_objects, process_index_queue, queue_stats, search, sync_documents
+from .search_cache import reset_stats as reset_search_cache_stats, stats as search_cache_stats
+from .search_facets import search_facets
+from .views.search_views import ADVANCED_SEARCH_TYPES
+from .api.serializers import CommunitySerializer, PostListSerializer
 
 class DiscussTestCase(TestCase):
     def setUp(self):
+        # Cached post cards are keyed by post id, which the test database reuses
+        cache.clear()
+        
         # Create test users
         self.user1 = User.objects.create_user('testuser1', 'test1@example.com', 'password123')
         self.user2 = User.objects.create_user('testuser2', 'test2@example.com', 'password123')
@@ -88,3 +126,1415 @@ class DiscussTestCase(TestCase):
         # self.assertContains(response, 'Test Post')
         # self.assertContains(response, 'This is a test post')
         # self.assertContains(response, 'This is a test comment')
+
+
+class VoteCounterTestCase(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author', email='author@example.com')
+        self.community = Community.objects.create(name='Counters', description='Vote counters')
+        self.post = Post.objects.create(
+            title='Hot Post',
+            content='Everyone votes here',
+            author=self.author,
+            community=self.community,
+            post_type='text'
+        )
+        self.voters = [
+            User.objects.create(username=f'voter{i}', email=f'voter{i}@example.com')
+            for i in range(12)
+        ]
+
+    def assertCountsMatchVotes(self, post):
+        post.refresh_from_db()
+        self.assertEqual(post.upvote_count, post.votes.filter(value=1).count())
+        self.assertEqual(post.downvote_count, post.votes.filter(value=-1).count())
+
+    def test_stale_instances_do_not_lose_votes(self):
+        # Every voter works with its own stale copy of the post
+        stale_posts = [Post.objects.get(pk=self.post.pk) for _ in self.voters]
+        for voter, stale_post in zip(self.voters, stale_posts):
+            Vote.objects.create(user=voter, post=stale_post, value=1)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.upvote_count, len(self.voters))
+        self.assertCountsMatchVotes(self.post)
+
+    def test_cast_vote_toggle_flip_and_remove(self):
+        voter = self.voters[0]
+        self.assertEqual(cast_vote(voter, 1, post=self.post)[0], 'added')
+        self.assertEqual(cast_vote(voter, -1, post=self.post)[0], 'changed')
+        self.assertCountsMatchVotes(self.post)
+        self.assertEqual(self.post.vote_count, -1)
+
+        self.assertEqual(cast_vote(voter, -1, post=self.post, toggle=False)[0], 'unchanged')
+        self.assertEqual(cast_vote(voter, -1, post=self.post)[0], 'removed')
+        self.assertCountsMatchVotes(self.post)
+        self.assertEqual(self.post.vote_count, 0)
+
+    def test_parallel_voters_no_drift(self):
+        barrier = threading.Barrier(len(self.voters))
+        errors = []
+
+        def vote(voter, index):
+            try:
+                barrier.wait()
+                for round_number in range(6):
+                    value = 1 if (index + round_number) % 2 else -1
+                    while True:
+                        try:
+                            cast_vote(voter, value, post=self.post)
+                            break
+                        except OperationalError:
+                            # SQLite serializes writers; just retry the whole vote
+                            time.sleep(0.01)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=vote, args=(voter, index))
+            for index, voter in enumerate(self.voters)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertCountsMatchVotes(self.post)
+
+    def test_saving_a_stale_comment_keeps_votes_and_tree(self):
+        comment = Comment.objects.create(post=self.post, author=self.author, content='First')
+        stale = Comment.objects.get(pk=comment.pk)
+        cast_vote(self.voters[0], 1, comment=comment)
+        reply = Comment.objects.create(post=self.post, author=self.voters[1], content='Reply', parent=comment)
+
+        # As an edit in the admin would
+        stale.content = 'First, edited'
+        stale.save()
+
+        comment.refresh_from_db()
+        self.assertEqual((comment.content, comment.upvote_count), ('First, edited', 1))
+        self.assertEqual(list(comment.get_descendants()), [reply])
+
+        # A moved comment still takes its new place in the tree
+        reply.parent = None
+        reply.save()
+        comment.refresh_from_db()
+        reply.refresh_from_db()
+        self.assertEqual((comment.get_descendant_count(), reply.level), (0, 0))
+        self.assertNotEqual(reply.tree_id, comment.tree_id)
+
+
+class ReconcileVoteCountsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reconciler', email='reconciler@example.com')
+        self.community = Community.objects.create(name='Drift', description='Drifted counters')
+        self.post = Post.objects.create(
+            title='Drifted Post',
+            author=self.user,
+            community=self.community,
+        )
+        self.comment = Comment.objects.create(post=self.post, author=self.user, content='Drifted comment')
+        Vote.objects.create(user=self.user, post=self.post, value=1)
+        Vote.objects.create(user=self.user, comment=self.comment, value=-1)
+        Post.objects.filter(pk=self.post.pk).update(upvote_count=7, downvote_count=3)
+        Comment.objects.filter(pk=self.comment.pk).update(upvote_count=2)
+
+    def test_dry_run_reports_without_writing(self):
+        out = StringIO()
+        call_command('reconcile_vote_counts', '--dry-run', stdout=out)
+        self.assertIn('1 posts have drifted vote counts', out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.upvote_count, 7)
+
+    def test_reconcile_fixes_drift(self):
+        # Rankings computed from the drifted counts
+        Post.objects.filter(pk=self.post.pk).update(score=4, hot_score=0, controversy_score=9.8, rising_score=-2)
+        version = Post.objects.get(pk=self.post.pk).cache_version
+        call_command('reconcile_vote_counts', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.comment.refresh_from_db()
+        self.assertEqual((self.post.upvote_count, self.post.downvote_count), (1, 0))
+        self.assertEqual((self.comment.upvote_count, self.comment.downvote_count), (0, 1))
+        self.assertEqual((self.post.score, self.post.controversy_score), (1, 0))
+        self.assertEqual(self.post.hot_score, hot_score(1, 0, self.post.created_at))
+        self.assertGreater(self.post.rising_score, 0)
+        self.assertEqual(self.post.cache_version, version + 1)
+
+
+def use_shared_cache(test):
+    """Give a test a default cache shared between processes (files), as caches that invalidate need"""
+    cache_dir = tempfile.mkdtemp()
+    shared_cache = override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir},
+    })
+    shared_cache.enable()
+    test.addCleanup(shutil.rmtree, cache_dir)
+    test.addCleanup(shared_cache.disable)
+
+
+class QueryCountTestCase(TestCase):
+    """Base class for tests that assert exact query counts"""
+
+    def setUp(self):
+        # Silk keeps the last profiled request on a thread-local collector and
+        # would add its EXPLAIN queries to the counts
+        DataCollector().clear()
+        # Start empty so values cached by an earlier test don't hide queries
+        cache.clear()
+
+
+class CommentTreeTestCase(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='commenter', email='commenter@example.com')
+        self.community = Community.objects.create(name='Threads', description='Deep threads')
+        self.post = Post.objects.create(title='Thread Post', author=self.user, community=self.community)
+        self.roots = [
+            Comment.objects.create(post=self.post, author=self.user, content=f'Root {i}')
+            for i in range(3)
+        ]
+        # A chain of replies eight levels deep under the first root
+        parent = self.roots[0]
+        self.chain = []
+        for i in range(8):
+            parent = Comment.objects.create(post=self.post, author=self.user, content=f'Reply {i}', parent=parent)
+            self.chain.append(parent)
+        # Wide fan-out under the second root
+        for i in range(5):
+            Comment.objects.create(post=self.post, author=self.user, content=f'Sibling {i}', parent=self.roots[1])
+
+    def test_single_query_with_depth_cap(self):
+        with self.assertNumQueries(1):
+            tree = load_comment_tree(self.post, max_depth=3)
+            # Rendering attributes must not trigger lazy loads
+            for node in tree.nodes:
+                node.author.profile
+                node.post.id
+                node.is_leaf_node()
+        self.assertEqual([c.pk for c in tree.comments], [c.pk for c in self.roots])
+        self.assertEqual(max(node.level for node in tree.nodes), 3)
+        deepest = [node for node in tree.nodes if node.level == 3][0]
+        self.assertFalse(deepest.is_leaf_node())
+        self.assertIsNone(deepest.more_cursor)
+
+    def test_breadth_cap_and_load_more_cursor(self):
+        tree = load_comment_tree(self.post, max_children=2)
+        self.assertEqual(len(tree.comments), 2)
+        self.assertIsNotNone(tree.more_cursor)
+
+        wide_root = tree.comments[1]
+        self.assertEqual(len(wide_root.child_comments), 2)
+        self.assertEqual(wide_root.more_count, 3)
+
+        more = load_comment_tree(self.post, cursor=wide_root.more_cursor, max_children=2)
+        self.assertEqual([c.content for c in more.comments], ['Sibling 2', 'Sibling 3'])
+        rest = load_comment_tree(self.post, cursor=more.more_cursor, max_children=2)
+        self.assertEqual([c.content for c in rest.comments], ['Sibling 4'])
+        self.assertIsNone(rest.more_cursor)
+
+        more_roots = load_comment_tree(self.post, cursor=tree.more_cursor, max_children=2)
+        self.assertEqual([c.pk for c in more_roots.comments], [self.roots[2].pk])
+
+    def test_thread_root(self):
+        tree = load_comment_tree(self.post, root=self.chain[1], max_depth=2)
+        self.assertEqual(tree.comments[0].pk, self.chain[1].pk)
+        self.assertEqual([node.pk for node in tree.nodes], [c.pk for c in self.chain[1:4]])
+
+    def test_comment_thread_view(self):
+        response = self.client.get(reverse('comment_thread', kwargs={'pk': self.chain[0].pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Reply 4')
+        self.assertNotContains(response, 'Reply 6')
+        self.assertContains(response, 'Continue this thread')
+
+    def test_load_more_view(self):
+        tree = load_comment_tree(self.post, max_children=2)
+        url = reverse('load_more_comments', kwargs={'pk': self.post.pk})
+        response = self.client.get(url, {'cursor': tree.comments[1].more_cursor}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Sibling 2')
+        self.assertContains(response, 'Sibling 4')
+        self.assertNotContains(response, 'Sibling 1')
+
+        response = self.client.get(url, {'cursor': 'tampered'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 404)
+
+        # Without JavaScript, replies open their thread and root comments a page
+        response = self.client.get(url, {'cursor': tree.comments[1].more_cursor})
+        self.assertRedirects(response, reverse('comment_thread', kwargs={'pk': tree.comments[1].pk}))
+        response = self.client.get(url, {'cursor': tree.more_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'core/posts/more_comments.html')
+        self.assertEqual([c.pk for c in response.context['comments']], [self.roots[2].pk])
+        self.assertNotContains(response, 'Root 0')
+
+
+class UserVoteStateTestCase(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='stateful', email='stateful@example.com')
+        self.community = Community.objects.create(name='States', description='Vote states')
+        self.posts = [
+            Post.objects.create(title=f'Post {i}', author=self.user, community=self.community)
+            for i in range(3)
+        ]
+        self.comments = [
+            Comment.objects.create(post=self.posts[0], author=self.user, content=f'Comment {i}')
+            for i in range(3)
+        ]
+        Vote.objects.create(user=self.user, post=self.posts[0], value=1)
+        Vote.objects.create(user=self.user, post=self.posts[2], value=-1)
+        Vote.objects.create(user=self.user, comment=self.comments[1], value=1)
+
+    def test_get_user_votes_batches_queries(self):
+        with self.assertNumQueries(2):
+            post_votes, comment_votes = get_user_votes(
+                self.user,
+                post_ids=[post.pk for post in self.posts],
+                comment_ids=[comment.pk for comment in self.comments],
+            )
+        self.assertEqual(post_votes, {self.posts[0].pk: 1, self.posts[2].pk: -1})
+        self.assertEqual(comment_votes, {self.comments[1].pk: 1})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_votes(AnonymousUser(), post_ids=[self.posts[0].pk]), ({}, {}))
+
+    def test_vote_state_endpoint(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('vote_state_api'), {
+            'posts': ','.join(str(post.pk) for post in self.posts),
+            'comments': f'{self.comments[1].pk},bogus',
+        })
+        self.assertEqual(response.json(), {
+            'posts': {str(self.posts[0].pk): 1, str(self.posts[2].pk): -1},
+            'comments': {str(self.comments[1].pk): 1},
+        })
+
+
+class CommentCountTestCase(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='counter', email='counter@example.com')
+        self.community = Community.objects.create(name='Counts', description='Comment counts')
+        self.post = Post.objects.create(title='Busy Post', author=self.user, community=self.community)
+        self.quiet_post = Post.objects.create(title='Quiet Post', author=self.user, community=self.community)
+        self.root = Comment.objects.create(post=self.post, author=self.user, content='Root')
+        reply = Comment.objects.create(post=self.post, author=self.user, content='Reply', parent=self.root)
+        Comment.objects.create(post=self.post, author=self.user, content='Nested', parent=reply)
+        self.other = Comment.objects.create(post=self.post, author=self.user, content='Other')
+
+    def test_create_and_subtree_delete(self):
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 4)
+
+        # Deleting the root removes its two descendants as well
+        self.root.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.post.comments.count(), 1)
+
+        # The post loaded on the comment is kept in step
+        self.other.delete()
+        self.assertEqual(self.other.post.comment_count, 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_most_comments_sort_without_join(self):
+        queryset = PostFilter({'sort': 'comments'}, queryset=Post.objects.all()).qs
+        self.assertNotIn('JOIN', str(queryset.query))
+        self.assertEqual(list(queryset), [self.post, self.quiet_post])
+
+        posts = list(queryset.select_related('author', 'community').prefetch_related('tags'))
+        with CaptureQueriesContext(connection) as queries:
+            data = PostListSerializer(posts, many=True).data
+        self.assertFalse([q for q in queries.captured_queries if 'core_comment' in q['sql']])
+        self.assertEqual([row['comment_count'] for row in data], [4, 0])
+
+
+class KarmaTestCase(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create(username='author', email='author@example.com')
+        self.replier = User.objects.create(username='replier', email='replier@example.com')
+        self.voter = User.objects.create(username='voter', email='voter@example.com')
+        self.community = Community.objects.create(name='Karma', description='Karma tests')
+        self.post = Post.objects.create(title='Karma Post', author=self.author, community=self.community)
+        self.comment = Comment.objects.create(post=self.post, author=self.replier, content='Reply')
+        Comment.objects.create(post=self.post, author=self.author, content='Answer', parent=self.comment)
+
+    def karma(self, user):
+        return Profile.objects.get(user=user).karma
+
+    def assert_matches_recompute(self):
+        stored = dict(Profile.objects.values_list('user_id', 'karma'))
+        self.assertEqual(recompute_karma(), 0)
+        self.assertEqual(dict(Profile.objects.values_list('user_id', 'karma')), stored)
+
+    def test_incremental_karma(self):
+        self.assertEqual(self.karma(self.author), 3)
+        self.assertEqual(self.karma(self.replier), 1)
+
+        cast_vote(self.voter, 1, post=self.post)
+        cast_vote(self.voter, -1, comment=self.comment)
+        self.assertEqual(self.karma(self.author), 4)
+        self.assertEqual(self.karma(self.replier), 0)
+
+        cast_vote(self.voter, 1, comment=self.comment)
+        self.assertEqual(self.karma(self.replier), 2)
+        self.assert_matches_recompute()
+
+        # Deleting the comment removes the author's reply underneath it too
+        self.comment.delete()
+        self.assertEqual(self.karma(self.replier), 0)
+        self.assertEqual(self.karma(self.author), 3)
+        self.assert_matches_recompute()
+
+        Post.objects.get(pk=self.post.pk).delete()
+        self.assertEqual(self.karma(self.author), 0)
+        self.assert_matches_recompute()
+
+    def test_recompute_karma_command(self):
+        Profile.objects.update(karma=999)
+        out = StringIO()
+        call_command('recompute_karma', '--dry-run', stdout=out)
+        self.assertIn('3 profiles have drifted karma', out.getvalue())
+        self.assertEqual(self.karma(self.author), 999)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(recompute_karma(), 3)
+        self.assertEqual(self.karma(self.author), 3)
+        self.assertEqual(self.karma(self.voter), 0)
+
+
+class RankingTestCase(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create(username='ranked', email='ranked@example.com')
+        self.voters = [User.objects.create(username=f'ranker{i}', email=f'ranker{i}@example.com') for i in range(4)]
+        self.community = Community.objects.create(name='Ranked', description='Ranking tests')
+        self.quiet = Post.objects.create(title='Quiet', author=self.author, community=self.community)
+        self.loved = Post.objects.create(title='Loved', author=self.author, community=self.community)
+        self.split = Post.objects.create(title='Split', author=self.author, community=self.community)
+
+    def test_scores_follow_votes(self):
+        for voter in self.voters:
+            cast_vote(voter, 1, post=self.loved)
+        for voter, value in zip(self.voters, (1, 1, -1, -1)):
+            cast_vote(voter, value, post=self.split)
+
+        self.loved.refresh_from_db()
+        self.assertEqual(self.loved.score, 4)
+        self.assertAlmostEqual(self.loved.hot_score, hot_score(4, 0, self.loved.created_at), places=5)
+        self.assertGreater(self.loved.rising_score, 0)
+
+        posts = Post.objects.filter(community=self.community)
+        self.assertEqual(list(ranked_posts(posts, 'top'))[0], self.loved)
+        self.assertEqual(list(ranked_posts(posts, 'controversial'))[0], self.split)
+        self.assertEqual(list(ranked_posts(posts, 'hot'))[0], self.loved)
+
+        # Removing the votes brings the score back down
+        for voter in self.voters:
+            cast_vote(voter, 1, post=self.loved)
+        self.loved.refresh_from_db()
+        self.assertEqual(self.loved.score, 0)
+        self.assertEqual(self.loved.hot_score, hot_score(0, 0, self.loved.created_at))
+
+    def test_feed_uses_stored_scores(self):
+        cast_vote(self.voters[0], 1, post=self.loved)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('community_detail', kwargs={'pk': self.community.pk}), {'sort': 'top'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries.captured_queries if 'core_vote' in q['sql']])
+        self.assertEqual(response.context['sort'], 'top')
+
+    def test_refresh_rankings_decays_rising(self):
+        cast_vote(self.voters[0], 1, post=self.loved)
+        Post.objects.filter(pk=self.loved.pk).update(created_at=timezone.now() - timedelta(hours=10))
+        before = Post.objects.get(pk=self.loved.pk).rising_score
+
+        out = StringIO()
+        call_command('refresh_rankings', stdout=out)
+        self.assertIn('Refreshed rankings on 3 posts', out.getvalue())
+        self.assertLess(Post.objects.get(pk=self.loved.pk).rising_score, before)
+
+
+class KeysetPaginationTestCase(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='pager', email='pager@example.com')
+        self.community = Community.objects.create(name='Pages', description='Pagination tests')
+        self.posts = [
+            Post.objects.create(title=f'Paged {i}', author=self.user, community=self.community)
+            for i in range(25)
+        ]
+        # Identical sort keys must still page without gaps or repeats
+        Post.objects.filter(pk__in=[post.pk for post in self.posts[:12]]).update(hot_score=1.0)
+
+    def walk(self, queryset, per_page=10):
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_paginate(queryset, cursor=cursor, per_page=per_page)
+            seen.extend(post.pk for post in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_post_once(self):
+        for sort in ('new', 'hot', 'top'):
+            seen = self.walk(ranked_posts(Post.objects.all(), sort))
+            self.assertEqual(len(seen), 25)
+            self.assertEqual(set(seen), {post.pk for post in self.posts})
+
+    def test_deep_page_is_a_single_limited_query(self):
+        page = keyset_paginate(ranked_posts(Post.objects.all(), 'hot'))
+        with CaptureQueriesContext(connection) as queries:
+            keyset_paginate(ranked_posts(Post.objects.all(), 'hot'), cursor=page.next_cursor)
+        self.assertEqual(len(queries.captured_queries), 1)
+        sql = queries.captured_queries[0]['sql']
+        self.assertIn('LIMIT 11', sql)
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT', sql)
+
+    def test_feed_views(self):
+        response = self.client.get(reverse('home'), {'sort': 'new'})
+        self.assertContains(response, 'Paged 24')
+        self.assertNotContains(response, 'Paged 14<')
+        next_cursor = response.context['page'].next_cursor
+        response = self.client.get(reverse('community_detail', kwargs={'pk': self.community.pk}), {'sort': 'new', 'cursor': next_cursor})
+        self.assertEqual([post.title for post in response.context['posts']][:2], ['Paged 14', 'Paged 13'])
+
+        response = self.client.get(reverse('home'), {'cursor': 'tampered'})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('profile', kwargs={'username': 'pager'}))
+        self.assertEqual(len(response.context['posts']), 10)
+        response = self.client.get(reverse('profile', kwargs={'username': 'pager'}), {'posts_cursor': response.context['posts_page'].next_cursor})
+        self.assertEqual(len(response.context['posts']), 10)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('notification_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_cursor_pagination(self):
+        response = self.client.get('/api/posts/', {'sort': 'new'})
+        data = response.json()
+        self.assertNotIn('count', data)
+        self.assertEqual(len(data['results']), 10)
+        response = self.client.get(data['next'])
+        self.assertEqual(response.json()['results'][0]['title'], 'Paged 14')
+
+
+class TagUsageTestCase(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        use_shared_cache(self)
+        self.user = User.objects.create(username='tagger', email='tagger@example.com')
+        self.community = Community.objects.create(name='Tagged', description='Tag tests')
+        self.posts = [
+            Post.objects.create(title=f'Tagged {i}', author=self.user, community=self.community)
+            for i in range(3)
+        ]
+
+    def usage(self):
+        return dict(TagUsage.objects.values_list('tag__name', 'post_count'))
+
+    def test_counters_follow_tag_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for post in self.posts:
+                post.tags.add('django')
+            self.posts[0].tags.add('python', 'orm')
+            # Profile interests share taggit's table but are not post tags
+            self.user.profile.interests.add('django', 'cooking')
+        self.assertEqual(self.usage(), {'django': 3, 'python': 1, 'orm': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[0].tags.remove('orm')
+            self.posts[1].tags.clear()
+            self.posts[2].tags.set(['python'])
+            self.posts[0].delete()
+        self.assertEqual(self.usage(), {'django': 0, 'python': 1, 'orm': 0})
+
+        TagUsage.objects.update(post_count=42)
+        call_command('rebuild_tag_usage', stdout=StringIO())
+        self.assertEqual(self.usage(), {'python': 1})
+
+    def test_leaderboard_is_cached_until_tags_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[0].tags.add('django', 'python')
+            self.posts[1].tags.add('django')
+        self.assertEqual([tag['name'] for tag in get_popular_tags()], ['django', 'python'])
+
+        with self.assertNumQueries(0):
+            get_popular_tags()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('home'))
+        self.assertFalse([q for q in queries.captured_queries if 'core_tagusage' in q['sql'] or 'COUNT' in q['sql']])
+        DataCollector().clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[1].tags.add('python')
+            self.posts[2].tags.add('python')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_popular_tags()[0], {'name': 'python', 'slug': 'python', 'num_times': 3})
+
+    def test_leaderboard_is_not_cached_in_a_local_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.posts[0].tags.add('django')
+            self.assertEqual([tag['name'] for tag in get_popular_tags()], ['django'])
+            # No version bump reaches this process, as for another process's change
+            self.posts[1].tags.add('python')
+            self.posts[2].tags.add('python')
+            with self.assertNumQueries(1):
+                self.assertEqual([tag['name'] for tag in get_popular_tags()], ['python', 'django'])
+
+
+class ContextProcessorTestCase(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        use_shared_cache(self)
+        self.user = User.objects.create(username='reader', email='reader@example.com')
+        self.sender = User.objects.create(username='sender', email='sender@example.com')
+        self.navbar = engines['django'].from_string(
+            '{{ unread_notification_count }} {{ user_profile.user_id }} {{ all_tags|length }}'
+        )
+
+    def get_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return request
+
+    def notify(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(recipient=self.user, sender=self.sender, notification_type='reply', text='Hi')
+
+    def test_unused_values_are_not_loaded(self):
+        fragment = engines['django'].from_string('<p>fragment</p>')
+        with self.assertNumQueries(0):
+            fragment.render(request=self.get_request())
+
+    def test_values_are_memoized_and_cached(self):
+        self.notify()
+        request = self.get_request()
+        # Unread count, profile and tag leaderboard, once for the whole request
+        with self.assertNumQueries(3):
+            self.assertEqual(self.navbar.render(request=request), f'1 {self.user.pk} 3')
+            self.navbar.render(request=request)
+        with self.assertNumQueries(0):
+            self.navbar.render(request=self.get_request())
+
+        self.notify()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.navbar.render(request=self.get_request()), f'2 {self.user.pk} 3')
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('mark_all_notifications_read'))
+        DataCollector().clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.navbar.render(request=self.get_request()), f'0 {self.user.pk} 3')
+
+
+class UnreadNotificationCounterTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='recipient', email='recipient@example.com')
+        self.sender = User.objects.create(username='notifier', email='notifier@example.com')
+        self.community = Community.objects.create(name='Notified', description='Notification tests')
+        self.post = Post.objects.create(title='Watched', author=self.user, community=self.community)
+        self.comment = Comment.objects.create(post=self.post, author=self.sender, content='Reply')
+
+    def notify(self, **kwargs):
+        return Notification.objects.create(
+            recipient=self.user, sender=self.sender, notification_type='reply', text='Hi', **kwargs
+        )
+
+    def unread(self):
+        return Profile.objects.get(user=self.user).unread_notification_count
+
+    def test_counter_follows_reads_and_deletes(self):
+        notifications = [self.notify() for _ in range(5)]
+        self.assertEqual(self.unread(), 5)
+
+        # Marking the same notification read twice only counts once
+        notifications[0].mark_as_read()
+        Notification.objects.get(pk=notifications[0].pk).mark_as_read()
+        self.assertEqual(self.unread(), 4)
+
+        # Saving a stale profile doesn't overwrite the counter
+        profile = Profile.objects.get(user=self.user)
+        self.notify()
+        profile.bio = 'Edited'
+        profile.save()
+        self.assertEqual(self.unread(), 5)
+
+        self.client.force_login(self.user)
+        self.client.get(reverse('mark_notification_read', kwargs={'pk': notifications[1].pk}))
+        self.client.post(f'/api/notifications/{notifications[2].pk}/mark_read/')
+        self.assertEqual(self.unread(), 3)
+
+        notifications[3].delete()
+        notifications[0].delete()
+        self.assertEqual(self.unread(), 2)
+
+        self.client.get(reverse('mark_all_notifications_read'))
+        self.assertEqual(self.unread(), 0)
+
+    def test_cascade_deletes_and_recompute(self):
+        self.notify(post=self.post)
+        self.notify(post=self.post, comment=self.comment)
+        self.notify()
+        self.assertEqual(self.unread(), 3)
+
+        self.comment.delete()
+        self.assertEqual(self.unread(), 2)
+        self.post.delete()
+        self.assertEqual(self.unread(), 1)
+
+        Profile.objects.update(unread_notification_count=40)
+        out = StringIO()
+        call_command('recompute_unread_notifications', '--dry-run', stdout=out)
+        self.assertIn('recipient: stored 40, actual 1', out.getvalue())
+        call_command('recompute_unread_notifications', stdout=StringIO())
+        self.assertEqual(self.unread(), 1)
+
+
+class PostCardCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='carder', email='carder@example.com')
+        self.voter = User.objects.create(username='card_voter', email='card_voter@example.com')
+        self.community = Community.objects.create(name='Cards', description='Card tests')
+        self.post = Post.objects.create(title='Original title', author=self.author, community=self.community)
+
+    def home(self):
+        return self.client.get(reverse('home')).content.decode()
+
+    def version(self):
+        return Post.objects.values_list('cache_version', flat=True).get(pk=self.post.pk)
+
+    def test_card_is_reused_until_the_post_changes(self):
+        # Logged in, so the full-page cache doesn't come into play
+        self.client.force_login(self.voter)
+        self.assertIn('Original title', self.home())
+
+        # Writes that bypass the model don't invalidate the cached card
+        Post.objects.filter(pk=self.post.pk).update(title='Sneaky title')
+        self.assertIn('Original title', self.home())
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.title = 'Edited title'
+        post.save()
+        self.assertIn('Edited title', self.home())
+
+        version = self.version()
+        Comment.objects.create(post=self.post, author=self.voter, content='First')
+        self.post.tags.add('cards')
+        self.assertEqual(self.version(), version + 2)
+        html = self.home()
+        self.assertIn('1 comment', html)
+        self.assertIn('?tag=cards', html)
+
+        # Renaming the author shows up without a new post version
+        self.author.username = 'renamed'
+        self.author.save()
+        html = self.home()
+        self.assertIn('u/renamed', html)
+        self.assertNotIn('/profile/carder/', html)
+
+    def test_votes_render_outside_the_cached_card(self):
+        self.home()
+        version = self.version()
+        cast_vote(self.voter, 1, post=self.post)
+        self.assertEqual(self.version(), version)
+
+        self.client.force_login(self.voter)
+        html = self.home()
+        self.assertIn('upvote-btn post-vote-btn d-block text-decoration-none voted active', html)
+        self.assertIn(f'id="post-{self.post.pk}-votes"', html)
+        self.assertNotIn('Delete post', html)
+
+        self.client.force_login(self.author)
+        self.assertIn('Delete post', self.home())
+
+
+class AnonymousPageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='paged', email='paged@example.com')
+        self.community = Community.objects.create(name='Paged', description='Page cache tests')
+        self.post = Post.objects.create(title='Cached page', author=self.user, community=self.community)
+        self.other = Post.objects.create(title='Other page', author=self.user, community=self.community)
+        self.urls = [
+            reverse('home'),
+            reverse('community_detail', kwargs={'pk': self.community.pk}),
+            reverse('post_detail', kwargs={'pk': self.post.pk}),
+        ]
+
+    def cache_status(self, url):
+        return self.client.get(url).headers.get('X-Page-Cache')
+
+    def test_pages_are_purged_by_surrogate_key(self):
+        for url in self.urls:
+            self.assertEqual(self.cache_status(url), 'MISS')
+            self.assertEqual(self.cache_status(url), 'HIT')
+
+        response = self.client.get(self.urls[2])
+        self.assertEqual(response.headers['Surrogate-Key'], f'post:{self.post.pk}')
+
+        # A change to another post only purges the pages listing it
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.other, author=self.user, content='Elsewhere')
+        self.assertEqual([self.cache_status(url) for url in self.urls], ['MISS', 'MISS', 'HIT'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.user, 1, post=self.post)
+        self.assertEqual([self.cache_status(url) for url in self.urls], ['MISS', 'MISS', 'MISS'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.community.members.add(self.user)
+        self.assertEqual([self.cache_status(url) for url in self.urls], ['HIT', 'MISS', 'HIT'])
+
+        # Logged-in readers are never served from or stored in the page cache
+        self.client.force_login(self.user)
+        self.assertIsNone(self.cache_status(self.urls[0]))
+
+    @modify_settings(MIDDLEWARE={'append': 'django.middleware.csrf.CsrfViewMiddleware'})
+    def test_cached_pages_carry_each_visitors_csrf_token(self):
+        url = self.urls[0]
+        self.assertEqual(self.cache_status(url), 'MISS')
+
+        # A new visitor gets a token matching the cookie set with the cached page
+        visitor = Client(enforce_csrf_checks=True)
+        response = visitor.get(url)
+        self.assertEqual(response.headers['X-Page-Cache'], 'HIT')
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertNotIn(b'__csrf_token__', response.content)
+        token = re.search(r'name="csrf-token" content="(\w+)"', response.content.decode()).group(1)
+        response = visitor.post(reverse('account_login'), {'login': 'paged', 'password': 'wrong', 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(visitor.post(reverse('account_login'), {'login': 'paged', 'password': 'wrong'}).status_code, 403)
+
+    def test_one_request_regenerates_a_stale_page(self):
+        url = self.urls[0]
+        self.cache_status(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(title='Newer page', author=self.user, community=self.community)
+
+        # Another request holds the regeneration lock: serve the stale copy
+        cache.add(f"{page_cache_key(RequestFactory().get(url))}:lock", 1)
+        response = self.client.get(url)
+        self.assertEqual(response.headers['X-Page-Cache'], 'STALE')
+        self.assertNotIn('Newer page', response.content.decode())
+
+        cache.delete(f"{page_cache_key(RequestFactory().get(url))}:lock")
+        response = self.client.get(url)
+        self.assertEqual(response.headers['X-Page-Cache'], 'MISS')
+        self.assertIn('Newer page', response.content.decode())
+
+
+class QueryCacheTestCase(TransactionTestCase):
+    """
+    Tests for the ORM query cache. It needs a cache shared between processes
+    (here files) and stores nothing inside transactions, so each test runs
+    outside TestCase's.
+    """
+    
+    def setUp(self):
+        DataCollector().clear()
+        use_shared_cache(self)
+        self.assertTrue(install())
+        self.addCleanup(uninstall)
+        reset_stats()
+        self.user = User.objects.create_user(username='cached', password='password123')
+        self.community = Community.objects.create(name='Cached Community', description='Test')
+        self.post = Post.objects.create(title='Cached', author=self.user, community=self.community)
+    
+    def test_get_is_served_from_cache(self):
+        self.assertEqual(Post.objects.get(pk=self.post.pk), self.post)
+        self.assertEqual(User.objects.get(username='cached'), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(Post.objects.get(pk=self.post.pk).title, 'Cached')
+            self.assertEqual(User.objects.get(username='cached'), self.user)
+        # Foreign keys and refresh_from_db() always read the database
+        with self.assertNumQueries(2):
+            Post.objects.get(pk=self.post.pk).author
+            self.post.refresh_from_db()
+        self.assertEqual(stats()['core.post'], {'hits': 2, 'misses': 1})
+        self.assertEqual(stats()['auth.user'], {'hits': 1, 'misses': 1})
+        
+        # Counted in the shared cache, so one report covers every process
+        out = StringIO()
+        call_command('query_cache_stats', '--reset', stdout=out)
+        self.assertIn('core.post: 2 hits, 1 misses, hit rate 66.7%', out.getvalue())
+        self.assertEqual(stats(), {})
+    
+    def test_nothing_is_stored_inside_transactions(self):
+        with transaction.atomic():
+            Post.objects.get(pk=self.post.pk)
+        with self.assertNumQueries(1):
+            Post.objects.get(pk=self.post.pk)
+    
+    def test_writes_invalidate_cached_results(self):
+        Post.objects.get(pk=self.post.pk)
+        
+        # Queryset updates, saves and deletes all bump the post table
+        Post.objects.filter(pk=self.post.pk).update(title='Updated')
+        self.assertEqual(Post.objects.get(pk=self.post.pk).title, 'Updated')
+        
+        self.post.title = 'Saved'
+        self.post.save()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).title, 'Saved')
+        
+        self.post.delete()
+        with self.assertRaises(Post.DoesNotExist):
+            Post.objects.get(pk=self.post.pk)
+    
+    def test_querysets_opt_in_and_out(self):
+        # Lists are only cached on request
+        list(Post.objects.all())
+        with self.assertNumQueries(1):
+            list(Post.objects.all())
+        
+        list(Post.objects.all().cache())
+        with self.assertNumQueries(0):
+            self.assertEqual(list(Post.objects.all().cache()), [self.post])
+        
+        with self.assertNumQueries(1):
+            Post.objects.all().nocache().get(pk=self.post.pk)
+    
+    def test_only_shared_caches_are_used(self):
+        uninstall()
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertFalse(install())
+            self.assertEqual([message.id for message in check_shared_caches(None)], ['core.W001', 'core.W002', 'core.W003'])
+            err = StringIO()
+            call_command('query_cache_stats', stdout=StringIO(), stderr=err)
+            self.assertIn('query cache is off', err.getvalue())
+        self.assertEqual(type(Post.objects.all()), QuerySet)
+        self.assertEqual(type(User.objects), UserManager)
+        self.assertEqual(check_shared_caches(None), [])
+
+
+class RenderedContentTestCase(TestCase):
+    """Tests for the pre-rendered post and comment bodies"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer', password='password123')
+        self.community = Community.objects.create(name='Rendered Community', description='Test')
+    
+    def test_bodies_are_rendered_on_save(self):
+        post = Post.objects.create(
+            title='Long', author=self.user, community=self.community,
+            content='<b>First</b> line\n\n' + ' '.join(['word'] * 60),
+        )
+        self.assertTrue(post.content_html.startswith('<p>&lt;b&gt;First&lt;/b&gt; line</p>'))
+        self.assertTrue(post.excerpt.endswith('word…'))
+        self.assertEqual(len(post.excerpt.split()), 50)
+        self.assertIn('</p>', post.excerpt_html)
+        
+        comment = Comment.objects.create(post=post, author=self.user, content='Short\nreply')
+        self.assertEqual(comment.content_html, '<p>Short<br>reply</p>')
+        self.assertEqual(comment.excerpt, 'Short reply')
+        
+        # Short bodies have no separate list version
+        short = Post.objects.create(title='Short', author=self.user, community=self.community, content='Hi')
+        self.assertEqual(short.excerpt_html, '')
+        
+        # Profiles show comments in full
+        Comment.objects.create(post=post, author=self.user, content=' '.join(['said'] * 59) + ' last')
+        response = self.client.get(reverse('profile', kwargs={'username': 'writer'}))
+        self.assertContains(response, 'said last</p>')
+    
+    def test_only_changed_content_is_rendered_again(self):
+        post = Post.objects.create(title='Edit me', author=self.user, community=self.community, content='Old')
+        Post.objects.filter(pk=post.pk).update(content_html='<p>Marker</p>')
+        
+        post = Post.objects.get(pk=post.pk)
+        post.title = 'Edited'
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).content_html, '<p>Marker</p>')
+        
+        post.content = 'New'
+        post.save(update_fields=['content'])
+        self.assertEqual(Post.objects.get(pk=post.pk).content_html, '<p>New</p>')
+    
+    def test_render_content_command(self):
+        Post.objects.bulk_create([
+            Post(title='Bulk', author=self.user, community=self.community, content='Bulk body'),
+        ])
+        call_command('render_content', workers=1, stdout=StringIO())
+        post = Post.objects.get(title='Bulk')
+        self.assertEqual(post.content_html, '<p>Bulk body</p>')
+        self.assertEqual(post.cache_version, 2)
+
+
+class CommunityCounterTestCase(QueryCountTestCase):
+    """Tests for the stored community member and post counts"""
+    
+    def setUp(self):
+        super().setUp()
+        self.users = [User.objects.create_user(username=f'member{i}', password='password123') for i in range(3)]
+        self.community = Community.objects.create(name='Counted', description='Test')
+        self.other = Community.objects.create(name='Other', description='Test')
+    
+    def assertCounts(self, community, members, posts):
+        community.refresh_from_db()
+        self.assertEqual((community.member_count, community.post_count), (members, posts))
+    
+    def test_members_are_counted_from_both_sides(self):
+        self.community.members.add(*self.users)
+        self.users[0].communities.add(self.other)
+        self.assertCounts(self.community, 3, 0)
+        self.assertCounts(self.other, 1, 0)
+        
+        # Removing someone who isn't a member changes nothing
+        self.other.members.remove(self.users[1])
+        self.assertCounts(self.other, 1, 0)
+        
+        self.users[0].communities.remove(self.community)
+        self.assertCounts(self.community, 2, 0)
+        self.users[0].communities.clear()
+        self.assertCounts(self.other, 0, 0)
+        
+        self.users[1].delete()
+        self.assertCounts(self.community, 1, 0)
+        self.community.members.clear()
+        self.assertCounts(self.community, 0, 0)
+    
+    def test_posts_are_counted(self):
+        post = Post.objects.create(title='One', author=self.users[0], community=self.community)
+        Post.objects.create(title='Two', author=self.users[1], community=self.community)
+        self.assertCounts(self.community, 0, 2)
+        
+        # Editing a loaded community doesn't reset its counters
+        self.community.description = 'Edited'
+        self.community.save()
+        self.assertCounts(self.community, 0, 2)
+        
+        post.delete()
+        self.assertCounts(self.community, 0, 1)
+        self.users[1].delete()
+        self.assertCounts(self.community, 0, 0)
+    
+    def test_recompute_and_list(self):
+        self.community.members.add(*self.users)
+        Community.objects.update(member_count=0, post_count=7)
+        call_command('recompute_community_counts', stdout=StringIO())
+        self.assertCounts(self.community, 3, 0)
+        self.assertCounts(self.other, 0, 0)
+        
+        response = self.client.get(reverse('community_list') + '?sort=members')
+        self.assertEqual(list(response.context['communities']), [self.community, self.other])
+        DataCollector().clear()
+        
+        # Counts come from the columns, not one COUNT per community
+        with self.assertNumQueries(1):
+            data = CommunitySerializer(Community.objects.order_by('name'), many=True).data
+        self.assertEqual([row['member_count'] for row in data], [3, 0])
+
+
+class ConditionalGetTestCase(TestCase):
+    """Tests for ETag/Last-Modified validators and 304 responses"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='conditional', password='password123')
+        self.community = Community.objects.create(name='Conditional', description='Test')
+        self.post = Post.objects.create(title='Validated', content='Body', author=self.user, community=self.community)
+    
+    def revalidate(self, url, response):
+        """Status of a request for url conditional on an earlier response"""
+        DataCollector().clear()
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response.headers['ETag']).status_code
+    
+    def test_pages(self):
+        post_url = reverse('post_detail', args=[self.post.pk])
+        community_url = reverse('community_detail', args=[self.community.pk])
+        post_page = self.client.get(post_url)
+        community_page = self.client.get(community_url)
+        self.assertIn('Last-Modified', post_page.headers)
+        self.assertEqual(self.revalidate(post_url, post_page), 304)
+        self.assertEqual(self.revalidate(community_url, community_page), 304)
+        
+        # A new comment changes the post page only; a vote changes both
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.user, content='New')
+        self.assertEqual(self.revalidate(post_url, post_page), 200)
+        community_page = self.client.get(community_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.user, 1, post=self.post)
+        self.assertEqual(self.revalidate(community_url, community_page), 200)
+        
+        # Logged-in pages show per-user state and are never conditional
+        self.client.force_login(self.user)
+        self.assertNotIn('ETag', self.client.get(post_url).headers)
+    
+    def test_api(self):
+        detail_url = f'/api/posts/{self.post.pk}/'
+        list_url = '/api/comments/'
+        Comment.objects.create(post=self.post, author=self.user, content='Listed')
+        detail = self.client.get(detail_url)
+        listing = self.client.get(list_url)
+        self.assertEqual(self.revalidate(detail_url, detail), 304)
+        self.assertEqual(self.revalidate(list_url, listing), 304)
+        
+        # Nested community counts are part of the post payload
+        self.community.members.add(self.user)
+        self.assertEqual(self.revalidate(detail_url, detail), 200)
+        
+        comment = Comment.objects.get()
+        cast_vote(self.user, -1, comment=comment)
+        self.assertEqual(self.revalidate(list_url, listing), 200)
+
+
+class FullTextSearchTestCase(TestCase):
+    """Tests for the native full-text search index, with the index queue on (the default)"""
+    
+    def setUp(self):
+        use_shared_cache(self)
+        cache.clear()
+        self.user = User.objects.create_user(username='searcher', password='password123')
+        self.community = Community.objects.create(name='Physics', description='Particles and quantum fields')
+        self.post = Post.objects.create(
+            title='Quantum computing explained', content='Qubits and gates',
+            author=self.user, community=self.community,
+        )
+        self.comment = Comment.objects.create(post=self.post, author=self.user, content='Quantum supremacy is near')
+    
+    def found(self, query, **kwargs):
+        process_index_queue()
+        return [document.object for document in load_objects(search(query, **kwargs))]
+    
+    def test_results_are_ranked_and_kept_up_to_date(self):
+        # A title match outranks a body match
+        body_match = Post.objects.create(
+            title='Gardening', content='A quantum of soil', author=self.user, community=self.community,
+        )
+        self.assertEqual(self.found('quantum', models=[Post]), [self.post, body_match])
+        body_match.delete()
+        self.assertEqual(set(self.found('quantum')), {self.post, self.comment, self.community})
+        self.assertEqual(self.found('quantum', models=[Comment]), [self.comment])
+        # Every word must match, stemmed, and FTS syntax is just text
+        self.assertEqual(self.found('computing qubit'), [self.post])
+        self.assertEqual(self.found('gates" (quantum*'), [self.post])
+        
+        self.post.tags.add('hardware')
+        self.assertEqual(self.found('hardware'), [self.post])
+        
+        self.post.title = 'Classical computing'
+        self.post.save()
+        self.assertNotIn(self.post, self.found('quantum'))
+        
+        self.comment.delete()
+        self.assertEqual(self.found('supremacy'), [])
+    
+    def test_logins_are_not_reindexed(self):
+        process_index_queue()
+        self.client.login(username='searcher', password='password123')
+        self.assertFalse(SearchIndexTask.objects.exists())
+    
+    def test_changes_are_queued_once_per_object(self):
+        self.assertEqual(SearchIndexTask.objects.count(), 5)
+        self.assertFalse(SearchDocument.objects.exists())
+        
+        processed, lag = process_index_queue(batch_size=3)
+        self.assertEqual((processed, SearchIndexTask.objects.count()), (3, 2))
+        self.assertGreaterEqual(lag, 0)
+        call_command('process_search_queue', stdout=StringIO())
+        self.assertEqual(queue_stats(), {'pending': 0, 'lag': 0.0})
+        
+        # Saves before the worker runs are merged into one task
+        self.comment.content = 'Quantum advantage is near'
+        self.comment.save()
+        self.comment.save()
+        self.comment.delete()
+        self.assertEqual(queue_stats()['pending'], 1)
+        process_index_queue()
+        self.assertEqual(self.found('advantage'), [])
+        self.assertEqual(self.found('quantum', models=[Post]), [self.post])
+    
+    def test_changes_committed_while_a_batch_runs_stay_queued(self):
+        sync_documents = search_module.sync_documents
+        
+        def sync_then_change(model, pks):
+            # A save that queued the post before the batch started commits
+            # only after the worker read the task
+            sync_documents(model, pks)
+            if model is Post:
+                with patch('core.search.timezone.now', return_value=timezone.now() - timedelta(minutes=1)):
+                    search_module.enqueue(Post, [self.post.pk])
+        
+        with patch('core.search.sync_documents', sync_then_change):
+            process_index_queue()
+        self.assertEqual(list(SearchIndexTask.objects.values_list('object_id', flat=True)), [self.post.pk])
+        self.assertEqual(process_index_queue()[0], 1)
+        self.assertFalse(SearchIndexTask.objects.exists())
+    
+    @override_settings(SEARCH_INDEX_QUEUE=False)
+    def test_changes_are_indexed_during_the_request_without_the_queue(self):
+        SearchIndexTask.objects.all().delete()
+        self.post.title = 'Quantum annealing'
+        self.post.save()
+        self.assertFalse(SearchIndexTask.objects.exists())
+        self.assertEqual([document.object for document in load_objects(search('annealing'))], [self.post])
+    
+    def test_search_view_and_rebuild(self):
+        SearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', workers=1, stdout=StringIO())
+        self.assertEqual(SearchDocument.objects.count(), 5)
+        
+        response = self.client.get(reverse('search'), {'query': 'quantum'})
+        self.assertEqual(response.context['page_obj'].paginator.count, 3)
+        self.assertContains(response, 'Quantum computing explained')
+    
+    def test_results_are_cached_until_their_models_are_reindexed(self):
+        process_index_queue()
+        reset_search_cache_stats()
+        url = reverse('search')
+        
+        def titles(query):
+            response = self.client.get(url, {'query': query})
+            return [result.object.title for result in response.context['full_text_results'] if isinstance(result.object, Post)]
+        
+        self.assertEqual(titles('quantum'), ['Quantum computing explained'])
+        # The same words in another case, order or number share one entry,
+        # here one stored while no results are kept
+        with patch('core.search_cache.MAX_RESULTS', 0):
+            self.assertEqual(titles('Computing  QUANTUM quantum'), [])
+            self.assertEqual(titles('quantum computing'), [])
+        self.assertEqual(search_cache_stats(), {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3})
+        
+        # Reindexing a post invalidates searches over posts only
+        self.post.title = 'Quantum computing revisited'
+        self.post.save()
+        process_index_queue()
+        self.assertEqual(titles('quantum'), ['Quantum computing revisited'])
+        self.client.get(reverse('advanced_search'), {'q': 'quantum', 'type': 'users'})
+        self.client.get(reverse('advanced_search'), {'q': 'quantum', 'type': 'users'})
+        self.post.save()
+        process_index_queue()
+        self.client.get(reverse('advanced_search'), {'q': 'quantum', 'type': 'users'})
+        # Results over users and, on the repeat only, the facets over every type
+        self.assertEqual(search_cache_stats()['hits'], 4)
+    
+    def test_basic_search_caps_pages_and_streams_results(self):
+        for number in range(25):
+            Post.objects.create(title=f'Quantum note {number}', content='Entangled', author=self.user, community=self.community)
+        process_index_queue()
+        url = reverse('search')
+        
+        # 26 posts, a comment and a community match; only the first page is loaded
+        response = self.client.get(url, {'query': 'quantum'})
+        self.assertEqual(response.context['page_obj'].paginator.count, 28)
+        self.assertEqual(len(response.context['full_text_results']), 20)
+        self.assertFalse(response.context['results_capped'])
+        self.assertEqual(len(self.client.get(url, {'query': 'quantum', 'page': 2}).context['full_text_results']), 8)
+        
+        with patch('core.search_cache.MAX_RESULTS', 10), patch('core.views.search_views.MAX_RESULTS', 10):
+            response = self.client.get(url, {'query': 'entangled'})
+            self.assertEqual(response.context['page_obj'].paginator.count, 10)
+            self.assertContains(response, 'Showing the best <strong>10</strong> results')
+        # Exactly as many matches as are kept is not capped
+        with patch('core.search_cache.MAX_RESULTS', 28):
+            response = self.client.get(url, {'query': 'quantum'})
+            self.assertFalse(response.context['results_capped'])
+            data = json.loads(b''.join(self.client.get(url, {'query': 'quantum', 'format': 'json'}).streaming_content))
+            self.assertEqual((data['count'], data['capped']), (28, False))
+        with patch('core.search_cache.MAX_RESULTS', 27):
+            response = self.client.get(url, {'query': 'quantum'})
+            self.assertEqual(response.context['page_obj'].paginator.count, 27)
+            self.assertTrue(response.context['results_capped'])
+
+        with patch('core.views.search_views.STREAM_BATCH_SIZE', 8):
+            response = self.client.get(url, {'query': 'quantum', 'format': 'json'})
+            self.assertTrue(response.streaming)
+            data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual((data['query'], data['count'], data['capped']), ('quantum', 28, False))
+        self.assertEqual(len(data['results']), 28)
+        self.assertEqual(data['results'][0]['type'], 'post')
+        self.assertIn({'type': 'community', 'id': self.community.pk, 'title': 'Community: Physics'}, [
+            {key: result[key] for key in ('type', 'id', 'title')} for result in data['results']
+        ])
+    
+    def test_results_are_not_cached_in_a_local_cache(self):
+        process_index_queue()
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            for title in ('Quantum computing explained', 'Quantum computing revisited'):
+                Post.objects.filter(pk=self.post.pk).update(title=title)
+                sync_documents(Post, [self.post.pk])
+                response = self.client.get(reverse('search'), {'query': 'quantum'})
+                self.assertContains(response, title)
+            self.assertEqual(search_cache_stats()['misses'], 0)
+            
+            err = StringIO()
+            call_command('search_cache_stats', stdout=StringIO(), stderr=err)
+            self.assertIn('not cached', err.getvalue())
+    
+    def test_facet_counts_come_from_grouped_queries_and_are_cached(self):
+        other = Community.objects.create(name='Chemistry', description='Molecules')
+        link = Post.objects.create(
+            title='Quantum dots', post_type='link', url='https://example.com', author=self.user, community=other,
+        )
+        link.tags.add('hardware')
+        link.created_at = timezone.now() - timedelta(days=60)
+        link.save()
+        process_index_queue()
+        types = {name: model for name, (model, sorts, filtered) in ADVANCED_SEARCH_TYPES.items()}
+        
+        with CaptureQueriesContext(connection) as queries:
+            facets = search_facets('quantum', types, ['posts', 'comments'], Post)
+        self.assertEqual(len([query for query in queries if not query['sql'].startswith('EXPLAIN')]), 2)
+        self.assertEqual(facets['types'], {'posts': 2, 'comments': 1, 'communities': 1, 'users': 0})
+        self.assertEqual(facets['communities'], [
+            {'id': self.community.pk, 'name': 'Physics', 'count': 2},
+            {'id': other.pk, 'name': 'Chemistry', 'count': 1},
+        ])
+        self.assertEqual(facets['post_types'], {'text': 1, 'link': 1})
+        self.assertEqual(facets['tags'], [{'name': 'hardware', 'slug': 'hardware', 'count': 1}])
+        self.assertEqual(facets['time'], {'day': 2, 'week': 2, 'month': 2, 'year': 3})
+        with self.assertNumQueries(0):
+            search_facets('Quantum', types, ['posts', 'comments'], Post)
+    
+        # Each facet counts with the other active filters applied
+        facets = search_facets('quantum', types, ['posts', 'comments'], Post, community=other.pk)
+        self.assertEqual(facets['types'], {'posts': 1, 'comments': 0, 'communities': 1, 'users': 0})
+        self.assertEqual(len(facets['communities']), 2)
+        self.assertEqual(facets['post_types'], {'link': 1})
+        self.assertEqual(facets['time'], {'day': 0, 'week': 0, 'month': 0, 'year': 1})
+        facets = search_facets('quantum', types, ['posts', 'comments'], Post, tag='hardware', time='week')
+        # The tag only narrows posts: the comment still counts
+        self.assertEqual(facets['communities'], [{'id': self.community.pk, 'name': 'Physics', 'count': 1}])
+        self.assertEqual(facets['tags'], [])
+        self.assertEqual(facets['time'], {'day': 1, 'week': 1, 'month': 1, 'year': 2})
+        facets = search_facets('quantum', types, ['posts', 'comments'], Post, type='communities', post_type='text')
+        self.assertEqual(facets['types'], {'posts': 1, 'comments': 1, 'communities': 1, 'users': 0})
+        self.assertEqual(facets['post_types'], {})
+        self.assertEqual(facets['tags'], [])
+    
+        response = self.client.get(reverse('advanced_search'), {'q': 'quantum', 'community': other.pk})
+        type_counts = {
+            option['label']: option['count']
+            for option in next(group for group in response.context['facet_groups'] if group['title'] == 'Type')['options']
+        }
+        self.assertEqual(type_counts['Posts'], len(response.context['posts_page']))
+        self.assertEqual(type_counts['Comments'], len(response.context['comments_page']))
+    
+        response =self.client.get(reverse('advanced_search'), {'q': 'quantum', 'tag': 'hardware'})
+        self.assertEqual(list(response.context['posts_page']), [link])
+        tag_option = next(group for group in response.context['facet_groups'] if group['title'] == 'Tag')['options'][0]
+        self.assertTrue(tag_option['active'])
+        self.assertContains(response, 'Refine Results')
+    
+    def test_interrupted_rebuild_resumes_and_swaps_in_when_done(self):
+        self.assertEqual(self.found('quantum', models=[Post]), [self.post])
+        chunk_documents = search_module.chunk_documents
+        calls = []
+        
+        def fail_on_third_chunk(*chunk):
+            calls.append(chunk)
+            if len(calls) == 3:
+                raise RuntimeError('worker died')
+            return chunk_documents(*chunk)
+        
+        with patch('core.search.chunk_documents', side_effect=fail_on_third_chunk):
+            with self.assertRaises(RuntimeError):
+                call_command('rebuild_search_index', workers=1, chunk_size=1, stdout=StringIO())
+        build = SearchIndexBuild.objects.get()
+        self.assertIsNone(build.finished_at)
+        self.assertEqual(sum(len(starts) for starts in build.completed_chunks.values()), 2)
+        
+        # Searches keep using the old generation, and changes reach both
+        self.post.title = 'Quantum annealing explained'
+        self.post.save()
+        self.assertEqual(self.found('annealing'), [self.post])
+        
+        calls.clear()
+        with patch('core.search.chunk_documents', side_effect=chunk_documents) as resumed:
+            call_command('rebuild_search_index', workers=1, chunk_size=1, stdout=StringIO())
+        self.assertEqual(resumed.call_count, 3)
+        build.refresh_from_db()
+        self.assertIsNotNone(build.finished_at)
+        self.assertEqual(set(SearchDocument.objects.values_list('generation', flat=True)), {build.generation})
+        self.assertEqual(SearchDocument.objects.count(), 5)
+        self.assertEqual(self.found('annealing', models=[Post]), [self.post])
+    
+    def test_advanced_search_filters_and_pages_each_type(self):
+        other = Community.objects.create(name='Chemistry', description='Molecules')
+        old_post = Post.objects.create(
+            title='Quantum chemistry basics', content='Orbitals', author=self.user, community=other,
+        )
+        old_post.created_at = timezone.now() - timedelta(days=60)
+        old_post.save()
+        Post.objects.filter(pk=old_post.pk).update(score=10)
+        url = reverse('advanced_search')
+        
+        def results(**params):
+            process_index_queue()
+            response = self.client.get(url, {'q': 'quantum', **params})
+            return {name: list(response.context[f'{name}_page']) for name in ('posts', 'comments', 'communities', 'users') if f'{name}_page' in response.context}
+        
+        self.assertEqual(results(sort='newest')['posts'], [self.post, old_post])
+        self.assertEqual(results(sort='most_votes')['posts'], [old_post, self.post])
+        self.assertEqual(results(sort='oldest')['posts'], [old_post, self.post])
+        self.assertEqual(results(time='month')['posts'], [self.post])
+        filtered = results(community=str(other.pk))
+        self.assertEqual((filtered['posts'], filtered['comments']), ([old_post], []))
+        self.assertEqual(results(type='comments'), {'comments': [self.comment]})
+        
+        # Result types are paginated independently
+        process_index_queue()
+        with patch('core.views.search_views.SEARCH_PAGE_SIZE', 1):
+            response = self.client.get(url, {'q': 'quantum', 'sort': 'newest', 'posts_page': 2})
+        self.assertEqual(list(response.context['posts_page']), [old_post])
+        self.assertEqual(list(response.context['communities_page']), [self.community])
+        self.assertIn('posts_page=2', response.context['comments_params'])
+
+
+class AutocompleteTestCase(TestCase):
+    """Tests for the in-process autocomplete indexes and their API"""
+    
+    def setUp(self):
+        autocomplete.reset()
+        self.user = User.objects.create_user(username='alice', password='password123')
+        self.community = Community.objects.create(name='Algorithms', description='Sorting and searching')
+    
+    def tearDown(self):
+        autocomplete.reset()
+    
+    def test_prefix_index(self):
+        index = autocomplete.PrefixIndex([(1, 'banana'), (2, 'Apple'), (3, 'apricot'), (4, 'cherry')])
+        self.assertEqual(index.complete('ap'), [(2, 'Apple'), (3, 'apricot')])
+        self.assertEqual(index.complete('AP', limit=1), [(2, 'Apple')])
+        self.assertEqual(index.complete('z'), [])
+        
+        index.add((1, 'apple pie'))
+        index.remove(3)
+        self.assertEqual(index.complete('ap'), [(2, 'Apple'), (1, 'apple pie')])
+        self.assertEqual(index.complete('b'), [])
+        self.assertEqual(len(index), 3)
+    
+    def test_api_is_served_from_the_index_and_follows_changes(self):
+        url = reverse('autocomplete-list')
+        Tag.objects.get_or_create(name='algebra')
+        self.client.get(url, {'q': 'al'})
+        
+        DataCollector().clear()
+        # Silk would record a random sample of requests in its own tables
+        with patch('silk.middleware._should_intercept', return_value=False), self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'Al'})
+        self.assertEqual([c['name'] for c in response.json()['communities']], ['Algorithms'])
+        self.assertEqual([t['name'] for t in response.json()['tags']], ['algebra'])
+        self.assertEqual(response.json()['users'][0]['url'], reverse('profile', kwargs={'username': 'alice'}))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.community.name = 'Data structures'
+            self.community.save()
+            User.objects.create_user(username='alan', password='password123')
+        response = self.client.get(url, {'q': 'al', 'type': 'users'})
+        self.assertEqual(list(response.json()), ['users'])
+        self.assertEqual([u['username'] for u in response.json()['users']], ['alan', 'alice'])
+        self.assertEqual(self.client.get(url, {'q': 'data'}).json()['communities'][0]['id'], self.community.pk)
+        self.assertEqual(self.client.get(url, {'q': 'alg'}).json()['communities'], [])
@@ -30,10 +30,12 @@ urlpatterns = [
     path('posts/<int:post_id>/comment/', views.add_comment, name='add_comment'),
     path('comments/<int:pk>/delete/', views.delete_comment, name='delete_comment'),
     path('comments/<int:pk>/thread/', views.comment_thread, name='comment_thread'),
+    path('posts/<int:pk>/comments/more/', views.load_more_comments, name='load_more_comments'),
     
     # Voting
     path('posts/<int:pk>/vote/<str:vote_type>/', views.vote_post, name='vote_post'),
     path('comments/<int:pk>/vote/<str:vote_type>/', views.vote_comment, name='vote_comment'),
+    path('votes/state/', views.vote_state_api, name='vote_state_api'),
     
     # Search
     path('search/', views.search, name='search'),
@@ -0,0 +1,70 @@
+"""
+Short-lived per-user values shown on every page.
+
+The navbar needs the viewer's unread notification count and profile on each
+request. Both are kept in the shared cache for a short time under a key per
+user, and the key is deleted when the underlying rows change (see the
+Profile receivers in core.models and the counter updates in
+core.notifications), so a cache hit is normally exact and at worst
+USER_CACHE_TIMEOUT seconds old.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+USER_CACHE_TIMEOUT = 60
+
+UNREAD_NOTIFICATIONS = 'unread_notifications'
+PROFILE = 'profile'
+
+_missing = object()
+
+
+def _user_key(name, user_id):
+    return f'core:user:{user_id}:{name}'
+
+
+def get_user_value(name, user_id, compute):
+    """Return the cached value of name for a user, computing and caching it on a miss"""
+    key = _user_key(name, user_id)
+    value = cache.get(key, _missing)
+    if value is _missing:
+        value = compute()
+        cache.set(key, value, USER_CACHE_TIMEOUT)
+    return value
+
+
+def invalidate_user_value(name, user_id):
+    """Drop a cached per-user value once the current transaction commits"""
+    key = _user_key(name, user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_unread_notification_count(user_id):
+    """Number of unread notifications of a user, from the counter on their profile"""
+    from .models import Profile
+
+    return get_user_value(
+        UNREAD_NOTIFICATIONS, user_id,
+        lambda: Profile.objects.filter(user_id=user_id).values_list('unread_notification_count', flat=True).first() or 0,
+    )
+
+
+def invalidate_unread_notification_count(user_id):
+    invalidate_user_value(UNREAD_NOTIFICATIONS, user_id)
+
+
+def get_user_profile(user_id):
+    """
+    The Profile of a user, or None if it doesn't exist. Profiles are created
+    with their user, so unlike get_or_create this never writes.
+    """
+    from .models import Profile
+
+    return get_user_value(
+        PROFILE, user_id,
+        lambda: Profile.objects.filter(user_id=user_id).first(),
+    )
+
+
+def invalidate_user_profile(user_id):
+    invalidate_user_value(PROFILE, user_id)
@@ -20,8 +20,8 @@ from .post_views import (
     post_detail, create_text_post, create_link_post,
     delete_post, add_comment, comment_thread,
     delete_comment, vote_post, vote_comment,
-    post_votes_api, comment_votes_api,
-    get_comment_children
+    post_votes_api, comment_votes_api, vote_state_api,
+    get_comment_children, load_more_comments
 )
 
 # Notification views
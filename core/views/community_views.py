@@ -4,22 +4,28 @@ Views related to communities.
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
 from ..models import Community, Post
 from ..forms import CommunityForm
+from ..voting import get_user_votes
+from ..pagination import paginate_request
+from ..ranking import SORT_CHOICES, get_sort, ranked_posts
+from ..communities import COMMUNITY_SORT_CHOICES, COMMUNITY_SORTS, get_community_sort
+from ..page_cache import add_surrogate_keys, cache_anonymous_page, community_key, post_key
+from ..conditional import community_page_validators, conditional_page
 
 
 def community_list(request):
     """
-    List all communities
+    List all communities, newest or largest first
     """
-    communities = Community.objects.annotate(
-        member_count=Count('members'),
-        post_count=Count('posts')
-    ).order_by('-created_at')
+    # Sizes are stored counters, so sorting by them needs no joins
+    sort = get_community_sort(request)
+    communities = Community.objects.order_by(*COMMUNITY_SORTS[sort])
     
     return render(request, 'core/community/community_page.html', {
         'communities': communities,
+        'sort': sort,
+        'sort_choices': COMMUNITY_SORT_CHOICES,
         'title': 'Communities',
         'page_type': 'list'
     })
@@ -52,29 +58,43 @@ def create_community(request):
     })
 
 
+@conditional_page(community_page_validators)
+@cache_anonymous_page
 def community_detail(request, pk, template='core/community/community_detail.html', extra_context=None):
     """
     View a community and its posts
     """
     community = get_object_or_404(Community, pk=pk)
     
-    # Get posts with vote counts for this community
-    posts = Post.objects.filter(community=community)\
-        .select_related('author')\
-        .prefetch_related('tags')\
-        .annotate(vote_score=Count('votes', filter=Q(votes__value=1)) - 
-                 Count('votes', filter=Q(votes__value=-1)))\
-        .order_by('-created_at')
+    # Get this community's posts ordered by the requested sort mode
+    sort = get_sort(request)
+    posts = ranked_posts(
+        Post.objects.filter(community=community).select_related('author').prefetch_related('tags'),
+        sort
+    )
     
     # Check if user is a member
     is_member = request.user.is_authenticated and community.members.filter(id=request.user.id).exists()
     
+    # Fetch one page after the ?cursor= position; no OFFSET or COUNT(*)
+    page = paginate_request(request, posts)
+    
+    # Get the user's votes on the posts shown on this page
+    user_post_votes, _ = get_user_votes(request.user, post_ids=[post.pk for post in page])
+    
+    # Cached anonymous copies of this page go stale when the community or any post on it changes
+    add_surrogate_keys(request, community_key(community.pk), *[post_key(post.pk) for post in page])
+    
     # Prepare context
     context = {
         'community': community,
-        'posts': posts,
+        'posts': page.object_list,
+        'page': page,
         'is_member': is_member,
-        'member_count': community.members.count(),
+        'user_post_votes': user_post_votes,
+        'sort': sort,
+        'sort_choices': SORT_CHOICES,
+        'member_count': community.member_count,
         'title': community.name,
     }
     
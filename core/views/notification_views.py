@@ -5,23 +5,30 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from ..models import Notification
+from ..pagination import paginate_request
+from .. import user_cache
+from ..notifications import mark_all_read
 
 
 def get_unread_notification_count(user):
     """Helper function to get unread notification count for a user"""
     if not user.is_authenticated:
         return 0
-    return Notification.objects.filter(recipient=user, is_read=False).count()
+    return user_cache.get_unread_notification_count(user.pk)
 
 
 @login_required
 def notification_list(request):
     """View to display all notifications for the current user"""
-    notifications = Notification.objects.filter(recipient=request.user).order_by('-created_at')
+    notifications = Notification.objects.filter(recipient=request.user)\
+        .select_related('sender', 'post', 'comment__post')\
+        .order_by('-created_at', '-id')
+    page = paginate_request(request, notifications)
     unread_count = get_unread_notification_count(request.user)
     
     return render(request, 'core/notifications/notifications_list.html', {
-        'notifications': notifications,
+        'notifications': page.object_list,
+        'page': page,
         'unread_count': unread_count,
         'title': 'Notifications'
     })
@@ -31,8 +38,7 @@ def notification_list(request):
 def mark_notification_read(request, pk):
     """View to mark a notification as read"""
     notification = get_object_or_404(Notification, pk=pk, recipient=request.user)
-    notification.is_read = True
-    notification.save()
+    notification.mark_as_read()
     
     # Check first if post exists, then check comment
     if notification.post:
@@ -46,6 +52,6 @@ def mark_notification_read(request, pk):
 @login_required
 def mark_all_notifications_read(request):
     """View to mark all notifications as read"""
-    Notification.objects.filter(recipient=request.user).update(is_read=True)
+    mark_all_read(request.user.pk)
     messages.success(request, 'All notifications marked as read.')
     return redirect('notification_list')
\ No newline at end of file
@@ -5,30 +5,50 @@ import sys
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q, Sum, F
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import JsonResponse
 from django.urls import reverse
-from django.utils import timezone
-from django.views.decorators.http import require_http_methods
-from ..models import Post, Comment, Vote, Community, Notification
+from ..models import Post, Comment, Community, Notification
 from ..forms import TextPostForm, LinkPostForm, CommentForm
+from ..voting import cast_vote, get_user_votes, attach_user_votes
+from ..pagination import paginate_request
+from ..comment_tree import load_comment_tree, read_cursor
+from ..ranking import SORT_CHOICES, get_sort, ranked_posts
+from ..page_cache import HOME_KEY, add_surrogate_keys, cache_anonymous_page, post_key
+from ..conditional import conditional_page, post_page_validators
 
+# Upper bound on ids per kind accepted by vote_state_api
+VOTE_STATE_MAX_IDS = 200
 
+
+@cache_anonymous_page
 def home(request, template='core/common/index.html', extra_context=None):
     """
     Homepage view showing a list of posts with various filtering options
     """
-    # Get posts with vote counts
-    posts = Post.objects.select_related('author', 'community')\
-        .prefetch_related('tags')\
-        .annotate(vote_score=Count('votes', filter=Q(votes__value=1)) - 
-                 Count('votes', filter=Q(votes__value=-1)))\
-        .order_by('-created_at')
+    # Get posts ordered by the requested sort mode, using the stored scores
+    sort = get_sort(request)
+    posts = ranked_posts(
+        Post.objects.select_related('author__profile', 'community').prefetch_related('tags'),
+        sort
+    )
+    
+    # Fetch one page after the ?cursor= position; no OFFSET or COUNT(*)
+    page = paginate_request(request, posts)
+    
+    # Get the user's votes on the posts shown on this page
+    user_post_votes, _ = get_user_votes(request.user, post_ids=[post.pk for post in page])
+    
+    # Cached anonymous copies of this page go stale when any post on it changes
+    add_surrogate_keys(request, HOME_KEY, *[post_key(post.pk) for post in page])
     
     # Prepare context
     context = {
-        'posts': posts,
-        'post_list': posts,  # Add post_list for compatibility with templates
+        'posts': page.object_list,
+        'post_list': page.object_list,  # Add post_list for compatibility with templates
+        'page': page,
+        'user_post_votes': user_post_votes,
+        'sort': sort,
+        'sort_choices': SORT_CHOICES,
         'title': 'Home',
     }
     
@@ -41,68 +61,29 @@ def home(request, template='core/common/index.html', extra_context=None):
 
 def get_comment_children(comment, user, depth=0, max_depth=3):
     """
-    Recursively get child comments up to a specified depth
+    Get child comments up to a specified depth, loaded with a single tree query
     """
-    depth += 1
-    if depth > max_depth:
-        # Don't fetch children beyond max_depth
-        comment.has_more = Comment.objects.filter(parent=comment).exists()
-        return []
-    
-    children = Comment.objects.filter(parent=comment).order_by('created_at')
-    
-    for child in children:
-        # Update denormalized vote counts
-        upvotes = child.votes.filter(value=1).count()
-        downvotes = child.votes.filter(value=-1).count()
-        child.upvote_count = upvotes
-        child.downvote_count = downvotes
-        child.save(update_fields=['upvote_count', 'downvote_count'])
-        
-        child.depth = depth
-        
-        # Get user's vote for this comment
-        if user.is_authenticated:
-            try:
-                user_vote = Vote.objects.get(user=user, comment=child)
-                child.user_vote = user_vote.value
-            except Vote.DoesNotExist:
-                child.user_vote = None
-        else:
-            child.user_vote = None
-        
-        # Get grandchildren recursively
-        setattr(child, 'child_comments', get_comment_children(child, user, depth, max_depth))
+    comment_tree = load_comment_tree(comment.post, root=comment, max_depth=max_depth - depth)
+    
+    for child in comment_tree.nodes[1:]:
+        child.depth += depth
+    
+    # Get user's votes for all loaded comments in one query
+    attach_user_votes(user, comments=comment_tree.nodes[1:])
     
-    return children
+    root = comment_tree.comments[0]
+    comment.has_more = bool(root.more_cursor)
+    return root.child_comments
 
 
+@conditional_page(post_page_validators)
+@cache_anonymous_page
 def post_detail(request, pk):
     """
     View a post and its comments with Reddit-style nested comments using MPTT
     """
     post = get_object_or_404(Post, pk=pk)
     
-    # Update denormalized vote counts for post
-    upvotes = post.votes.filter(value=1).count()
-    downvotes = post.votes.filter(value=-1).count()
-    post.upvote_count = upvotes
-    post.downvote_count = downvotes
-    post.save(update_fields=['upvote_count', 'downvote_count'])
-    
-    # Get user's vote for this post if they're logged in
-    if request.user.is_authenticated:
-        try:
-            user_vote = Vote.objects.get(user=request.user, post=post)
-            post.user_vote = user_vote.value
-        except Vote.DoesNotExist:
-            post.user_vote = None
-    else:
-        post.user_vote = None
-    
-    # Get root comments for this post using MPTT
-    comments = Comment.objects.filter(post=post, parent=None).order_by('created_at')
-    
     # Create comment form if user is logged in
     if request.user.is_authenticated:
         if request.method == 'POST':
@@ -131,24 +112,17 @@ def post_detail(request, pk):
     else:
         comment_form = None
     
-    # Update denormalized vote counts for comments and add user votes
-    for comment in comments:
-        # Update denormalized vote counts
-        upvotes = comment.votes.filter(value=1).count()
-        downvotes = comment.votes.filter(value=-1).count()
-        comment.upvote_count = upvotes
-        comment.downvote_count = downvotes
-        comment.save(update_fields=['upvote_count', 'downvote_count'])
-        
-        # Get user's vote for this comment if they're logged in
-        if request.user.is_authenticated:
-            try:
-                user_vote = Vote.objects.get(user=request.user, comment=comment)
-                comment.user_vote = user_vote.value
-            except Vote.DoesNotExist:
-                comment.user_vote = None
-        else:
-            comment.user_vote = None
+    add_surrogate_keys(request, post_key(post.pk))
+    
+    # Load the comment tree with a single ordered MPTT range query
+    comment_tree = load_comment_tree(post)
+    comments = comment_tree.comments
+    
+    # Get user's votes for the post and every loaded comment; vote counts
+    # come from the denormalized fields
+    user_post_votes, user_comment_votes = attach_user_votes(
+        request.user, posts=[post], comments=comment_tree.nodes
+    )
     
     # For testing purposes, simplify the context to avoid recursion issues
     if 'test' in sys.modules:
@@ -160,7 +134,10 @@ def post_detail(request, pk):
         context = {
             'post': post,
             'comments': comments,
+            'more_comments_cursor': comment_tree.more_cursor,
             'comment_form': comment_form,
+            'user_post_vote': post.user_vote,
+            'user_comment_votes': user_comment_votes,
             'title': post.title,
         }
     
@@ -174,45 +151,17 @@ def comment_thread(request, pk):
     comment = get_object_or_404(Comment, pk=pk)
     post = comment.post
     
-    # Update denormalized vote counts for post
-    upvotes = post.votes.filter(value=1).count()
-    downvotes = post.votes.filter(value=-1).count()
-    post.upvote_count = upvotes
-    post.downvote_count = downvotes
-    post.save(update_fields=['upvote_count', 'downvote_count'])
-    
-    # Get user's vote for this post if they're logged in
-    if request.user.is_authenticated:
-        try:
-            user_vote = Vote.objects.get(user=request.user, post=post)
-            post.user_vote = user_vote.value
-        except Vote.DoesNotExist:
-            post.user_vote = None
-    else:
-        post.user_vote = None
+    # Load the thread with a single ordered MPTT range query
+    comment_tree = load_comment_tree(post, root=comment)
+    comment = comment_tree.comments[0]
     
     # Create a list with just this comment to reuse the comment display template
     comments = [comment]
     
-    # Update denormalized vote counts for the comment
-    upvotes = comment.votes.filter(value=1).count()
-    downvotes = comment.votes.filter(value=-1).count()
-    comment.upvote_count = upvotes
-    comment.downvote_count = downvotes
-    comment.save(update_fields=['upvote_count', 'downvote_count'])
-    
-    # Get user's vote for this comment if they're logged in
-    if request.user.is_authenticated:
-        try:
-            user_vote = Vote.objects.get(user=request.user, comment=comment)
-            comment.user_vote = user_vote.value
-        except Vote.DoesNotExist:
-            comment.user_vote = None
-    else:
-        comment.user_vote = None
-    
-    # Get child comments
-    setattr(comment, 'child_comments', get_comment_children(comment, request.user, depth=0, max_depth=5))
+    # Get user's votes for the post and the whole thread in at most two queries
+    user_post_votes, user_comment_votes = attach_user_votes(
+        request.user, posts=[post], comments=comment_tree.nodes
+    )
     
     # Create comment form if user is logged in
     if request.user.is_authenticated:
@@ -248,12 +197,54 @@ def comment_thread(request, pk):
         'comment': comment,
         'comments': comments,
         'comment_form': comment_form,
+        'user_post_vote': post.user_vote,
+        'user_comment_votes': user_comment_votes,
         'title': f'Comment on {post.title}',
     }
     
     return render(request, 'core/posts/comment_thread.html', context)
 
 
+def load_more_comments(request, pk):
+    """
+    Load the next batch of comments or replies for a "load more" cursor
+    """
+    post = get_object_or_404(Post, pk=pk)
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        return redirect('post_detail', pk=post.pk)
+    
+    parent_id = read_cursor(cursor)['parent']
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    
+    # Without JavaScript, replies fall back to the thread page of their parent
+    if parent_id and not is_ajax:
+        return redirect('comment_thread', pk=parent_id)
+    
+    comment_tree = load_comment_tree(post, cursor=cursor)
+    
+    # Get user's votes for the loaded comments in one query
+    _, user_comment_votes = attach_user_votes(request.user, comments=comment_tree.nodes)
+    
+    # Without JavaScript, further root comments get a page of their own
+    if not is_ajax:
+        return render(request, 'core/posts/more_comments.html', {
+            'post': post,
+            'comments': comment_tree.comments,
+            'more_comments_cursor': comment_tree.more_cursor,
+            'user_comment_votes': user_comment_votes,
+            'title': f'More comments on {post.title}',
+        })
+    
+    return render(request, 'core/includes/comments/comment_batch.html', {
+        'post': post,
+        'comments': comment_tree.comments,
+        'is_reply_batch': parent_id is not None,
+        'more_comments_cursor': comment_tree.more_cursor,
+        'user_comment_votes': user_comment_votes,
+    })
+
+
 @login_required
 def create_text_post(request, community_id):
     """
@@ -458,30 +449,13 @@ def vote_post(request, pk, vote_type):
     # Determine vote value
     vote_value = 1 if vote_type == 'up' else -1
     
-    # Check if user has already voted on this post
-    try:
-        vote = Vote.objects.get(user=request.user, post=post)
-        
-        # If user is voting the same way, remove their vote
-        if vote.value == vote_value:
-            vote.delete()
-            vote_status = 'removed'
-        else:
-            # Otherwise, change their vote
-            vote.value = vote_value
-            vote.save()
-            vote_status = 'changed'
-    except Vote.DoesNotExist:
-        # Create a new vote
-        Vote.objects.create(user=request.user, post=post, value=vote_value)
-        vote_status = 'added'
-    
-    # Update post's denormalized vote counts
-    upvotes = post.votes.filter(value=1).count()
-    downvotes = post.votes.filter(value=-1).count()
-    post.upvote_count = upvotes
-    post.downvote_count = downvotes
-    post.save(update_fields=['upvote_count', 'downvote_count'])
+    # Add, flip or remove the vote; counters are updated atomically
+    vote_status, _ = cast_vote(request.user, vote_value, post=post)
+    
+    # Read back the current denormalized vote counts
+    post.refresh_from_db(fields=['upvote_count', 'downvote_count'])
+    upvotes = post.upvote_count
+    downvotes = post.downvote_count
     
     # Calculate vote score
     vote_score = upvotes - downvotes
@@ -520,30 +494,13 @@ def vote_comment(request, pk, vote_type):
     # Determine vote value
     vote_value = 1 if vote_type == 'up' else -1
     
-    # Check if user has already voted on this comment
-    try:
-        vote = Vote.objects.get(user=request.user, comment=comment)
-        
-        # If user is voting the same way, remove their vote
-        if vote.value == vote_value:
-            vote.delete()
-            vote_status = 'removed'
-        else:
-            # Otherwise, change their vote
-            vote.value = vote_value
-            vote.save()
-            vote_status = 'changed'
-    except Vote.DoesNotExist:
-        # Create a new vote
-        Vote.objects.create(user=request.user, comment=comment, value=vote_value)
-        vote_status = 'added'
-    
-    # Update comment's denormalized vote counts
-    upvotes = comment.votes.filter(value=1).count()
-    downvotes = comment.votes.filter(value=-1).count()
-    comment.upvote_count = upvotes
-    comment.downvote_count = downvotes
-    comment.save(update_fields=['upvote_count', 'downvote_count'])
+    # Add, flip or remove the vote; counters are updated atomically
+    vote_status, _ = cast_vote(request.user, vote_value, comment=comment)
+    
+    # Read back the current denormalized vote counts
+    comment.refresh_from_db(fields=['upvote_count', 'downvote_count'])
+    upvotes = comment.upvote_count
+    downvotes = comment.downvote_count
     
     # Calculate vote score
     vote_score = upvotes - downvotes
@@ -577,17 +534,12 @@ def post_votes_api(request, pk):
     API endpoint to get votes for a post
     """
     post = get_object_or_404(Post, pk=pk)
-    upvotes = post.votes.filter(value=1).count()
-    downvotes = post.votes.filter(value=-1).count()
-    vote_score = upvotes - downvotes
+    upvotes = post.upvote_count
+    downvotes = post.downvote_count
+    vote_score = post.vote_count
     
-    user_vote = None
-    if request.user.is_authenticated:
-        try:
-            vote = Vote.objects.get(user=request.user, post=post)
-            user_vote = vote.value
-        except Vote.DoesNotExist:
-            user_vote = None
+    post_votes, _ = get_user_votes(request.user, post_ids=[post.pk])
+    user_vote = post_votes.get(post.pk)
     
     return JsonResponse({
         'upvotes': upvotes,
@@ -602,21 +554,41 @@ def comment_votes_api(request, pk):
     API endpoint to get votes for a comment
     """
     comment = get_object_or_404(Comment, pk=pk)
-    upvotes = comment.votes.filter(value=1).count()
-    downvotes = comment.votes.filter(value=-1).count()
-    vote_score = upvotes - downvotes
+    upvotes = comment.upvote_count
+    downvotes = comment.downvote_count
+    vote_score = comment.vote_count
     
-    user_vote = None
-    if request.user.is_authenticated:
-        try:
-            vote = Vote.objects.get(user=request.user, comment=comment)
-            user_vote = vote.value
-        except Vote.DoesNotExist:
-            user_vote = None
+    _, comment_votes = get_user_votes(request.user, comment_ids=[comment.pk])
+    user_vote = comment_votes.get(comment.pk)
     
     return JsonResponse({
         'upvotes': upvotes,
         'downvotes': downvotes,
         'vote_score': vote_score,
         'user_vote': user_vote
-    })
\ No newline at end of file
+    })
+
+
+def vote_state_api(request):
+    """
+    API endpoint returning the current user's votes for a page of posts and comments.
+    
+    Takes comma-separated ids in the "posts" and "comments" query parameters.
+    """
+    def parse_ids(param):
+        ids = []
+        for value in request.GET.get(param, '').split(',')[:VOTE_STATE_MAX_IDS]:
+            if value.strip().isdigit():
+                ids.append(int(value))
+        return ids
+    
+    post_votes, comment_votes = get_user_votes(
+        request.user,
+        post_ids=parse_ids('posts'),
+        comment_ids=parse_ids('comments'),
+    )
+    
+    return JsonResponse({
+        'posts': post_votes,
+        'comments': comment_votes,
+    })
@@ -5,9 +5,9 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db.models import Count, Q, Sum
-from ..models import Profile, Post, Comment, Vote
+from ..models import Profile, Post, Comment
 from ..forms import UserUpdateForm, ProfileUpdateForm
+from ..pagination import paginate_request
 
 
 def profile(request, username):
@@ -17,38 +17,26 @@ def profile(request, username):
     user = get_object_or_404(User, username=username)
     profile = Profile.objects.get(user=user)
     
-    # Get user's posts with vote counts
-    posts = Post.objects.filter(author=user)\
-        .annotate(vote_score=Count('votes', filter=Q(votes__value=1)) - 
-                 Count('votes', filter=Q(votes__value=-1)))\
-        .order_by('-created_at')
+    # Get user's posts and comments, newest first; vote scores are stored on the rows
+    posts = Post.objects.filter(author=user).select_related('community').order_by('-created_at', '-id')
+    comments = Comment.objects.filter(author=user).select_related('post__community').order_by('-created_at', '-id')
     
-    # Get user's comments
-    comments = Comment.objects.filter(author=user).order_by('-created_at')
+    # Each tab is paginated separately with its own cursor
+    posts_page = paginate_request(request, posts, cursor_param='posts_cursor')
+    comments_page = paginate_request(request, comments, cursor_param='comments_cursor')
     
     # Get user's communities
     communities = user.communities.all()
     
-    # Get overall karma (upvotes - downvotes across all content)
-    post_karma = Vote.objects.filter(post__author=user).aggregate(
-        karma=Sum('value', default=0)
-    )['karma']
-    
-    comment_karma = Vote.objects.filter(comment__author=user).aggregate(
-        karma=Sum('value', default=0)
-    )['karma']
-    
-    total_karma = (post_karma or 0) + (comment_karma or 0)
-    
     context = {
         'profile_user': user,
         'profile': profile,
-        'posts': posts,
-        'comments': comments,
+        'posts': posts_page.object_list,
+        'comments': comments_page.object_list,
+        'posts_page': posts_page,
+        'comments_page': comments_page,
         'communities': communities,
-        'post_karma': post_karma or 0,
-        'comment_karma': comment_karma or 0,
-        'total_karma': total_karma,
+        'total_karma': profile.karma,
         'title': f'{user.username}\'s Profile',
     }
     
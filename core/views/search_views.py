@@ -1,34 +1,146 @@
 """
 Views related to search functionality.
 """
-from django.shortcuts import render, redirect
-from django.db.models import Count, Q, F, Sum
+import json
+
+from django.shortcuts import render
+from django.http import StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.paginator import Paginator
+from django.utils.http import urlencode
+from django.db.models import F
 from django.utils import timezone
-from django.contrib.auth.models import User
-import watson
-from ..models import Post, Comment, Community
+from ..models import Post, Comment, Community, Profile
 from ..forms import SearchForm
+from ..search import filter_documents, get_adapter, load_objects, order_by_object, registered_models, search_backend, search as search_index
+from ..search_cache import MAX_RESULTS, SearchResults, cached_results
+from ..search_facets import TIME_BUCKETS, filter_posts, search_facets
+
+SEARCH_PAGE_SIZE = 20
+# Results whose objects are loaded at once while streaming JSON
+STREAM_BATCH_SIZE = 100
+
+SEARCH_TYPE_CHOICES = (
+    ('all', 'Everything'),
+    ('posts', 'Posts'),
+    ('comments', 'Comments'),
+    ('communities', 'Communities'),
+    ('users', 'Users'),
+)
+ADVANCED_SORT_CHOICES = (
+    ('relevance', 'Relevance'),
+    ('newest', 'Newest'),
+    ('oldest', 'Oldest'),
+    ('most_votes', 'Most votes'),
+    ('most_comments', 'Most comments'),
+    ('most_members', 'Most members'),
+    ('most_karma', 'Most karma'),
+)
+TIME_RANGE_CHOICES = (
+    ('all', 'All time'),
+    ('day', 'Past day'),
+    ('week', 'Past week'),
+    ('month', 'Past month'),
+    ('year', 'Past year'),
+)
+TIME_RANGES = dict(TIME_BUCKETS)
+
+# Result types of advanced search: the indexed model, the sorts (besides
+# relevance and date) it supports with the stored column each orders by,
+# and whether the community and time filters apply to it. Users are found
+# through their profiles, which index the bio and display name as well.
+ADVANCED_SEARCH_TYPES = {
+    'posts': (Post, {'most_votes': F('score'), 'most_comments': F('comment_count')}, True),
+    'comments': (Comment, {'most_votes': F('upvote_count') - F('downvote_count')}, True),
+    'communities': (Community, {'most_members': F('member_count')}, False),
+    'users': (Profile, {'most_karma': F('karma')}, False),
+}
+
+
+def facet_links(facets, filters):
+    """
+    The facet counts of a search as groups of links, each applying one
+    filter value on top of the current filters
+    """
+    def option(label, count, param, value):
+        return {
+            'label': label,
+            'count': count,
+            'url': '?' + urlencode({key: item for key, item in {**filters, param: value}.items() if item}),
+            'active': str(filters.get(param)) == str(value),
+        }
+    
+    groups = [
+        ('Type', [option(label, facets['types'][name], 'type', name) for name, label in SEARCH_TYPE_CHOICES if name in facets['types']]),
+        ('Community', [option(f"d/{item['name']}", item['count'], 'community', item['id']) for item in facets['communities']]),
+        ('Post Type', [option(label, facets['post_types'][value], 'post_type', value) for value, label in Post.POST_TYPE_CHOICES if facets['post_types'].get(value)]),
+        ('Tag', [option(item['name'], item['count'], 'tag', item['slug']) for item in facets['tags']]),
+        ('Time Period', [option(label, facets['time'][name], 'time', name) for name, label in TIME_RANGE_CHOICES if facets['time'].get(name)]),
+    ]
+    return [{'title': title, 'options': options} for title, options in groups if options]
+
+
+def stream_results(query, results):
+    """
+    Yield a JSON document of results piece by piece, loading their objects
+    STREAM_BATCH_SIZE at a time, so memory stays bounded however many match
+    """
+    yield '{"query": %s, "count": %d, "capped": %s, "results": [' % (
+        json.dumps(query), len(results), json.dumps(results.capped),
+    )
+    separator = ''
+    for start in range(0, len(results), STREAM_BATCH_SIZE):
+        for result in load_objects(results[start:start + STREAM_BATCH_SIZE]):
+            obj = result.object
+            adapter = get_adapter(type(obj))
+            item = {
+                'type': obj._meta.model_name,
+                'id': obj.pk,
+                'title': adapter.get_title(obj),
+                'url': adapter.get_url(obj),
+                'created_at': adapter.get_created_at(obj),
+            }
+            yield separator + json.dumps(item, cls=DjangoJSONEncoder)
+            separator = ', '
+    yield ']}'
 
 
 def search(request):
     """
-    Basic search view using watson
+    Basic search view, ranked by the full-text index. At most MAX_RESULTS
+    results are kept; ?format=json streams them all as JSON instead of
+    rendering a page.
     """
-    query = request.GET.get('q', '')
+    # The search box submits ?query=; older links use ?q=
+    query = request.GET.get('query') or request.GET.get('q', '')
     search_form = SearchForm(initial={'query': query})
     
+    page = None
     search_results = []
+    results = SearchResults([])
     
     if query:
-        # Use Watson to search across multiple models
-        search_results = watson.search(query)
+        results = cached_results(query, registered_models(), search_index(query))
+    
+    if request.GET.get('format') == 'json':
+        return StreamingHttpResponse(stream_results(query, results), content_type='application/json')
+    
+    if query:
+        # Only the objects shown on this page are loaded, one query per model
+        page = Paginator(results, SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+        search_results = load_objects(page.object_list)
     
     context = {
         'search_form': search_form,
-        'search_results': search_results,
+        'full_text_results': search_results,
+        'page_obj': page,
+        'results_capped': results.capped,
+        'max_results': MAX_RESULTS,
+        'url_params': urlencode({'query': query}),
         'query': query,
         'title': 'Search Results',
-        'page_type': 'results'
+        'page_type': 'results',
+        'search_mode': 'basic',
     }
     
     return render(request, 'core/search/search_page.html', context)
@@ -36,145 +148,101 @@ def search(request):
 
 def advanced_search(request):
     """
-    Advanced search with filtering options
+    Advanced search with filtering options. Every result type is matched,
+    filtered and ordered by one query on the full-text index and has its
+    own page (?posts_page=, ?comments_page=, ...).
     """
-    query = request.GET.get('q', '')
+    # The basic search page links here with ?search=
+    query = request.GET.get('q') or request.GET.get('search', '')
     search_type = request.GET.get('type', 'all')
     sort_by = request.GET.get('sort', 'relevance')
     time_range = request.GET.get('time', 'all')
     community_id = request.GET.get('community', '')
+    # Post-only filters, offered by the facets
+    tag = request.GET.get('tag', '')
+    post_type = request.GET.get('post_type', '')
+    if post_type not in dict(Post.POST_TYPE_CHOICES):
+        post_type = ''
     
-    search_form = SearchForm(initial={'query': query})
-    communities = Community.objects.all()
+    if search_type != 'all' and search_type not in ADVANCED_SEARCH_TYPES:
+        search_type = 'all'
+    since = timezone.now() - TIME_RANGES[time_range] if time_range in TIME_RANGES else None
+    community = int(community_id) if community_id.isdigit() else None
     
-    # Initialize empty search results
-    posts = []
-    comments = []
-    communities_results = []
-    users = []
+    search_form = SearchForm(initial={'query': query})
+    communities = Community.objects.only('id', 'name').order_by('name')
     
+    results = {}
     if query:
-        # Build the base search query
-        if search_type == 'all' or search_type == 'posts':
-            posts_query = Post.objects.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query) |
-                Q(author__username__icontains=query) |
-                Q(tags__name__icontains=query)
-            ).distinct()
-            
-            # Apply community filter if specified
-            if community_id:
-                posts_query = posts_query.filter(community_id=community_id)
+        for name, (model, sorts, filtered) in ADVANCED_SEARCH_TYPES.items():
+            if search_type not in ('all', name):
+                continue
             
-            # Apply time range filter if specified
-            if time_range == 'day':
-                posts_query = posts_query.filter(created_at__gte=timezone.now() - timezone.timedelta(days=1))
-            elif time_range == 'week':
-                posts_query = posts_query.filter(created_at__gte=timezone.now() - timezone.timedelta(weeks=1))
-            elif time_range == 'month':
-                posts_query = posts_query.filter(created_at__gte=timezone.now() - timezone.timedelta(days=30))
-            elif time_range == 'year':
-                posts_query = posts_query.filter(created_at__gte=timezone.now() - timezone.timedelta(days=365))
+            documents = search_index(query, models=[model])
+            applied = {}
+            # Posts and comments can be narrowed to a community and a time range
+            if filtered:
+                documents = filter_documents(documents, community_id=community, since=since)
+                applied = {'community': community, 'time': time_range if since else None}
+            if model is Post and (tag or post_type):
+                documents = filter_posts(documents, Post, tag=tag, post_type=post_type)
+                applied.update(tag=tag, post_type=post_type)
             
-            # Apply sorting
             if sort_by == 'newest':
-                posts_query = posts_query.order_by('-created_at')
+                documents = documents.order_by('-created_at', '-id')
             elif sort_by == 'oldest':
-                posts_query = posts_query.order_by('created_at')
-            elif sort_by == 'most_votes':
-                posts_query = posts_query.annotate(
-                    vote_count=Count('votes', filter=Q(votes__value=1)) - Count('votes', filter=Q(votes__value=-1))
-                ).order_by('-vote_count')
-            elif sort_by == 'most_comments':
-                posts_query = posts_query.annotate(comment_count=Count('comments')).order_by('-comment_count')
+                documents = documents.order_by('created_at', 'id')
+            elif sort_by in sorts:
+                documents = order_by_object(documents, model, sorts[sort_by])
+            order = sort_by if sort_by in ('newest', 'oldest') or sort_by in sorts else 'relevance'
             
-            posts = posts_query
-        
-        if search_type == 'all' or search_type == 'comments':
-            comments_query = Comment.objects.filter(
-                Q(content__icontains=query) |
-                Q(author__username__icontains=query)
-            ).distinct()
-            
-            # Apply community filter if specified
-            if community_id:
-                comments_query = comments_query.filter(post__community_id=community_id)
-            
-            # Apply time range filter if specified
-            if time_range == 'day':
-                comments_query = comments_query.filter(created_at__gte=timezone.now() - timezone.timedelta(days=1))
-            elif time_range == 'week':
-                comments_query = comments_query.filter(created_at__gte=timezone.now() - timezone.timedelta(weeks=1))
-            elif time_range == 'month':
-                comments_query = comments_query.filter(created_at__gte=timezone.now() - timezone.timedelta(days=30))
-            elif time_range == 'year':
-                comments_query = comments_query.filter(created_at__gte=timezone.now() - timezone.timedelta(days=365))
-            
-            # Apply sorting
-            if sort_by == 'newest':
-                comments_query = comments_query.order_by('-created_at')
-            elif sort_by == 'oldest':
-                comments_query = comments_query.order_by('created_at')
-            elif sort_by == 'most_votes':
-                comments_query = comments_query.annotate(
-                    vote_count=Count('votes', filter=Q(votes__value=1)) - Count('votes', filter=Q(votes__value=-1))
-                ).order_by('-vote_count')
-            
-            comments = comments_query
-        
-        if search_type == 'all' or search_type == 'communities':
-            communities_query = Community.objects.filter(
-                Q(name__icontains=query) |
-                Q(description__icontains=query)
-            ).distinct()
-            
-            # Apply sorting
-            if sort_by == 'newest':
-                communities_query = communities_query.order_by('-created_at')
-            elif sort_by == 'oldest':
-                communities_query = communities_query.order_by('created_at')
-            elif sort_by == 'most_members':
-                communities_query = communities_query.annotate(member_count=Count('members')).order_by('-member_count')
-            
-            communities_results = communities_query
-        
-        if search_type == 'all' or search_type == 'users':
-            users_query = User.objects.filter(
-                Q(username__icontains=query) |
-                Q(profile__bio__icontains=query) |
-                Q(profile__display_name__icontains=query)
-            ).distinct()
-            
-            # Apply sorting
-            if sort_by == 'newest':
-                users_query = users_query.order_by('-date_joined')
-            elif sort_by == 'oldest':
-                users_query = users_query.order_by('date_joined')
-            elif sort_by == 'most_karma':
-                users_query = users_query.annotate(
-                    post_karma=Sum('post__votes__value', filter=Q(post__votes__value__gt=0), default=0),
-                    comment_karma=Sum('comment__votes__value', filter=Q(comment__votes__value__gt=0), default=0)
-                ).annotate(
-                    total_karma=F('post_karma') + F('comment_karma')
-                ).order_by('-total_karma')
-            
-            users = users_query
+            matches = cached_results(query, [model], documents, order=order, **applied)
+            # Only the objects shown on this page are loaded
+            page = Paginator(matches, SEARCH_PAGE_SIZE).get_page(request.GET.get(f'{name}_page'))
+            page.object_list = [document.object for document in load_objects(page.object_list)]
+            results[name] = page
+    
+    # Each type's page links keep the filters and the other types' pages
+    filters = {
+        'q': query, 'type': search_type, 'sort': sort_by, 'time': time_range,
+        'community': community_id, 'tag': tag, 'post_type': post_type,
+    }
+    pages = {f'{name}_page': page.number for name, page in results.items()}
+    
+    facet_groups = []
+    if query:
+        types = {name: model for name, (model, sorts, filtered) in ADVANCED_SEARCH_TYPES.items()}
+        filtered = [name for name, (model, sorts, is_filtered) in ADVANCED_SEARCH_TYPES.items() if is_filtered]
+        facets = search_facets(
+            query, types, filtered, Post, type=search_type, community=community,
+            time=time_range if since else None, tag=tag, post_type=post_type,
+        )
+        facet_groups = facet_links(facets, filters)
     
     context = {
         'search_form': search_form,
-        'posts': posts,
-        'comments': comments,
-        'communities': communities_results,
-        'users': users,
         'communities_list': communities,  # For the filter dropdown
         'query': query,
         'search_type': search_type,
         'sort_by': sort_by,
         'time_range': time_range,
         'community_id': community_id,
+        'tag': tag,
+        'post_type': post_type,
+        'facet_groups': facet_groups,
+        'type_choices': SEARCH_TYPE_CHOICES,
+        'sort_choices': ADVANCED_SORT_CHOICES,
+        'time_choices': TIME_RANGE_CHOICES,
+        'result_total': sum(page.paginator.count for page in results.values()),
+        'using_fallback': search_backend() == 'basic',
         'title': 'Advanced Search',
-        'page_type': 'advanced'
+        'page_type': 'advanced',
+        'search_mode': 'advanced',
     }
+    for name, page in results.items():
+        context[f'{name}_page'] = page
+        context[f'{name}_params'] = urlencode({
+            **filters, **{param: number for param, number in pages.items() if param != f'{name}_page'}
+        })
     
-    return render(request, 'core/search/search_page.html', context)
\ No newline at end of file
+    return render(request, 'core/search/search_page.html', context)
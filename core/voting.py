@@ -0,0 +1,191 @@
+"""
+Vote counter engine.
+
+All changes to the denormalized ``upvote_count``/``downvote_count`` columns on
+posts and comments, and to ``Post.comment_count``, go through this module.
+Deltas are applied as single ``UPDATE ... SET upvote_count = upvote_count + x``
+statements so concurrent writers never overwrite each other's increments.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .fragments import next_version
+from .karma import adjust_author_karma
+from .page_cache import purge_post_pages
+from .ranking import update_post_ranking
+
+
+def vote_deltas(old_value, new_value):
+    """
+    Return the (upvote, downvote) deltas for moving a vote from old_value to
+    new_value. Either value may be None (no vote).
+    """
+    up_delta = (new_value == 1) - (old_value == 1)
+    down_delta = (new_value == -1) - (old_value == -1)
+    return up_delta, down_delta
+
+
+def _counter_expression(field_name, delta):
+    """Build an atomic increment/decrement expression that never goes below zero"""
+    if delta < 0:
+        return Greatest(F(field_name) + delta, 0)
+    return F(field_name) + delta
+
+
+def apply_vote_delta(model, pk, up_delta, down_delta):
+    """
+    Atomically apply vote deltas to the target row of model (Post or Comment).
+    Returns the number of rows updated.
+    """
+    if not up_delta and not down_delta:
+        return 0
+
+    updates = {'updated_at': timezone.now()}
+    if up_delta:
+        updates['upvote_count'] = _counter_expression('upvote_count', up_delta)
+    if down_delta:
+        updates['downvote_count'] = _counter_expression('downvote_count', down_delta)
+
+    return model.objects.filter(pk=pk).update(**updates)
+
+
+def record_vote_change(vote, old_value, new_value):
+    """
+    Apply the counter, karma and ranking changes caused by a vote moving from
+    old_value to new_value, and purge the cached pages showing the target.
+    The in-memory target instance, if already loaded on the vote, is kept in
+    step so callers don't need to reload it.
+    """
+    up_delta, down_delta = vote_deltas(old_value, new_value)
+
+    if vote.post_id:
+        field = vote._meta.get_field('post')
+        target_id = vote.post_id
+    elif vote.comment_id:
+        field = vote._meta.get_field('comment')
+        target_id = vote.comment_id
+    else:
+        return
+
+    apply_vote_delta(field.related_model, target_id, up_delta, down_delta)
+
+    target = field.get_cached_value(vote) if field.is_cached(vote) else None
+    if target is not None:
+        target.upvote_count = max(0, target.upvote_count + up_delta)
+        target.downvote_count = max(0, target.downvote_count + down_delta)
+
+    # The target's author gains or loses the net change in score
+    adjust_author_karma(target, (new_value or 0) - (old_value or 0), model=field.related_model, pk=target_id)
+
+    if vote.post_id:
+        update_post_ranking(target_id, target)
+        purge_post_pages(target_id)
+    else:
+        post_id = target.post_id if target is not None else \
+            field.related_model.objects.filter(pk=target_id).values_list('post_id', flat=True).first()
+        if post_id is not None:
+            purge_post_pages(post_id)
+
+
+def update_comment_count(comment, delta):
+    """
+    Atomically add delta to the comment count of comment's post and
+    invalidate its cached card, keeping an already loaded post instance in step.
+    """
+    from .models import Post
+
+    now = timezone.now()
+    Post.objects.filter(pk=comment.post_id).update(
+        comment_count=_counter_expression('comment_count', delta),
+        cache_version=next_version(),
+        updated_at=now,
+    )
+
+    field = comment._meta.get_field('post')
+    if field.is_cached(comment):
+        post = field.get_cached_value(comment)
+        post.comment_count = max(0, post.comment_count + delta)
+        post.cache_version += 1
+        post.updated_at = now
+
+
+def cast_vote(user, value, post=None, comment=None, toggle=True):
+    """
+    Record user's vote on a post or comment.
+
+    If the user already voted the same way and toggle is True, the vote is
+    removed; if they voted the other way it is flipped. Returns a tuple of
+    (vote_status, vote) where vote_status is 'added', 'changed', 'removed'
+    or 'unchanged'.
+    """
+    from .models import Vote
+
+    lookup = {'user': user, 'post': post} if post is not None else {'user': user, 'comment': comment}
+
+    with transaction.atomic():
+        try:
+            # Optimistically insert; the unique constraints reject duplicates
+            with transaction.atomic():
+                vote = Vote.objects.create(value=value, **lookup)
+            return 'added', vote
+        except IntegrityError:
+            pass
+
+        vote = Vote.objects.select_for_update().get(**lookup)
+        if vote.value == value:
+            if toggle:
+                vote.delete()
+                return 'removed', vote
+            return 'unchanged', vote
+
+        vote.value = value
+        vote.save()
+        return 'changed', vote
+
+
+def get_user_votes(user, post_ids=(), comment_ids=()):
+    """
+    Look up user's votes on a batch of posts and comments.
+
+    Returns a tuple of ({post_id: value}, {comment_id: value}) using at most
+    one query per kind of target, and none for anonymous users.
+    """
+    from .models import Vote
+
+    post_votes = {}
+    comment_votes = {}
+    if not user.is_authenticated:
+        return post_votes, comment_votes
+
+    post_ids = set(post_ids)
+    if post_ids:
+        post_votes = dict(
+            Vote.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', 'value')
+        )
+
+    comment_ids = set(comment_ids)
+    if comment_ids:
+        comment_votes = dict(
+            Vote.objects.filter(user=user, comment_id__in=comment_ids).values_list('comment_id', 'value')
+        )
+
+    return post_votes, comment_votes
+
+
+def attach_user_votes(user, posts=(), comments=()):
+    """
+    Set user_vote on each post and comment from a single batched lookup.
+    Returns the ({post_id: value}, {comment_id: value}) maps for templates.
+    """
+    post_votes, comment_votes = get_user_votes(
+        user,
+        post_ids=[post.pk for post in posts],
+        comment_ids=[comment.pk for comment in comments],
+    )
+    for post in posts:
+        post.user_vote = post_votes.get(post.pk)
+    for comment in comments:
+        comment.user_vote = comment_votes.get(comment.pk)
+    return post_votes, comment_votes
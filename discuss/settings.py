@@ -76,12 +76,10 @@ INSTALLED_APPS = [
     'allauth.account',
     'allauth.socialaccount',
     'el_pagination',
-    # 'cacheops',  # Temporarily disabled due to compatibility issues
     # 'avatar',    # Replaced with native ImageField in Profile model
     'taggit',    # For adding tags to profiles and content
     'django_countries',  # For country selection in profiles
     'mptt',      # For improved hierarchical comment trees
-    'watson',    # For advanced full-text search
     'payments',   # For processing payments and donations
     'postman',    # For private messaging between users
     'django_bootstrap5',  # For responsive Bootstrap 5 integration
@@ -166,6 +164,23 @@ DATABASES = {
     )
 }
 
+# Cache
+# Shared between processes when REDIS_URL is set, otherwise per process
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -264,25 +279,29 @@ DJANGO_NOTIFICATIONS_CONFIG = {
 EL_PAGINATION_PER_PAGE = 10
 EL_PAGINATION_PAGE_OUT_OF_RANGE_404 = True
 
-# django-cacheops settings
-CACHEOPS_REDIS = {
-    'host': 'localhost',
-    'port': 6379,
-    'db': 1,
+# ORM query cache (core.query_cache). Results are stored in the cache named
+# by QUERY_CACHE_ALIAS and invalidated by any write to the tables they read.
+# That cache must be shared by all processes (Redis, see REDIS_URL); with the
+# local memory cache the query cache stays off (check core.W001).
+# ops: 'get' caches single-object lookups, 'fetch' every queryset, 'all' both.
+# manage.py query_cache_stats reports the hit rate per model.
+QUERY_CACHE_ALIAS = 'default'
+QUERY_CACHE = {
+    'core.*': {'ops': 'get', 'timeout': 60*60},
+    'auth.user': {'ops': 'get', 'timeout': 60*60},
 }
 
-CACHEOPS_DEFAULTS = {
-    'timeout': 60*60  # 1 hour cache timeout
-}
-
-CACHEOPS = {
-    # Cache all queries in core app for 1 hour
-    'core.*': {'ops': 'all', 'timeout': 60*60},
-    # Cache specific models for different durations
-    'auth.user': {'ops': {'fetch', 'get'}, 'timeout': 60*60},
-    'auth.*': {'ops': ('fetch', 'get'), 'timeout': 60*60},
-    '*.*': {'ops': (), 'timeout': 60*60},  # Disable caching for all other models
-}
+# Search index updates (core.search) are queued and written by the
+# process_search_queue worker, which must run alongside the web server; set
+# to False to index during the request instead.
+SEARCH_INDEX_QUEUE = True
+# Seconds search results are cached (core.search_cache), if the default cache
+# is shared (Redis); compare the hit rate reported by manage.py
+# search_cache_stats when changing it.
+SEARCH_CACHE_TIMEOUT = 5 * 60
+# Seconds before a process reloads its autocomplete indexes (core.autocomplete)
+# to pick up names changed by other processes
+AUTOCOMPLETE_REFRESH = 10 * 60
 
 # Custom Avatar settings (replaced django-avatar with direct ImageField)
 # Avatar images are now stored in the MEDIA_ROOT/avatars directory
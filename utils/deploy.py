@@ -56,6 +56,12 @@ def run_command(command, description=None, exit_on_error=True):
         return False
 
 
+def start_search_worker():
+    """Start the worker that writes queued changes to the search index, in the background."""
+    print("\n[+] Starting the search index worker...")
+    return subprocess.Popen([sys.executable, 'manage.py', 'process_search_queue', '--loop'])
+
+
 def collect_environment_info(mode):
     """Collect environment information for deployment."""
     env_vars = {}
@@ -171,7 +177,11 @@ def deploy_development(env_vars):
     port = DEPLOYMENT_MODES['development']['port']
     print(f"\n[+] Starting development server on port {port}...")
     print(f"[+] Access the application at http://localhost:{port}/")
-    run_command(f'python manage.py runserver 0.0.0.0:{port}')
+    worker = start_search_worker()
+    try:
+        run_command(f'python manage.py runserver 0.0.0.0:{port}')
+    finally:
+        worker.terminate()
 
 
 def deploy_production(env_vars):
@@ -210,6 +220,8 @@ capture_output = True
     print("1. Gunicorn configuration has been created.")
     print("2. To start the application with Gunicorn, run:")
     print("   gunicorn -c gunicorn.conf.py discuss.wsgi:application")
+    print("   and, alongside it, the worker that keeps the search index up to date:")
+    print("   python manage.py process_search_queue --loop")
     print("\n3. For a proper production setup, configure Nginx with this location block:")
     print("""
 server {
@@ -239,12 +251,17 @@ server {
     print("\n4. Then secure with SSL using Let's Encrypt:")
     print("   sudo certbot --nginx -d example.com -d www.example.com")
     
-    print("\n5. Consider creating a systemd service for automatic startup.")
+    print("\n5. Consider creating systemd services for Gunicorn and the search index worker")
+    print("   for automatic startup (see the README).")
     
     # Run the application with Gunicorn if requested
     run_now = input("\nDo you want to start the application with Gunicorn now? [y/N]: ").lower() == 'y'
     if run_now:
-        run_command('gunicorn -c gunicorn.conf.py discuss.wsgi:application', 'Starting Gunicorn server')
+        worker = start_search_worker()
+        try:
+            run_command('gunicorn -c gunicorn.conf.py discuss.wsgi:application', 'Starting Gunicorn server')
+        finally:
+            worker.terminate()
 
 
 def main():
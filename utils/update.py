@@ -133,6 +133,13 @@ def update_application(restart=False):
                 print("[+] Gunicorn service restarted.")
             else:
                 print("[+] Gunicorn not detected. Manual restart required.")
+        
+        # The search index worker runs the old code until restarted
+        if run_command("systemctl status discuss_search_worker", exit_on_error=False):
+            run_command("sudo systemctl restart discuss_search_worker", "Restarting the search index worker")
+            print("[+] Search index worker restarted.")
+        else:
+            print("[+] Search index worker service not detected. Restart process_search_queue manually.")
     
 
 def main():